@@ -31,11 +31,18 @@ def lambda_handler(event,context):
                     for v in versions['DeleteMarkers']:
                         objects.append({'Key':v['Key'],'VersionId': v['VersionId']})
                 if versions['IsTruncated']:
-                    versions=s3.list_object_versions(Bucket=event["ResourceProperties"]["OutputBucket"],VersionIdMarker=versions['NextVersionIdMarker'])
+                    versions=s3.list_object_versions(Bucket=event["ResourceProperties"]["OutputBucket"],KeyMarker=versions['NextKeyMarker'],VersionIdMarker=versions['NextVersionIdMarker'])
                 else:
                     versions=False
-            if objects != []:
-                s3.delete_objects(Bucket=event["ResourceProperties"]["OutputBucket"],Delete={'Objects':objects})
+            # delete_objects takes at most 1000 keys per call
+            for i in range(0, len(objects), 1000):
+                s3.delete_objects(Bucket=event["ResourceProperties"]["OutputBucket"],Delete={'Objects':objects[i:i+1000]})
+            # Delete CacheBucket contents
+            if 'CacheBucket' in event["ResourceProperties"].keys():
+                print ('Getting CacheBucket objects...')
+                for page in s3.get_paginator('list_objects_v2').paginate(Bucket=event["ResourceProperties"]["CacheBucket"]):
+                    if 'Contents' in page.keys():
+                        s3.delete_objects(Bucket=event["ResourceProperties"]["CacheBucket"],Delete={'Objects':[{'Key':key['Key']} for key in page['Contents']]})
         cfnresponse.send(event, context, cfnresponse.SUCCESS, {}, '')
     except:
         print (traceback.print_exc())
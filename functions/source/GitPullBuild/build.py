@@ -0,0 +1,166 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Build steps run by the GitPullCodeBuild project, driven by the environment variables the webhook function sets
+# on each build. Usage: python3 build.py <command>
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import lfs
+import mirror
+import package
+from gitutil import git, branch_ref, fetch_commit, enable_partial_clone
+
+logger = logging.getLogger(__name__)
+
+# Written when the archive was made with git archive --remote, there is no checkout to package afterwards
+archived_path = '/tmp/git2s3-archived.json'
+
+# Number of submodules fetched at once, the SSH connections to the same host share one master connection
+submodule_jobs = int(os.environ.get('SubmoduleJobs') or 8)
+
+
+def sparse_patterns():
+    # Sparse checkout patterns of the repository from RepoConfig, one per line, plus the directories that get their
+    # own artifact
+    patterns = ['/%s/' % d for d in package.configured_directories()]
+    patterns.extend(p for p in os.environ.get('SparsePatterns', '').splitlines() if p.strip())
+    return patterns
+
+
+def update_submodules(directory):
+    update = ['-C', directory, 'submodule', 'update', '--init', '--recursive', '--jobs=%d' % submodule_jobs]
+    try:
+        git(*(update + ['--depth=1']))
+    except subprocess.CalledProcessError:
+        # Remotes that do not allow fetching a commit by id can only serve it with the history of its branch
+        logger.info('Could not fetch the submodules with --depth=1, fetching their history')
+        # The shallow clones of the first attempt would be reused and still miss the commit
+        git('-C', directory, 'submodule', 'deinit', '-q', '--force', '--all')
+        shutil.rmtree(os.path.join(directory, git('-C', directory, 'rev-parse', '--git-dir'), 'modules'),
+                      ignore_errors=True)
+        git(*update)
+
+
+def archive_remote(url):
+    try:
+        commit, message = package.package_remote()
+    except package.ArchiveUnavailable as e:
+        logger.info('Not packaging %s from git archive --remote (%s), cloning instead' % (url, e))
+        return False
+    with open(archived_path, 'w') as f:
+        json.dump({'id': commit, 'message': message}, f)
+    return True
+
+
+def checkout(directory='.'):
+    url = os.environ['GitUrl']
+    branch = os.environ['Branch']
+    ref = branch_ref(branch)
+    if package.remote_archive_eligible() and archive_remote(url):
+        return
+    clone_filter = os.environ.get('CloneFilter', '')
+    # Commit the webhook reported, empty for events without one
+    head_sha = os.environ.get('HeadSha', '')
+    source = url
+    # A partial clone fetches missing blobs from its remote when they are needed, which the mirror cannot serve
+    cache = None if clone_filter else mirror.from_environment()
+    if cache is not None:
+        cache.restore(url)
+        cache.fetch(url, ref, head_sha=head_sha)
+        source = 'file://' + cache.path
+    git('init', '-q', directory)
+    git('-C', directory, 'remote', 'add', 'origin', url)
+    lfs_cache = lfs.from_environment()
+    if lfs_cache is not None:
+        # The checkout writes the pointer files, the objects are fetched afterwards in one go
+        git('-C', directory, 'lfs', 'install', '--local', '--skip-smudge')
+    # Protocol v2 lets the remote skip advertising all of its branches and tags
+    fetch = ['-c', 'protocol.version=2', '-C', directory, 'fetch', '-q', '--depth=1', '--no-tags']
+    if clone_filter:
+        # The blobs the checkout needs are fetched from origin afterwards
+        enable_partial_clone(['-C', directory], clone_filter)
+        fetch.append('--filter=' + clone_filter)
+        source = 'origin'
+    patterns = sparse_patterns()
+    if patterns:
+        # Only the matching paths are written to the working tree, and with a filter only their blobs are fetched
+        git('-C', directory, 'config', 'core.sparseCheckout', 'true')
+        info = os.path.join(directory, '.git', 'info')
+        os.makedirs(info, exist_ok=True)
+        with open(os.path.join(info, 'sparse-checkout'), 'w') as sparse:
+            sparse.write(''.join(p + '\n' for p in patterns))
+    if cache is not None:
+        # The mirror already holds the commit under ref
+        head_sha = ''
+    if ref.startswith('refs/tags/'):
+        fetch_commit(fetch, source, ref, ref, head_sha)
+        git('-C', directory, 'checkout', '-q', ref)
+    else:
+        tracking = 'refs/remotes/origin/' + branch
+        fetch_commit(fetch, source, ref, tracking, head_sha)
+        git('-C', directory, 'checkout', '-q', '-B', branch, tracking)
+        git('-C', directory, 'branch', '-q', '--set-upstream-to=origin/' + branch)
+    if os.environ.get('Submodules') == 'True':
+        update_submodules(directory)
+    if lfs_cache is not None:
+        lfs_cache.pull(directory)
+
+
+def package_checkout():
+    if os.path.exists(archived_path):
+        logger.info('Already packaged from the remote archive')
+        return None
+    return package.package()
+
+
+def commit_info():
+    if os.path.exists(archived_path):
+        with open(archived_path) as f:
+            info = json.load(f)
+        return info['id'][:7], info['message']
+    commit = git('rev-parse', 'HEAD')
+    return commit[:7], package.commit_message(commit, '.')
+
+
+def print_commit_id():
+    print(commit_info()[0])
+
+
+def print_commit_message():
+    print(commit_info()[1])
+
+
+def save_mirror():
+    cache = mirror.from_environment()
+    if cache is not None:
+        cache.save(os.environ['GitUrl'])
+
+
+commands = {
+    'checkout': checkout,
+    'package': package_checkout,
+    'save-mirror': save_mirror,
+    'commit-id': print_commit_id,
+    'commit-message': print_commit_message
+}
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s][%(levelname)s] %(message)s')
+    logging.getLogger('botocore').setLevel(logging.ERROR)
+    if len(argv) != 2 or argv[1] not in commands:
+        sys.exit('Usage: %s {%s}' % (argv[0], '|'.join(sorted(commands))))
+    commands[argv[1]]()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,89 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Exploded output: every file of the checkout becomes its own object under the tree prefix, next to a manifest with
+# the SHA-256 of each file. A build compares the checkout with the previous manifest, uploads only the files that
+# are new or changed, deletes the files that were removed and then replaces the manifest. The manifest is the
+# artifact the guards of package.py look at, so it carries the build-seq and commit-sha metadata.
+
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+manifest_suffix = '.manifest.json'
+
+# Number of files hashed and uploaded at once, also the size of the S3 connection pool
+max_workers = int(os.environ.get('UploadWorkers') or 16)
+
+# Each upload runs on a worker of the pool above, the transfer manager should not start threads of its own
+transfer_config = TransferConfig(use_threads=False)
+
+
+def tree_prefix(manifest_key):
+    return manifest_key[:-len(manifest_suffix)] + '/'
+
+
+def hash_file(opener):
+    digest = hashlib.sha256()
+    with opener() as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(s3, bucket, key):
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except ClientError:
+        return {}
+    return json.loads(body.decode('utf-8')).get('files', {})
+
+
+def upload(s3, opener, bucket, key, digest):
+    extra_args = {'ContentType': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                  'Metadata': {'sha256': digest}}
+    with opener() as source:
+        s3.upload_fileobj(source, bucket, key, ExtraArgs=extra_args, Config=transfer_config)
+
+
+def delete(s3, bucket, keys):
+    for i in range(0, len(keys), 1000):
+        response = s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': k} for k in keys[i:i + 1000]],
+                                                            'Quiet': True})
+        if response.get('Errors'):
+            raise Exception('Could not delete %s' % ', '.join(e['Key'] for e in response['Errors']))
+
+
+def publish(s3, bucket, key, entries, metadata):
+    # entries are the (name, mode, size, opener) tuples of the files to publish, opener may be called from any thread
+    prefix = tree_prefix(key)
+    previous = load_manifest(s3, bucket, key)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = list(executor.map(hash_file, [opener for name, mode, size, opener in entries]))
+        files = {}
+        changed = []
+        for (name, mode, size, opener), digest in zip(entries, digests):
+            files[name] = {'sha256': digest, 'size': size}
+            if previous.get(name, {}).get('sha256') != digest:
+                changed.append((opener, prefix + name, digest))
+        # list() re-raises the first failed upload
+        list(executor.map(lambda c: upload(s3, c[0], bucket, c[1], c[2]), changed))
+    removed = sorted(prefix + name for name in previous if name not in files)
+    delete(s3, bucket, removed)
+    manifest = {'commit': metadata.get('commit-sha'), 'prefix': prefix, 'files': files}
+    response = s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(manifest, sort_keys=True).encode('utf-8'),
+                             ContentType='application/json', Metadata=metadata)
+    logger.info('Uploaded %d of %d files to s3://%s/%s and deleted %d' % (len(changed), len(files), bucket, prefix,
+                                                                          len(removed)))
+    return response
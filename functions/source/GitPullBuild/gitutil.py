@@ -0,0 +1,101 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import logging
+import shutil
+import subprocess
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def git(*args, **kwargs):
+    logger.info('git %s' % ' '.join(args))
+    return subprocess.check_output(('git',) + args, **kwargs).decode('utf-8').strip()
+
+
+def branch_ref(branch):
+    # The webhook function passes branch names as [name] and tag names as "tags/[name]"
+    if branch.startswith('tags/'):
+        return 'refs/tags/' + branch[len('tags/'):]
+    return 'refs/heads/' + branch
+
+
+def fetch_commit(fetch_args, source, ref, target, head_sha=''):
+    # Fetches the pushed commit itself into target, so a branch that moved on after the push does not change what is
+    # built. Remotes that do not allow fetching a commit by id get ref instead. Returns what was fetched
+    if head_sha.strip('0'):
+        try:
+            git(*(fetch_args + [source, '+%s:%s' % (head_sha, target)]))
+            return head_sha
+        except subprocess.CalledProcessError:
+            logger.info('Could not fetch commit %s, fetching %s instead' % (head_sha, ref))
+    git(*(fetch_args + [source, '+%s:%s' % (ref, target)]))
+    return ref
+
+
+def enable_partial_clone(git_args, clone_filter):
+    # Same settings as "git clone --filter", missing objects are fetched from origin when they are needed
+    for name, value in (('core.repositoryformatversion', '1'), ('extensions.partialClone', 'origin'),
+                        ('remote.origin.promisor', 'true'), ('remote.origin.partialCloneFilter', clone_filter)):
+        git(*(git_args + ['config', name, value]))
+
+
+def remote_commit_message(url, ref):
+    # Fetches the commit object alone, without its trees and blobs
+    scratch = tempfile.mkdtemp()
+    try:
+        git('init', '-q', '--bare', scratch)
+        git('--git-dir=' + scratch, 'remote', 'add', 'origin', url)
+        enable_partial_clone(['--git-dir=' + scratch], 'tree:0')
+        git('--git-dir=' + scratch, 'fetch', '-q', '--depth=1', '--no-tags', '--filter=tree:0', 'origin', ref)
+        return git('--git-dir=' + scratch, 'log', '-1', '--pretty=%B', 'FETCH_HEAD')
+    except subprocess.CalledProcessError:
+        logger.warning('Could not fetch the commit message of %s' % ref)
+        return ''
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def remote_head(url, ref):
+    # Commit ref points to on the remote, tags are peeled. None when the remote could not be asked
+    try:
+        output = git('ls-remote', url, ref, ref + '^{}')
+    except subprocess.CalledProcessError:
+        logger.warning('Could not list %s on the remote' % ref)
+        return None
+    heads = {}
+    for line in output.splitlines():
+        sha, _, name = line.partition('\t')
+        heads[name] = sha
+    return heads.get(ref + '^{}') or heads.get(ref)
+
+
+def commit_order(url, ref, commit, other, depth=100):
+    # -1 when commit is an ancestor of other, 1 when other is an ancestor of commit, 0 when neither is found within
+    # depth commits of the other. Only commit objects are fetched, into a scratch repository
+    scratch = tempfile.mkdtemp()
+    try:
+        git('init', '-q', '--bare', scratch)
+        git('--git-dir=' + scratch, 'remote', 'add', 'origin', url)
+        enable_partial_clone(['--git-dir=' + scratch], 'tree:0')
+        fetch = ['--git-dir=' + scratch, 'fetch', '-q', '--no-tags', '--depth=%d' % depth, '--filter=tree:0', 'origin']
+        try:
+            git(*(fetch + [commit, other]))
+        except subprocess.CalledProcessError:
+            # Remotes that do not allow fetching commits by id serve the history of the branch
+            git(*(fetch + [ref]))
+        for ancestor, descendant, order in ((commit, other, -1), (other, commit, 1)):
+            if subprocess.call(['git', '--git-dir=' + scratch, 'merge-base', '--is-ancestor', ancestor, descendant],
+                               stderr=subprocess.DEVNULL) == 0:
+                return order
+        return 0
+    except subprocess.CalledProcessError:
+        logger.warning('Could not fetch the history of %s' % ref)
+        return 0
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
@@ -0,0 +1,100 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Git LFS objects cached in the cache bucket under their SHA-256 object id. The checkout leaves LFS pointer files in
+# place, the objects the cache holds are copied into the local LFS store, git lfs pull downloads only the rest from
+# the Git service and replaces the pointers, and the newly downloaded objects are added to the cache.
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from gitutil import git
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LfsCache(object):
+    def __init__(self, bucket, prefix='lfs/', max_workers=16, s3=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_workers = max_workers
+        self.s3 = s3 or boto3.client('s3', config=Config(max_pool_connections=max_workers))
+
+    def key_for(self, oid):
+        return self.prefix + oid
+
+    def object_ids(self, directory):
+        # Object ids of the LFS files in the checkout, "git lfs ls-files -l" prints "<oid> <*|-> <path>"
+        oids = set()
+        for line in git('-C', directory, 'lfs', 'ls-files', '-l').splitlines():
+            if line.strip():
+                oids.add(line.split(' ', 1)[0])
+        return sorted(oids)
+
+    def object_path(self, git_dir, oid):
+        # Location of the object in the local LFS store, where git lfs pull looks before downloading it
+        return os.path.join(git_dir, 'lfs', 'objects', oid[0:2], oid[2:4], oid)
+
+    def restore_object(self, oid, path):
+        if os.path.exists(path):
+            return True
+        if not self.bucket:
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + '.download'
+        try:
+            self.s3.download_file(self.bucket, self.key_for(oid), partial)
+        except ClientError:
+            return False
+        # The key is the content hash, anything else in its place is not used
+        if file_sha256(partial) != oid:
+            logger.warning('Cached LFS object %s does not match its id, ignoring it' % oid)
+            os.remove(partial)
+            return False
+        os.rename(partial, path)
+        return True
+
+    def save_object(self, oid, path):
+        if self.bucket and os.path.exists(path):
+            self.s3.upload_file(path, self.bucket, self.key_for(oid))
+            return True
+        return False
+
+    def pull(self, directory):
+        oids = self.object_ids(directory)
+        if not oids:
+            return 0
+        git_dir = os.path.join(directory, git('-C', directory, 'rev-parse', '--git-dir'))
+        paths = [self.object_path(git_dir, oid) for oid in oids]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            cached = list(executor.map(self.restore_object, oids, paths))
+            # Objects already in the local store are not downloaded again
+            git('-C', directory, 'lfs', 'pull')
+            missing = [(oid, path) for oid, path, hit in zip(oids, paths, cached) if not hit]
+            saved = list(executor.map(lambda m: self.save_object(*m), missing))
+        logger.info('%d of %d LFS objects came from the cache, %d were added to it' % (sum(cached), len(oids),
+                                                                                      sum(saved)))
+        return len(oids)
+
+
+def from_environment():
+    # Lfs is set per repository in RepoConfig, objects are only cached when the stack has a cache bucket
+    if os.environ.get('Lfs') != 'True':
+        return None
+    return LfsCache(os.environ.get('CacheBucket'))
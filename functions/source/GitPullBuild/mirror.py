@@ -0,0 +1,115 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Persistent bare mirrors of the source repositories, stored as tar files in the cache bucket and keyed by the remote
+# URL. A build restores the mirror, fetches only the objects it is missing from the remote, checks out from the
+# mirror and writes the mirror back when the fetch changed it. The oldest mirrors are evicted when the cache grows
+# past its size limit.
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import boto3
+from botocore.exceptions import ClientError
+from gitutil import git, fetch_commit
+
+logger = logging.getLogger(__name__)
+
+
+class MirrorCache(object):
+    def __init__(self, bucket, limit, prefix='mirrors/', path='/tmp/git2s3-cache/mirror.git', s3=None):
+        self.bucket = bucket
+        # Size limit of the whole cache in bytes
+        self.limit = limit
+        self.prefix = prefix
+        self.path = path
+        self.archive = path + '.tar'
+        self.marker = path + '.changed'
+        self.s3 = s3 or boto3.client('s3')
+
+    def key_for(self, url):
+        return self.prefix + hashlib.sha256(url.encode('utf-8')).hexdigest() + '.tar'
+
+    def restore(self, url):
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            self.s3.download_file(self.bucket, self.key_for(url), self.archive)
+        except ClientError as e:
+            logger.info('No mirror of %s in the cache (%s), starting a new one' % (url, e.response['Error']['Code']))
+            git('init', '-q', '--bare', self.path)
+            return False
+        os.makedirs(self.path)
+        subprocess.check_call(['tar', '-xf', self.archive, '-C', self.path])
+        os.remove(self.archive)
+        return True
+
+    def fetch(self, url, ref, depth=1, head_sha=''):
+        # Fetches ref, or the commit head_sha when the remote allows it, from the remote into the mirror, the objects
+        # the mirror already has are not transferred
+        before = self.resolve(ref)
+        args = ['-c', 'protocol.version=2', '--git-dir=%s' % self.path, 'fetch', '--no-tags']
+        if depth:
+            args.append('--depth=%d' % depth)
+        fetch_commit(args, url, ref, ref, head_sha)
+        after = self.resolve(ref)
+        if before != after:
+            open(self.marker, 'w').close()
+        return after
+
+    def resolve(self, ref):
+        try:
+            return git('--git-dir=%s' % self.path, 'rev-parse', '--verify', '-q', ref, stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            return None
+
+    def save(self, url):
+        if not os.path.exists(self.marker):
+            logger.info('Mirror of %s is unchanged' % url)
+            return False
+        # Drop the objects of commits that are no longer reachable from the fetched refs
+        git('--git-dir=%s' % self.path, 'gc', '--auto', '--quiet')
+        subprocess.check_call(['tar', '-cf', self.archive, '-C', self.path, '.'])
+        size = os.path.getsize(self.archive)
+        if size > self.limit:
+            logger.info('Mirror of %s is %d bytes, larger than the cache, not saving it' % (url, size))
+            return False
+        self.s3.upload_file(self.archive, self.bucket, self.key_for(url))
+        os.remove(self.archive)
+        os.remove(self.marker)
+        self.evict(keep=self.key_for(url))
+        return True
+
+    def evict(self, keep=None):
+        # Deletes the least recently written mirrors until the cache fits in its size limit
+        mirrors = []
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix):
+            mirrors.extend(page.get('Contents', []))
+        total = sum(m['Size'] for m in mirrors)
+        evicted = []
+        for m in sorted(mirrors, key=lambda m: m['LastModified']):
+            if total <= self.limit:
+                break
+            if m['Key'] == keep:
+                continue
+            evicted.append({'Key': m['Key']})
+            total -= m['Size']
+        for i in range(0, len(evicted), 1000):
+            self.s3.delete_objects(Bucket=self.bucket, Delete={'Objects': evicted[i:i + 1000]})
+        if evicted:
+            logger.info('Evicted %d mirrors from the cache' % len(evicted))
+        return evicted
+
+
+def from_environment():
+    # MirrorCacheSize is the cache size limit in MB, 0 disables the mirror cache
+    limit = int(os.environ.get('MirrorCacheSize') or 0) * 1024 * 1024
+    if not limit or not os.environ.get('CacheBucket'):
+        return None
+    return MirrorCache(os.environ['CacheBucket'], limit)
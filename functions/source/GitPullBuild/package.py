@@ -0,0 +1,365 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Packages the checked out repository as a zip, tar.gz or tar.zst archive (ArchiveFormat) and streams it straight into
+# the output bucket, no archive file is written to disk. Archives are reproducible: entries are written in sorted path
+# order with a fixed timestamp and with the permissions recorded in git, so the same tree always produces the same
+# bytes. The exploded format uploads the files one by one instead, see exploded.py.
+
+import fnmatch
+import gzip
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import tarfile
+import tempfile
+from functools import partial
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import exploded
+from gitutil import git, branch_ref, remote_commit_message, remote_head, commit_order
+from parallelzip import ParallelZipWriter
+from s3upload import MultipartUploadStream
+
+logger = logging.getLogger(__name__)
+
+# Same pattern as the former "zip -r -x '*.git*'", which also leaves out .gitignore, .github and similar paths
+exclude_git_pattern = '*.git*'
+
+# Changes whenever a change to this module changes the bytes it writes for a given tree
+packager_version = '3'
+
+content_types = {'zip': 'application/zip', 'tar.gz': 'application/gzip', 'tar.zst': 'application/zstd'}
+
+suffixes = {'zip': '.zip', 'tar.gz': '.tar.gz', 'tar.zst': '.tar.zst', 'exploded': exploded.manifest_suffix}
+
+# Written next to each artifact, <artifact key without its suffix><commit_suffix>
+commit_suffix = '.commit.json'
+
+# Current commit of each branch on the remote, asked once per build
+tips = {}
+
+
+def git_modes(root):
+    # File modes recorded in the index of the checkout, keyed by path
+    modes = {}
+    args = ['-C', root, 'ls-files', '-s', '-z']
+    if os.environ.get('Submodules') == 'True':
+        # Files of checked out submodules are listed with their path in the superproject
+        args.append('--recurse-submodules')
+    for entry in git(*args).split('\0'):
+        if entry:
+            info, path = entry.split('\t', 1)
+            modes[path] = int(info.split()[0], 8)
+    return modes
+
+
+def list_entries(root, exclude_git):
+    # Returns (path, archive name, is directory) for the directories and files under root, sorted by archive name
+    entries = []
+    for directory, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(directory, name)
+            arcname = os.path.relpath(path, root).replace(os.sep, '/')
+            if exclude_git and fnmatch.fnmatch(arcname, exclude_git_pattern):
+                continue
+            if not os.path.exists(path):
+                logger.warning('Skipping dangling symbolic link %s' % arcname)
+                continue
+            entries.append((path, arcname, os.path.isdir(path)))
+    entries.sort(key=lambda e: e[1])
+    return entries
+
+
+def file_mode(git_mode):
+    return 0o100755 if git_mode == 0o100755 else 0o100644
+
+
+def tree_entries(root, exclude_git):
+    # Archive entries of the checkout: (archive name, mode, size, function opening the file), size and opener are
+    # None for directories
+    modes = git_modes(root)
+    for path, arcname, is_dir in list_entries(root, exclude_git):
+        if is_dir:
+            yield arcname, 0o40755, None, None
+        else:
+            yield arcname, file_mode(modes.get(arcname)), os.path.getsize(path), partial(open, path, 'rb')
+
+
+def write_zip(stream, entries, max_workers=None):
+    with ParallelZipWriter(stream, max_workers=max_workers) as archive:
+        for arcname, mode, size, opener in entries:
+            if opener is None:
+                archive.add_directory(arcname)
+                continue
+            with opener() as source:
+                archive.add_file(source, arcname, mode, size)
+
+
+def write_tar(stream, entries):
+    with tarfile.open(fileobj=stream, mode='w|', format=tarfile.PAX_FORMAT) as archive:
+        for arcname, mode, size, opener in entries:
+            # Owner, group and timestamp are left at 0 so the archive only depends on the tree
+            info = tarfile.TarInfo(arcname)
+            info.mode = mode & 0o777
+            if opener is None:
+                info.type = tarfile.DIRTYPE
+                archive.addfile(info)
+                continue
+            info.size = size
+            with opener() as source:
+                archive.addfile(info, source)
+
+
+def write_tar_gz(stream, entries):
+    # No file name and a 0 timestamp in the gzip header, tarfile's own gzip stream records the current time
+    with gzip.GzipFile(filename='', mode='wb', fileobj=stream, mtime=0) as compressed:
+        write_tar(compressed, entries)
+
+
+def write_tar_zst(stream, entries):
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception('tar.zst archives need the zstandard module, install it with "pip3 install zstandard"')
+    # With at least one worker thread the output does not depend on the number of threads
+    compressed = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(stream)
+    write_tar(compressed, entries)
+    compressed.flush(zstandard.FLUSH_FRAME)
+
+
+writers = {'zip': write_zip, 'tar.gz': write_tar_gz, 'tar.zst': write_tar_zst}
+
+
+def artifact_metadata(s3, bucket, key):
+    try:
+        return s3.head_object(Bucket=bucket, Key=key)['Metadata']
+    except ClientError:
+        return {}
+
+
+def exported_metadata(s3, bucket, key, archive_format):
+    # A build that skipped the upload of an unchanged tree only rewrote the commit file, which then names the newer
+    # push the artifact stands for
+    existing = artifact_metadata(s3, bucket, key)
+    info = artifact_metadata(s3, bucket, key[:-len(suffixes[archive_format])] + commit_suffix)
+    if artifact_seq(info) > artifact_seq(existing):
+        return dict(existing, **{'build-seq': info['build-seq'], 'commit-sha': info.get('commit-sha', '')})
+    return existing
+
+
+def artifact_seq(metadata):
+    # Sequence number of the build that wrote the current artifact, 0 when there is none
+    value = metadata.get('build-seq', '0')
+    return int(value) if value.isdigit() else 0
+
+
+def newer_exported(existing, commit, seq):
+    # True when the artifact with metadata existing holds a newer push to the branch than commit, built as seq. The
+    # branch decides where it can: its current tip is always written and never replaced by another commit, and of two
+    # commits that are not the tip, an ancestor is older than its descendant. Otherwise the sequence numbers decide,
+    # which order pushes by the time their webhook was received
+    exported = existing.get('commit-sha')
+    if exported and exported != commit:
+        url = os.environ['GitUrl']
+        ref = branch_ref(os.environ['Branch'])
+        if ref not in tips:
+            tips[ref] = remote_head(url, ref)
+        if tips[ref] == commit:
+            return False
+        if tips[ref] == exported:
+            return True
+        order = commit_order(url, ref, commit, exported)
+        if order:
+            return order < 0
+    return artifact_seq(existing) > seq
+
+
+def configured_directories():
+    # Subdirectories that each get their own artifact, set per repository in RepoConfig
+    return [d for d in os.environ.get('Directories', '').split(',') if d]
+
+
+def packager_signature(archive_format):
+    # The archive of a tree also depends on the sparse checkout patterns and on whether submodules and LFS files
+    # were fetched, a change to them must not be skipped
+    signature = '%s-%s' % (archive_format, packager_version)
+    for setting, flag in (('Submodules', 'sub'), ('Lfs', 'lfs')):
+        if os.environ.get(setting) == 'True':
+            signature += '-' + flag
+    patterns = os.environ.get('SparsePatterns', '').strip()
+    if patterns:
+        signature += '-' + hashlib.sha256(patterns.encode('utf-8')).hexdigest()[:12]
+    return signature
+
+
+def commit_message(commit, root=None):
+    # The webhook passes the message of the pushed commit, the message of any other commit is read from the checkout
+    # in root or, without a checkout, fetched from the remote branch it was archived from
+    if commit == os.environ.get('HeadSha') and os.environ.get('CommitMessage'):
+        return os.environ['CommitMessage']
+    if root is not None:
+        return git('-C', root, 'log', '-1', '--pretty=%B', commit)
+    return remote_commit_message(os.environ['GitUrl'], branch_ref(os.environ['Branch']))
+
+
+def put_commit_info(s3, bucket, key, archive_format, metadata, message):
+    # Commit of the artifact, readable without downloading it and without non-ASCII characters in object metadata
+    info = {'commit': metadata['commit-sha'], 'message': message, 'branch': os.environ.get('Branch'),
+            'build-seq': int(metadata['build-seq'])}
+    s3.put_object(Bucket=bucket, Key=key[:-len(suffixes[archive_format])] + commit_suffix,
+                  Body=json.dumps(info, sort_keys=True).encode('utf-8'), ContentType='application/json',
+                  Metadata={'build-seq': metadata['build-seq'], 'commit-sha': metadata['commit-sha']})
+
+
+def package_tree(s3, root, bucket, key, metadata, tree_sha, exclude_git, archive_format, message):
+    existing = exported_metadata(s3, bucket, key, archive_format)
+    # Never replace an artifact written by a build of a newer push to this branch
+    if newer_exported(existing, metadata['commit-sha'], int(metadata['build-seq'])):
+        logger.info('s3://%s/%s holds a newer push, skipping upload' % (bucket, key))
+        return None
+    metadata = dict(metadata)
+    if tree_sha:
+        # Without a .git directory the archive only depends on the tree, an unchanged tree gives identical bytes
+        metadata['tree-sha'] = tree_sha
+        metadata['packager'] = packager_signature(archive_format)
+        if existing.get('tree-sha') == metadata['tree-sha'] and existing.get('packager') == metadata['packager']:
+            logger.info('s3://%s/%s already holds tree %s, skipping upload' % (bucket, key, metadata['tree-sha']))
+            # The artifact also is the one of the new commit
+            put_commit_info(s3, bucket, key, archive_format, metadata, message)
+            return None
+    entries = tree_entries(root, exclude_git)
+    if archive_format == 'exploded':
+        response = exploded.publish(s3, bucket, key, [e for e in entries if e[3] is not None], metadata)
+    else:
+        stream = MultipartUploadStream(s3, bucket, key, ContentType=content_types[archive_format], Metadata=metadata)
+        with stream:
+            writers[archive_format](stream, entries)
+        logger.info('Archive SHA-256 is %s' % stream.sha256.hexdigest())
+        response = stream.response
+    put_commit_info(s3, bucket, key, archive_format, metadata, message)
+    return response
+
+
+class ArchiveUnavailable(Exception):
+    pass
+
+
+def remote_archive_eligible():
+    # The remote archive is the plain tree of the commit, it has no .git directory, subdirectories or sparse patterns,
+    # and holds neither the files of submodules nor the content of LFS files
+    return (os.environ.get('exclude_git') == 'True' and (os.environ.get('ArchiveFormat') or 'zip') != 'exploded'
+            and not configured_directories() and not os.environ.get('SparsePatterns', '').strip()
+            and os.environ.get('Submodules') != 'True' and os.environ.get('Lfs') != 'True')
+
+
+def remote_entries(tar, member):
+    while member is not None:
+        name = member.name.rstrip('/')
+        if os.path.basename(name) == '.gitattributes' and member.isfile():
+            attributes = tar.extractfile(member).read()
+            if b'export-ignore' in attributes or b'export-subst' in attributes:
+                # git archive leaves out or rewrites files that a checkout packages as they are
+                raise ArchiveUnavailable('%s sets export attributes' % name)
+        if not fnmatch.fnmatch(name, exclude_git_pattern):
+            if member.isdir():
+                yield name, 0o40755, None, None
+            elif member.isfile():
+                yield name, 0o100755 if member.mode & 0o100 else 0o100644, member.size, partial(tar.extractfile, member)
+            else:
+                # A checkout packages the file a symbolic link points to, which the archive does not hold
+                raise ArchiveUnavailable('%s is not a regular file' % name)
+        member = tar.next()
+
+
+def package_remote():
+    # Fast path for archives without the .git directory: the remote builds a tar of the tree with git archive and it
+    # is repackaged on the fly, nothing is cloned or written to disk. Raises ArchiveUnavailable when the remote does
+    # not serve git archive, before anything was uploaded. Returns the archived commit and its message
+    s3 = boto3.client('s3')
+    bucket = os.environ['outputbucket']
+    key = os.environ['outputbucketpath'] + os.environ['outputbucketkey']
+    seq = int(os.environ.get('BuildSeq') or 0)
+    archive_format = os.environ.get('ArchiveFormat') or 'zip'
+    errors = tempfile.TemporaryFile()
+    process = subprocess.Popen(['git', 'archive', '--format=tar', '--remote=' + os.environ['GitUrl'],
+                                branch_ref(os.environ['Branch'])], stdout=subprocess.PIPE, stderr=errors)
+    try:
+        try:
+            tar = tarfile.open(fileobj=process.stdout, mode='r|')
+            first = tar.next()
+        except tarfile.ReadError:
+            first = None
+        if first is None:
+            process.wait()
+            errors.seek(0)
+            raise ArchiveUnavailable(errors.read().decode('utf-8', 'replace').strip() or
+                                     'git archive exited with %d' % process.returncode)
+        # git archive records the commit id in the pax global header
+        commit = tar.pax_headers.get('comment', '')
+        head_sha = os.environ.get('HeadSha', '')
+        if head_sha.strip('0') and commit != head_sha:
+            # Remotes do not archive a commit by id, a clone can fetch the pushed commit itself
+            raise ArchiveUnavailable('%s moved on to %s' % (os.environ['Branch'], commit))
+        message = commit_message(commit)
+        existing = exported_metadata(s3, bucket, key, archive_format)
+        if newer_exported(existing, commit, seq):
+            logger.info('s3://%s/%s holds a newer push, skipping upload' % (bucket, key))
+            return commit, message
+        # Entries come in tree order rather than sorted, so the bytes can differ from an archive of a checkout
+        metadata = {'build-seq': '%d' % seq, 'commit-sha': commit,
+                    'packager': '%s-%s-archive' % (archive_format, packager_version)}
+        if existing.get('commit-sha') == commit and existing.get('packager') in (metadata['packager'],
+                                                                                packager_signature(archive_format)):
+            logger.info('s3://%s/%s already holds commit %s, skipping upload' % (bucket, key, commit))
+            put_commit_info(s3, bucket, key, archive_format, metadata, message)
+            return commit, message
+        stream = MultipartUploadStream(s3, bucket, key, ContentType=content_types[archive_format], Metadata=metadata)
+        with stream:
+            writers[archive_format](stream, remote_entries(tar, first))
+            if process.wait() != 0:
+                raise Exception('git archive exited with %d' % process.returncode)
+        logger.info('Archive SHA-256 is %s' % stream.sha256.hexdigest())
+        put_commit_info(s3, bucket, key, archive_format, metadata, message)
+        return commit, message
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        errors.close()
+
+
+def package(root='.'):
+    s3 = boto3.client('s3', config=Config(max_pool_connections=exploded.max_workers))
+    bucket = os.environ['outputbucket']
+    exclude_git = os.environ.get('exclude_git') == 'True'
+    archive_format = os.environ.get('ArchiveFormat') or 'zip'
+    # commit-sha lets the webhook function skip builds of a commit that is already exported
+    metadata = {'build-seq': '%d' % int(os.environ.get('BuildSeq') or 0),
+                'commit-sha': git('-C', root, 'rev-parse', 'HEAD')}
+    message = commit_message(metadata['commit-sha'], root)
+    directories = configured_directories()
+    if not directories:
+        key = os.environ['outputbucketpath'] + os.environ['outputbucketkey']
+        tree_sha = git('-C', root, 'rev-parse', 'HEAD^{tree}') if exclude_git else None
+        return package_tree(s3, root, bucket, key, metadata, tree_sha, exclude_git, archive_format, message)
+    # One artifact per directory, <directory><suffix> under the output path. Subdirectories never hold the .git
+    # directory, so an artifact whose directory did not change is not uploaded again
+    responses = []
+    for directory in directories:
+        try:
+            tree_sha = git('-C', root, 'rev-parse', '--verify', '-q', 'HEAD:%s' % directory)
+        except subprocess.CalledProcessError:
+            logger.warning('%s does not exist in this commit, no artifact is written for it' % directory)
+            continue
+        key = os.environ['outputbucketpath'] + directory + suffixes[archive_format]
+        responses.append(package_tree(s3, os.path.join(root, directory), bucket, key, metadata, tree_sha,
+                                      exclude_git, archive_format, message))
+    return responses
@@ -0,0 +1,250 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Zip writer that deflates on all cores. Files are split into blocks that are compressed in a thread pool (zlib
+# releases the GIL) and written to the stream in the order they were added. Blocks of the same file are deflated
+# with the end of the previous block as preset dictionary and end on a sync flush, so they concatenate into a single
+# deflate stream, the same way pigz does. The output only depends on the entries added, not on the number of workers.
+# Deflated files larger than one block are written with a data descriptor, so the stream does not need to be seekable.
+# Stored files are read twice instead, once for their CRC, because Java's ZipInputStream only reads stored entries
+# whose local header holds their sizes.
+
+import os
+import struct
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+
+stored = 0
+deflated = 8
+
+# 1980-01-01 00:00:00 in MS-DOS date and time format
+dos_date = (1 << 5) | 1
+dos_time = 0
+
+# Extensions of files that are already compressed and are stored as is
+stored_extensions = frozenset([
+    '.7z', '.br', '.bz2', '.ear', '.gif', '.gz', '.jar', '.jpeg', '.jpg', '.lz4', '.mp3', '.mp4', '.png', '.tgz',
+    '.war', '.webp', '.whl', '.woff', '.woff2', '.xz', '.zip', '.zst'])
+
+zip64_limit = 0xFFFFFFFF
+# Streamed files from this size on are written in zip64 format, deflate can make incompressible data slightly larger
+zip64_threshold = 0xF0000000
+window_size = 32 * 1024
+
+
+def is_compressed(name):
+    return os.path.splitext(name)[1].lower() in stored_extensions
+
+
+def deflate(data, level, zdict=None, last=True):
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def rewindable(source):
+    try:
+        return source.seekable()
+    except AttributeError:
+        # Members of a tar file that is read as a stream
+        return False
+
+
+def compress_whole(data, level, store):
+    # Files that do not get smaller are stored, the same as zipfile and Info-ZIP do
+    crc = zlib.crc32(data)
+    if not store:
+        compressed = deflate(data, level)
+        if len(compressed) < len(data):
+            return deflated, crc, len(data), compressed
+    return stored, crc, len(data), data
+
+
+class Entry(object):
+    def __init__(self, name, external_attr, method=stored, offset=0):
+        self.name = name.encode('utf-8')
+        self.flags = 0 if name.isascii() else 0x800
+        self.external_attr = external_attr
+        self.method = method
+        self.offset = offset
+        self.crc = 0
+        self.compressed_size = 0
+        self.file_size = 0
+        self.zip64 = False
+
+    def zip64_extra(self):
+        fields = [v for v in (self.file_size, self.compressed_size, self.offset) if v >= zip64_limit]
+        if not fields:
+            return b''
+        return struct.pack('<HH', 1, 8 * len(fields)) + struct.pack('<%dQ' % len(fields), *fields)
+
+    def local_header(self):
+        if self.zip64:
+            # With a data descriptor the sizes follow the data, the zip64 extra field makes it use 8 byte sizes
+            extra = struct.pack('<HHQQ', 1, 16, self.file_size, self.compressed_size)
+            return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45, self.flags, self.method, dos_time, dos_date,
+                               self.crc, zip64_limit, zip64_limit, len(self.name), len(extra)) + self.name + extra
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, self.flags, self.method, dos_time, dos_date, self.crc,
+                           self.compressed_size, self.file_size, len(self.name), 0) + self.name
+
+    def data_descriptor(self):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.compressed_size, self.file_size)
+        return struct.pack('<IIII', 0x08074b50, self.crc, self.compressed_size, self.file_size)
+
+    def central_header(self):
+        extra = self.zip64_extra()
+        version = 45 if extra or self.zip64 else 20
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, self.flags, self.method,
+                           dos_time, dos_date, self.crc, min(self.compressed_size, zip64_limit),
+                           min(self.file_size, zip64_limit), len(self.name), len(extra), 0, 0, 0,
+                           self.external_attr, min(self.offset, zip64_limit)) + self.name + extra
+
+
+class ParallelZipWriter(object):
+    def __init__(self, stream, max_workers=None, level=6, block_size=1024 * 1024):
+        self.stream = stream
+        self.level = level
+        self.block_size = block_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # Pieces waiting to be written, in archive order. Bounding it bounds the memory used by blocks in flight
+        self.pending = deque()
+        self.window = self.max_workers * 4
+        self.entries = []
+        self.current = None
+        self.offset = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.offset += len(data)
+
+    def add_directory(self, name, mode=0o40755):
+        self.queue('directory', Entry(name.rstrip('/') + '/', (mode << 16) | 0x10))
+
+    def add_file(self, source, name, mode=0o100644, size=0):
+        # Reads the file object source to its end, size only decides whether the entry needs the zip64 format
+        store = is_compressed(name)
+        entry = Entry(name, mode << 16, stored if store else deflated)
+        block = source.read(self.block_size)
+        following = source.read(self.block_size)
+        if not following:
+            self.queue('file', entry, self.executor.submit(compress_whole, block, self.level, store))
+            return
+        if store:
+            self.add_stored(entry, source, [block, following])
+            return
+        entry.zip64 = size >= zip64_threshold
+        entry.flags |= 0x08
+        self.queue('begin', entry)
+        zdict = None
+        while True:
+            last = not following
+            self.queue('block', block, self.executor.submit(deflate, block, self.level, zdict, last))
+            zdict = block[-window_size:]
+            if last:
+                break
+            block, following = following, source.read(self.block_size)
+        self.queue('end', entry)
+
+    def add_stored(self, entry, source, blocks):
+        # blocks were already read from source. The first pass computes the CRC, the second one reads the file again
+        # from its start, or from a copy spooled to disk when source can not seek
+        spool = None if rewindable(source) else tempfile.TemporaryFile()
+        start = None if spool else source.tell() - sum(len(b) for b in blocks)
+        try:
+            for block in chain(blocks, iter(partial(source.read, self.block_size), b'')):
+                entry.crc = zlib.crc32(block, entry.crc)
+                entry.file_size += len(block)
+                if spool:
+                    spool.write(block)
+            entry.compressed_size = entry.file_size
+            entry.zip64 = entry.file_size >= zip64_limit
+            if spool:
+                spool.seek(0)
+                source = spool
+            else:
+                source.seek(start)
+            self.queue('begin', entry)
+            for block in iter(partial(source.read, self.block_size), b''):
+                self.queue('block', block, None)
+            self.queue('end', entry)
+        finally:
+            if spool:
+                spool.close()
+
+    def queue(self, kind, *args):
+        self.pending.append((kind,) + args)
+        while len(self.pending) > self.window:
+            self.write_next()
+
+    def write_next(self):
+        piece = self.pending.popleft()
+        kind = piece[0]
+        if kind == 'directory':
+            entry = piece[1]
+            entry.offset = self.offset
+            self.write(entry.local_header())
+            self.entries.append(entry)
+        elif kind == 'file':
+            entry = piece[1]
+            entry.method, entry.crc, entry.file_size, data = piece[2].result()
+            entry.compressed_size = len(data)
+            entry.offset = self.offset
+            self.write(entry.local_header())
+            self.write(data)
+            self.entries.append(entry)
+        elif kind == 'begin':
+            self.current = piece[1]
+            self.current.offset = self.offset
+            self.write(self.current.local_header())
+        elif kind == 'block':
+            data = piece[1] if piece[2] is None else piece[2].result()
+            if self.current.flags & 0x08:
+                self.current.crc = zlib.crc32(piece[1], self.current.crc)
+                self.current.file_size += len(piece[1])
+                self.current.compressed_size += len(data)
+            self.write(data)
+        elif kind == 'end':
+            if self.current.flags & 0x08:
+                self.write(self.current.data_descriptor())
+            self.entries.append(self.current)
+            self.current = None
+
+    def close(self):
+        try:
+            while self.pending:
+                self.write_next()
+        finally:
+            self.executor.shutdown(wait=True)
+        start = self.offset
+        for entry in self.entries:
+            self.write(entry.central_header())
+        size = self.offset - start
+        count = len(self.entries)
+        if count >= 0xFFFF or size >= zip64_limit or start >= zip64_limit:
+            end64 = self.offset
+            self.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0, count, count, size, start))
+            self.write(struct.pack('<IIQI', 0x07064b50, 0, end64, 1))
+        self.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                               min(size, zip64_limit), min(start, zip64_limit), 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=True)
+        return False
@@ -0,0 +1,127 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Write-only file object that streams into an S3 multipart upload. Parts are uploaded from a thread pool while the
+# caller keeps writing, and writes block once max_workers parts are in flight, so memory stays bounded by about
+# (max_workers + 1) * part_size. Objects smaller than one part are sent with a single PutObject.
+
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# S3 requires every part but the last to be at least 5 MiB
+min_part_size = 5 * 1024 * 1024
+
+
+class MultipartUploadStream(object):
+    def __init__(self, s3, bucket, key, part_size=16 * 1024 * 1024, max_workers=4, **extra_args):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, min_part_size)
+        self.extra_args = extra_args
+        self.buffer = bytearray()
+        self.position = 0
+        self.sha256 = hashlib.sha256()
+        self.upload_id = None
+        self.parts = []
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = threading.BoundedSemaphore(max_workers)
+        self.closed = False
+        self.response = None
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        self.sha256.update(data)
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self.submit(part)
+        return len(data)
+
+    def submit(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                             **self.extra_args)['UploadId']
+        # Fail fast instead of compressing the rest of the archive when a part upload failed
+        for number, future in self.parts:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        number = len(self.parts) + 1
+        # Blocks until one of the parts in flight has been uploaded
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self.upload_part, number, data)
+        except Exception:
+            self.slots.release()
+            raise
+        self.parts.append((number, future))
+
+    def upload_part(self, number, data):
+        try:
+            response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=data)
+            return {'PartNumber': number, 'ETag': response['ETag']}
+        finally:
+            self.slots.release()
+
+    def close(self):
+        if self.closed:
+            return self.response
+        self.closed = True
+        try:
+            if self.upload_id is None:
+                self.response = self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer),
+                                                   **self.extra_args)
+            else:
+                if self.buffer:
+                    self.submit(bytes(self.buffer))
+                parts = [future.result() for number, future in self.parts]
+                self.response = self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                                  UploadId=self.upload_id,
+                                                                  MultipartUpload={'Parts': parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.buffer = bytearray()
+            self.executor.shutdown(wait=True)
+        logger.info('Uploaded %d bytes to s3://%s/%s in %d parts' % (self.position, self.bucket, self.key, max(1, len(self.parts))))
+        return self.response
+
+    def abort(self):
+        self.closed = True
+        self.executor.shutdown(wait=True)
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            logger.info('Aborted the upload to s3://%s/%s' % (self.bucket, self.key))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
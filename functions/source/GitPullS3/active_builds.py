@@ -0,0 +1,91 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Tracks the active build of each output path (repository and branch). A build is only stopped when the webhook
+# payloads show that the other push moved the branch on from its commit, webhooks are not always delivered in the
+# order of the pushes. Otherwise both builds run: before replacing an artifact, each build compares its commit with
+# the one of the artifact on the branch history and only falls back to BuildSeq, the time the webhook was received,
+# when the history cannot tell them apart.
+
+import logging
+import time
+
+logger = logging.getLogger()
+
+# Active build records expire after the longest a build can queue and run
+active_ttl = 2 * 60 * 60
+
+# Weight of the latest build in the average build duration of a repository
+duration_weight = 0.3
+duration_ttl = 30 * 24 * 60 * 60
+
+
+def next_seq():
+    # Milliseconds since the epoch at the time the webhook was handled
+    return int(time.time() * 1000)
+
+
+def stop(codebuild_client, build_id):
+    try:
+        codebuild_client.stop_build(id=build_id)
+        logger.info('Stopped superseded build %s' % build_id)
+    except Exception as e:
+        # The build most likely finished already
+        logger.info('Could not stop build %s: %s' % (build_id, e))
+
+
+def supersedes(newer, older):
+    # True when the push of newer moved the branch from the commit older built
+    return bool(newer.get('base_sha')) and newer['base_sha'] == older.get('head_sha')
+
+
+def track(store, codebuild_client, path, build_id, seq, repo=None, head_sha=None, base_sha=None, attempts=5):
+    # Records build_id as the active build for path and stops the previous or the new build when the other one
+    # superseded it
+    pushed = {'head_sha': head_sha, 'base_sha': base_sha}
+    for _ in range(attempts):
+        current = store.get('active', path)
+        if current is not None and supersedes(current, pushed):
+            stop(codebuild_client, build_id)
+            return False
+        item = dict(pushed, build_id=build_id, seq=seq, repo=repo, started=int(time.time()))
+        if current is None:
+            recorded = store.put('active', path, item, ttl=active_ttl, if_absent=True)
+        else:
+            recorded = store.put('active', path, item, ttl=active_ttl, expected={'build_id': current['build_id']})
+        if recorded:
+            if current is not None and supersedes(pushed, current):
+                stop(codebuild_client, current['build_id'])
+            elif current is not None:
+                logger.info('Builds %s and %s of %s both run, the build of the later commit exports it' %
+                            (current['build_id'], build_id, path))
+            return True
+    logger.info('Could not record build %s as the active build of %s' % (build_id, path))
+    return True
+
+
+def average_duration(store, repo):
+    item = store.get('durations', repo) if repo else None
+    return item['average'] if item else None
+
+
+def record_duration(store, repo, duration):
+    average = average_duration(store, repo)
+    if average is not None:
+        duration = int(average + duration_weight * (duration - average))
+    store.put('durations', repo, {'average': duration}, ttl=duration_ttl)
+
+
+def finish(store, path, build_id, succeeded=False, duration=None):
+    # duration is the run time of the build in seconds, when it is not given it is taken from the start of the build
+    current = store.get('active', path)
+    if not store.delete('active', path, expected={'build_id': build_id}):
+        return
+    if succeeded and current is not None and current.get('repo'):
+        if duration is None:
+            duration = int(time.time()) - current['started']
+        record_duration(store, current['repo'], duration)
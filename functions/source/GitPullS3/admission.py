@@ -0,0 +1,185 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Admission control in front of builds.start_build. At most MaxConcurrentBuilds builds run at once, each holds one of
+# that many slots in the store until build_events releases it. Pushes that find no free slot, or whose build could
+# not be started because CodeBuild kept throttling, wait in the backlog, which keeps the newest push per repository
+# and branch. The backlog is drained whenever a build finishes and on a schedule, in the order of the priority
+# classes of priority.py and, within a class, oldest push first. A push whose build fails to start for any other
+# reason is dropped from the backlog, so it does not hold up the pushes behind it. With a coalescing window every push
+# waits in the backlog until no newer push to its branch arrived for that long, so a burst of pushes builds once.
+# Such pushes are started by the scheduled drain, the webhook function does not wait for the window to pass.
+
+import logging
+import os
+import random
+import time
+import builds
+import dedup
+import metrics
+import priority
+import webhooks
+
+logger = logging.getLogger()
+
+# 0 leaves the number of concurrent builds to CodeBuild
+max_builds = int(os.environ.get('MaxConcurrentBuilds') or 0)
+
+# Slots of builds whose completion event was lost are freed after the longest a build can queue and run
+slot_ttl = 2 * 60 * 60
+
+# Pushes that waited this long are dropped from the backlog
+backlog_ttl = 24 * 60 * 60
+
+# Seconds a push waits in the backlog for a newer push to the same branch, 0 disables coalescing
+coalesce_window = int(os.environ.get('CoalesceSeconds') or 0)
+
+# Error codes of start_build calls that are retried, with exponential backoff and full jitter
+throttling_codes = ('ThrottlingException', 'TooManyRequestsException', 'RequestLimitExceeded',
+                    'AccountLimitExceededException')
+attempts = 5
+base_delay = 0.5
+max_delay = 8
+
+
+def error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def acquire(store, path, seq):
+    # Returns the key of the slot taken, '' when there is no limit, None when all slots are taken
+    if not max_builds:
+        return ''
+    taken = set(key for key, item in store.list('slots'))
+    for i in range(max_builds):
+        key = 'slot-%d' % i
+        if key not in taken and store.put('slots', key, {'path': path, 'seq': seq}, ttl=slot_ttl, if_absent=True):
+            return key
+    return None
+
+
+def release(store, slot, build_id=None):
+    if slot:
+        store.delete('slots', slot, expected={'build_id': build_id} if build_id else None)
+
+
+def start_with_backoff(push, keybucket, outputbucket, seq, store, slot):
+    for attempt in range(attempts):
+        try:
+            return builds.start_build(push, keybucket, outputbucket, seq, store, slot)
+        except Exception as e:
+            if error_code(e) not in throttling_codes or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.info('start_build was throttled (%s), retrying in %.1f seconds' % (error_code(e), delay))
+            time.sleep(delay)
+
+
+def start(store, push, keybucket, outputbucket, seq, slot):
+    # Starts the build in slot and records its id there, so only its completion frees the slot
+    try:
+        build_id = start_with_backoff(push, keybucket, outputbucket, seq, store, slot)
+    except Exception:
+        release(store, slot)
+        raise
+    if slot:
+        store.put('slots', slot, {'path': push.output_path, 'seq': seq, 'build_id': build_id}, ttl=slot_ttl,
+                  expected={'seq': seq})
+    return build_id
+
+
+def defer(store, push, keybucket, outputbucket, seq, queued=None, retries=5, ttl=None, delay=0):
+    # Adds the push to the backlog unless a newer push to the same branch is already waiting there. ttl is the
+    # number of seconds it may wait, backlog_ttl when not given, and it is not started in the first delay seconds
+    ttl = ttl or backlog_ttl
+    priority_class, position = priority.classify(push)
+    item = {'push': push.to_dict(), 'key-bucket': keybucket, 'output-bucket': outputbucket, 'seq': seq,
+            'queued': queued or int(time.time()), 'class': priority_class, 'position': position}
+    if delay:
+        item['not_before'] = int(time.time()) + delay
+    path = push.output_path
+    for _ in range(retries):
+        current = store.get('backlog', path)
+        if current is not None and int(current['seq']) >= seq:
+            logger.info('A newer push to %s is already in the backlog' % path)
+            return False
+        if current is None:
+            recorded = store.put('backlog', path, item, ttl=ttl, if_absent=True)
+        else:
+            recorded = store.put('backlog', path, item, ttl=ttl, expected={'seq': current['seq']})
+        if recorded:
+            logger.info('Added %s on branch %s to the build backlog as %s' % (push.repo_name, push.branch_name,
+                                                                              priority_class))
+            metrics.put_metric('BuildsDeferred', Class=priority_class)
+            return True
+    raise Exception('Could not add %s to the build backlog' % path)
+
+
+def submit(store, push, keybucket, outputbucket, seq):
+    # Starts the build when a slot is free and no older push is waiting, otherwise defers it. Returns the build id,
+    # or None when the push was deferred
+    slot = None
+    if not (max_builds and store.list('backlog')):
+        slot = acquire(store, push.output_path, seq)
+    if slot is None:
+        defer(store, push, keybucket, outputbucket, seq)
+        drain(store)
+        return None
+    try:
+        build_id = start(store, push, keybucket, outputbucket, seq, slot)
+    except Exception as e:
+        if error_code(e) not in throttling_codes:
+            raise
+        logger.info('CodeBuild is still throttling, deferring the build of %s' % push.output_path)
+        defer(store, push, keybucket, outputbucket, seq)
+        return None
+    metrics.put_metric('QueueLatency', 0, unit='Seconds', Class=priority.classify(push)[0])
+    return build_id
+
+
+def backlog_order(items, timestamp):
+    # Highest priority first, a push moves up one class for every priority.aging seconds it waited
+    # Items deferred before priority classes existed have no position
+    return sorted(items, key=lambda entry: (priority.rank(entry[1].get('position', 0),
+                                                          timestamp - entry[1]['queued']), entry[1]['seq']))
+
+
+def drain(store):
+    # Starts waiting pushes while slots are free, returns the number of builds started
+    started = 0
+    timestamp = int(time.time())
+    for path, item in backlog_order(store.list('backlog'), timestamp):
+        if item.get('not_before', 0) > timestamp:
+            continue
+        slot = acquire(store, path, item['seq'])
+        if slot is None:
+            break
+        # Taking the item out first means a concurrent drain cannot start it too
+        if not store.delete('backlog', path, expected={'seq': item['seq']}):
+            release(store, slot)
+            continue
+        push = webhooks.PushRecord.from_dict(item['push'])
+        try:
+            start(store, push, item['key-bucket'], item['output-bucket'], int(item['seq']), slot)
+        except Exception as e:
+            if error_code(e) in throttling_codes:
+                # Waits for the next drain, without extending the time it may wait
+                remaining = item.get('expires', int(time.time()) + backlog_ttl) - int(time.time())
+                if remaining > 0:
+                    logger.info('CodeBuild is still throttling, %s stays in the backlog' % path)
+                    defer(store, push, item['key-bucket'], item['output-bucket'], int(item['seq']), item['queued'],
+                          ttl=remaining)
+                    break
+            logger.error('Could not start the build of %s from the backlog, dropping it: %s' % (path, e))
+            metrics.put_metric('BuildsDropped', Class=item.get('class', priority.other))
+            # A redelivery of the webhook may start another build
+            dedup.release_commit(store, path, push.head_sha)
+            continue
+        metrics.put_metric('QueueLatency', int(time.time()) - item['queued'], unit='Seconds',
+                           Class=item.get('class', priority.other))
+        started += 1
+    return started
@@ -0,0 +1,42 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Source IP allowlist. The comma-separated CIDR list from the allowed-ips stage variable is parsed once per
+# container into sorted, non-overlapping integer intervals per IP version, so a lookup is a single binary search.
+
+from bisect import bisect_right
+from ipaddress import ip_network, ip_address, collapse_addresses
+
+
+class AllowList(object):
+    def __init__(self, ranges):
+        networks = [ip_network(u'%s' % r.strip()) for r in ranges.split(',') if r.strip()]
+        self.intervals = {}
+        for version in (4, 6):
+            starts = []
+            ends = []
+            # collapse_addresses merges overlapping and adjacent ranges and yields them in ascending order
+            for net in collapse_addresses([n for n in networks if n.version == version]):
+                starts.append(int(net.network_address))
+                ends.append(int(net.broadcast_address))
+            self.intervals[version] = (starts, ends)
+
+    def __contains__(self, address):
+        ip = ip_address(u'%s' % address)
+        starts, ends = self.intervals[ip.version]
+        i = bisect_right(starts, int(ip)) - 1
+        return i >= 0 and int(ip) <= ends[i]
+
+
+# Parsed allowlists keyed by the raw stage-variable string, kept for the lifetime of the container
+allowlists = {}
+
+
+def get_allowlist(ranges):
+    if ranges not in allowlists:
+        allowlists[ranges] = AllowList(ranges)
+    return allowlists[ranges]
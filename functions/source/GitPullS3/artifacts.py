@@ -0,0 +1,101 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Exported artifacts carry the commit they were built from in their commit-sha metadata. Before starting a build the
+# webhook function compares the pushed commit with it, so a commit that is already exported is not built again.
+# When another branch or tag of the repository already holds the commit, its artifact is copied instead of built.
+
+import json
+import logging
+import time
+import clients
+import repo_config
+
+# How long, in seconds, the commit of an artifact is cached in the container. The cached commit only saves the HEAD
+# request when it differs from the pushed one, a build is never skipped on a cached commit
+head_ttl = 30
+
+# How long the artifact of an exported commit is remembered for copies to other paths
+export_ttl = 7 * 24 * 3600
+
+# Written next to each artifact by the build
+commit_suffix = '.commit.json'
+
+heads = {}
+
+logger = logging.getLogger()
+
+
+def cached_commit(bucket, key):
+    # Returns (True, commit) while the commit of the artifact is cached, (False, None) otherwise
+    cached = heads.get((bucket, key))
+    if cached is not None and cached[0] > time.time():
+        return True, cached[1]
+    return False, None
+
+
+def exported_commit(bucket, key):
+    s3 = clients.get_client('s3')
+    try:
+        metadata = s3.head_object(Bucket=bucket, Key=key)['Metadata']
+    except s3.exceptions.ClientError:
+        metadata = {}
+    commit = metadata.get('commit-sha')
+    heads[(bucket, key)] = (time.time() + head_ttl, commit)
+    return commit
+
+
+def is_exported(bucket, key, head_sha):
+    if not head_sha:
+        return False
+    cached, commit = cached_commit(bucket, key)
+    if cached and commit != head_sha:
+        # At worst the artifact was replaced by head_sha since, and it is built once more
+        return False
+    return exported_commit(bucket, key) == head_sha
+
+
+def export_key(git_url, head_sha):
+    return '%s %s' % (git_url, head_sha)
+
+
+def record_export(store, git_url, head_sha, bucket, key):
+    # Called when a build of head_sha succeeded, the artifact at key can then be copied to other paths
+    if git_url and head_sha:
+        store.put('exported', export_key(git_url, head_sha), {'bucket': bucket, 'key': key}, ttl=export_ttl)
+
+
+def copy_export(store, push, bucket, key, seq):
+    # Copies the artifact of the pushed commit from another path of the repository to key, as a build would write it.
+    # Only a path without an artifact is written, an existing one is left to the build and its ordering checks.
+    # Returns True when the artifact was copied
+    source = store.get('exported', export_key(push.remote_url, push.head_sha)) if push.head_sha else None
+    if source is None or source['bucket'] != bucket or source['key'] == key or exported_commit(bucket, key):
+        return False
+    suffix = repo_config.formats[repo_config.get_config(push.full_name)['format']][0]
+    if not source['key'].endswith(suffix):
+        return False
+    s3 = clients.get_client('s3')
+    try:
+        head = s3.head_object(Bucket=bucket, Key=source['key'])
+        if head['Metadata'].get('commit-sha') != push.head_sha:
+            # Replaced by a newer commit of its own branch since
+            return False
+        info = json.loads(s3.get_object(Bucket=bucket, Key=source['key'][:-len(suffix)] + commit_suffix)['Body'].read())
+        metadata = dict(head['Metadata'], **{'build-seq': '%d' % seq})
+        s3.copy_object(Bucket=bucket, Key=key, CopySource={'Bucket': bucket, 'Key': source['key']}, Metadata=metadata,
+                       MetadataDirective='REPLACE', ContentType=head.get('ContentType') or 'application/octet-stream')
+        info.update({'branch': push.branch_name, 'build-seq': seq})
+        s3.put_object(Bucket=bucket, Key=key[:-len(suffix)] + commit_suffix,
+                      Body=json.dumps(info, sort_keys=True).encode('utf-8'), ContentType='application/json',
+                      Metadata={'build-seq': metadata['build-seq'], 'commit-sha': push.head_sha})
+    except s3.exceptions.ClientError as e:
+        logger.info('Could not copy s3://%s/%s, building %s instead: %s' % (bucket, source['key'], push.head_sha, e))
+        return False
+    heads[(bucket, key)] = (time.time() + head_ttl, push.head_sha)
+    logger.info('Copied the artifact of commit %s from s3://%s/%s' % (push.head_sha, bucket, source['key']))
+    return True
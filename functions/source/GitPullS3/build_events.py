@@ -0,0 +1,102 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Completion handler for the GitPullCodeBuild project. It is invoked by an EventBridge rule on
+# "CodeBuild Build State Change" events, so the webhook function can return as soon as the build is started, and
+# every minute by a schedule that runs build_poller.
+
+import json
+import logging
+import active_builds
+import admission
+import artifacts
+import build_poller
+import dedup
+import state
+
+# Final build states, any other state means the build is still running
+terminal_states = ('SUCCEEDED', 'FAILED', 'FAULT', 'STOPPED', 'TIMED_OUT')
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.handlers[0].setFormatter(logging.Formatter('[%(asctime)s][%(levelname)s] %(message)s'))
+
+
+def get_variables(variables):
+    return dict((v['name'], v.get('value', '')) for v in variables or [])
+
+
+def build_record(build_id, status, environment, exported):
+    return {
+        'build_id': build_id,
+        'status': status,
+        'git_url': environment.get('GitUrl'),
+        'branch': environment.get('Branch'),
+        'output_bucket': environment.get('outputbucket'),
+        'output_path': environment.get('outputbucketpath'),
+        'output_key': environment.get('outputbucketkey'),
+        'head_sha': environment.get('HeadSha'),
+        'slot': environment.get('AdmissionSlot'),
+        # A single archive of the tree, the same for every branch and tag that points to the commit
+        'copyable': (environment.get('exclude_git') == 'True' and not environment.get('Directories') and
+                     environment.get('ArchiveFormat') != 'exploded'),
+        # Builds that failed before exporting the commit fall back to the one the webhook reported
+        'commit_id': exported.get('GIT_COMMIT_ID') or environment.get('HeadSha'),
+        'commit_message': exported.get('GIT_COMMIT_MSG') or environment.get('CommitMessage')
+    }
+
+
+def build_id_of(arn):
+    # State-change events name the build by its ARN, start_build and batch_get_builds by <project>:<uuid>
+    return arn.split(':build/', 1)[-1]
+
+
+def event_record(detail):
+    info = detail.get('additional-information', {})
+    return build_record(build_id_of(detail['build-id']), detail['build-status'],
+                        get_variables(info.get('environment', {}).get('environment-variables')),
+                        get_variables(info.get('exported-environment-variables')))
+
+
+def build_info_record(build):
+    # Same record from a build returned by batch_get_builds
+    return build_record(build['id'], build['buildStatus'],
+                        get_variables(build.get('environment', {}).get('environmentVariables')),
+                        get_variables(build.get('exportedEnvironmentVariables')))
+
+
+def complete(store, record, duration=None):
+    active_builds.finish(store, record['output_path'], record['build_id'], record['status'] == 'SUCCEEDED', duration)
+    admission.release(store, record['slot'], record['build_id'])
+    if record['status'] == 'SUCCEEDED':
+        logger.info('Build %s exported commit %s to s3://%s/%s' % (record['build_id'], record['commit_id'], record['output_bucket'], record['output_path']))
+        if record['copyable']:
+            artifacts.record_export(store, record['git_url'], record['head_sha'], record['output_bucket'],
+                                    record['output_path'] + record['output_key'])
+    else:
+        logger.error('Build %s for %s on branch %s finished with status %s' % (record['build_id'], record['git_url'], record['branch'], record['status']))
+        # Let a redelivery of the webhook start another build for this commit
+        dedup.release_commit(store, record['output_path'], record['head_sha'])
+    print(json.dumps(record))
+    return record
+
+
+def lambda_handler(event, context):
+    store = state.get_store()
+    if event.get('detail-type') == 'Scheduled Event':
+        # Completes the builds whose completion event was missed and starts builds that were deferred while none
+        # was running
+        polled = build_poller.poll(store, lambda build, duration: complete(store, build_info_record(build), duration))
+        return {'polled': polled, 'started': admission.drain(store)}
+    detail = event['detail']
+    if detail['build-status'] not in terminal_states:
+        logger.info('Ignoring %s event for build %s' % (detail['build-status'], detail['build-id']))
+        return None
+    record = complete(store, event_record(detail))
+    # The slot is free, start the next deferred push
+    admission.drain(store)
+    return record
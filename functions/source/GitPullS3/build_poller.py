@@ -0,0 +1,83 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Scheduled status check of the builds in flight, the ones active_builds records. Build completion normally arrives
+# as a CodeBuild event, this looks the active builds up with batch_get_builds, 100 ids per call, records the phase of
+# the running ones and completes the ones whose event was missed. A build is only looked up when it is due: queued
+# builds every minute, running builds at half the time they are expected to still need, judged by the average
+# duration of the previous builds of the repository. Builds that hold an admission slot without being the active
+# build of their branch, such as superseded builds that were stopped, are looked up every time, so their slot is
+# freed as soon as they finish.
+
+import logging
+import time
+import active_builds
+import admission
+import clients
+import metrics
+
+logger = logging.getLogger()
+
+# Most build ids batch_get_builds accepts in one call
+batch_size = 100
+
+# Bounds of the time between two lookups of a running build, the schedule runs every minute
+min_interval = 60
+max_interval = 600
+
+waiting_phases = ('SUBMITTED', 'QUEUED', 'PROVISIONING')
+
+
+def next_interval(build, average, timestamp):
+    if average is None or build.get('currentPhase') in waiting_phases or 'startTime' not in build:
+        return min_interval
+    remaining = average - (timestamp - build['startTime'].timestamp())
+    return int(max(min_interval, min(max_interval, remaining / 2)))
+
+
+def run_time(build):
+    if 'startTime' in build and 'endTime' in build:
+        return int((build['endTime'] - build['startTime']).total_seconds())
+    return None
+
+
+def poll(store, complete):
+    # complete(build, duration) is called for each build that finished, returns the number of builds looked up
+    timestamp = int(time.time())
+    active = store.list('active')
+    due = dict((item['build_id'], (path, item)) for path, item in active if item.get('next_poll', 0) <= timestamp)
+    tracked = set(item['build_id'] for path, item in active)
+    holders = dict((item['build_id'], key) for key, item in store.list('slots') if item.get('build_id'))
+    build_ids = sorted(set(due) | set(holders) - tracked)
+    if not build_ids:
+        return 0
+    client = clients.get_client('codebuild')
+    phases = {}
+    for i in range(0, len(build_ids), batch_size):
+        response = client.batch_get_builds(ids=build_ids[i:i + batch_size])
+        for build in response['builds']:
+            if build['buildStatus'] != 'IN_PROGRESS':
+                logger.info('Build %s finished with status %s without a completion event' % (build['id'],
+                                                                                             build['buildStatus']))
+                complete(build, run_time(build))
+                continue
+            phase = build.get('currentPhase', 'UNKNOWN')
+            phases[phase] = phases.get(phase, 0) + 1
+            if build['id'] in due:
+                path, item = due[build['id']]
+                interval = next_interval(build, active_builds.average_duration(store, item.get('repo')), timestamp)
+                store.put('active', path, dict(item, phase=phase, next_poll=timestamp + interval),
+                          expected={'build_id': build['id']})
+        for build_id in response.get('buildsNotFound', []):
+            if build_id in due:
+                store.delete('active', due[build_id][0], expected={'build_id': build_id})
+            admission.release(store, holders.get(build_id), build_id)
+    for phase, count in sorted(phases.items()):
+        metrics.put_metric('BuildsInFlight', count, Phase=phase)
+    logger.info('Looked up %d builds, %s' % (len(build_ids), ', '.join('%d %s' % (c, p) for p, c in
+                                                                        sorted(phases.items())) or 'none running'))
+    return len(build_ids)
@@ -0,0 +1,143 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Starts GitPullCodeBuild builds, shared by the webhook function and the queue consumer.
+
+import os
+import logging
+import active_builds
+import clients
+import repo_config
+
+# If true the function will not include .git folder in the zip
+exclude_git = os.environ['ExcludeGit'].lower() in ('y', 'yes', 't', 'true', 'on', '1')
+
+key = 'enc_key'
+
+# Longer commit messages are not passed to the build, which then reads the message from the commit itself
+max_message_length = 1024
+
+logger = logging.getLogger()
+
+
+def artifact_name(push):
+    suffix = repo_config.formats[repo_config.get_config(push.full_name)['format']][0]
+    return '%s' % (push.repo_name.replace('/', '_')) + suffix
+
+
+def commit_message(push):
+    message = push.head_message or ''
+    return message if len(message) <= max_message_length else ''
+
+
+def start_build(push, keybucket, outputbucket, seq, store, slot=''):
+    branch_name = push.branch_name
+    remote_url = push.remote_url
+    config = repo_config.get_config(push.full_name)
+    codebuild_client = clients.get_client('codebuild')
+    new_build = codebuild_client.start_build(projectName=os.getenv('GitPullCodeBuild'),
+                                environmentVariablesOverride=[
+                                    {
+                                        'name': 'GitUrl',
+                                        'value': remote_url,
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'Branch',
+                                        'value': branch_name,
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'KeyBucket',
+                                        'value': keybucket,
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'KeyObject',
+                                        'value': key,
+                                        'type': 'PLAINTEXT'
+                                    },
+
+                                    {
+                                        'name': 'outputbucket',
+                                        'value': outputbucket,
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'outputbucketkey',
+                                        'value': artifact_name(push),
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'outputbucketpath',
+                                        'value': push.output_path,
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'exclude_git',
+                                        'value': '%s' % (exclude_git),
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'ArchiveFormat',
+                                        'value': config['format'],
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'Directories',
+                                        'value': ','.join(config['directories']),
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'SparsePatterns',
+                                        'value': '\n'.join(config['sparse']),
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'CloneFilter',
+                                        'value': config['filter'],
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'Submodules',
+                                        'value': '%s' % config['submodules'],
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'Lfs',
+                                        'value': '%s' % config['lfs'],
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'HeadSha',
+                                        'value': push.head_sha or '',
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'CommitMessage',
+                                        'value': commit_message(push),
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'BuildSeq',
+                                        'value': '%d' % seq,
+                                        'type': 'PLAINTEXT'
+                                    },
+                                    {
+                                        'name': 'AdmissionSlot',
+                                        'value': slot,
+                                        'type': 'PLAINTEXT'
+                                    }
+                                ])
+    buildId = new_build['build']['id']
+    # Completion (commit id, message and final status) is recorded by build_events.lambda_handler, which is
+    # triggered by the CodeBuild state-change event, so there is no need to keep this function waiting
+    logger.info('CodeBuild Build Id is %s' % (buildId))
+    # Stop the build of an older push to this branch that is still running
+    active_builds.track(store, codebuild_client, push.output_path, buildId, seq, repo=push.repo_name,
+                        head_sha=push.head_sha, base_sha=push.base_sha)
+    return buildId
@@ -0,0 +1,18 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Lazily created boto3 clients. boto3 is only imported when the first client is needed, and each client is kept
+# for the lifetime of the container so warm invocations reuse its connection pool.
+
+clients = {}
+
+
+def get_client(service_name):
+    if service_name not in clients:
+        from boto3 import client
+        clients[service_name] = client(service_name)
+    return clients[service_name]
@@ -0,0 +1,61 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Webhook deduplication. A delivery id that was already seen does not start another build, nor does a push of the
+# head commit that was last claimed for its repository and branch.
+
+import os
+
+# How long delivery ids and commits are remembered
+dedup_ttl = int(os.environ.get('DedupSeconds', '3600'))
+
+
+def claim_delivery(store, push):
+    if not push.delivery_id:
+        return True
+    return store.put('delivery', '%s:%s' % (push.provider, push.delivery_id), {'path': push.output_path},
+                     ttl=dedup_ttl, if_absent=True)
+
+
+def claim_commit(store, push, attempts=5):
+    # Only the latest claimed commit of each branch is remembered, so a push that moves the branch back to a commit
+    # built earlier is not taken for a duplicate
+    if not push.head_sha:
+        return True
+    for _ in range(attempts):
+        current = store.get('commit', push.output_path)
+        if current is not None and current['sha'] == push.head_sha:
+            return False
+        item = {'sha': push.head_sha}
+        if current is None:
+            claimed = store.put('commit', push.output_path, item, ttl=dedup_ttl, if_absent=True)
+        else:
+            claimed = store.put('commit', push.output_path, item, ttl=dedup_ttl, expected={'sha': current['sha']})
+        if claimed:
+            return True
+    # Other commits keep being claimed, the build guards decide between them
+    return True
+
+
+def claimed_commit(store, push):
+    # The commit last claimed for the branch of push, None when no build of the branch is remembered
+    item = store.get('commit', push.output_path)
+    return item['sha'] if item else None
+
+
+def release(store, push):
+    # Forget a delivery and commit that did not get a build, so a redelivery can start one
+    if push.delivery_id:
+        store.delete('delivery', '%s:%s' % (push.provider, push.delivery_id))
+    release_commit(store, push.output_path, push.head_sha)
+
+
+def release_commit(store, path, head_sha):
+    # A newer commit claimed in the meantime is kept
+    if head_sha:
+        store.delete('commit', path, expected={'sha': head_sha})
+
@@ -0,0 +1,40 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Webhook events that need no build: pings, deleted branches and tags, comments and event types that do not change
+# code, pushes whose head commit message asks to skip CI, and pushes by the authors listed in SkipAuthors.
+
+import os
+import re
+
+# Compared with the head commit message, ignoring case
+skip_markers = ('[skip ci]', '[ci skip]', '[no ci]', '[skip git2s3]')
+
+
+def author_pattern(text):
+    # Comma separated author names or logins, * matches any characters, for example "dependabot[bot],renovate*"
+    names = [n.strip() for n in text.split(',') if n.strip()]
+    if not names:
+        return None
+    return re.compile('^(%s)$' % '|'.join(re.escape(n).replace('\\*', '.*') for n in names))
+
+
+skip_authors = author_pattern(os.environ.get('SkipAuthors', ''))
+
+
+def skip_reason(parser, body, event_type=None):
+    # Reason, used as the Reason dimension of the BuildsAvoided metric, or None when the event needs a build
+    reason = parser.ignored(body, event_type)
+    if reason:
+        return reason
+    message = (parser.head_message(body) or '').lower()
+    if any(marker in message for marker in skip_markers):
+        return 'SkipMarker'
+    author = parser.author(body)
+    if skip_authors is not None and author and skip_authors.match(author):
+        return 'SkipAuthor'
+    return None
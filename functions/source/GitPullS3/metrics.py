@@ -0,0 +1,30 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# CloudWatch metrics written to the function log in the embedded metric format, CloudWatch extracts them from the
+# log so no PutMetricData call is made.
+
+import json
+import time
+
+namespace = 'Git2S3'
+
+
+def put_metric(name, value=1, unit='Count', **dimensions):
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit}]
+            }]
+        },
+        name: value
+    }
+    record.update(dimensions)
+    print(json.dumps(record))
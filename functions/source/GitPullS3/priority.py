@@ -0,0 +1,72 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Priority classes of deferred builds. PriorityRules is a JSON list of classes, highest priority first, for example
+# [{"class": "release", "branches": ["tags/*"]}, {"class": "default", "branches": ["{default}"]}]. A push belongs to
+# the first class whose "events" patterns match its event type and whose "branches" patterns match its branch, a
+# class without one of the two lists matches any value. "{default}" stands for the default branch of the repository,
+# or main and master when the webhook does not name it. Pushes that match no class are in the "other" class, after
+# all the configured ones.
+#
+# The backlog starts the push with the lowest rank first, where the rank is the position of its class lowered by one
+# for every PriorityAging seconds the push has waited, so pushes of a low priority class are never starved.
+
+import fnmatch
+import json
+import os
+
+default_rules = [{'class': 'release', 'branches': ['tags/*']}, {'class': 'default', 'branches': ['{default}']}]
+
+# Seconds of waiting that move a push up by one class
+aging = int(os.environ.get('PriorityAging') or 300)
+
+other = 'other'
+
+rules_cache = {}
+
+
+def load(text):
+    rules = json.loads(text) if text.strip() else default_rules
+    if not isinstance(rules, list):
+        raise Exception('PriorityRules must be a JSON list')
+    for rule in rules:
+        if not rule.get('class'):
+            raise Exception('PriorityRules entry %s has no class' % json.dumps(rule))
+        for setting in ('events', 'branches'):
+            if not isinstance(rule.get(setting, []), list):
+                raise Exception('%s of priority class %s must be a list' % (setting, rule['class']))
+    return rules
+
+
+def get_rules(text=None):
+    if text is None:
+        text = os.environ.get('PriorityRules', '')
+    if text not in rules_cache:
+        rules_cache[text] = load(text)
+    return rules_cache[text]
+
+
+def branch_matches(push, pattern):
+    if pattern == '{default}':
+        return push.branch_name in ([push.default_branch] if push.default_branch else ['main', 'master'])
+    return fnmatch.fnmatchcase(push.branch_name, pattern)
+
+
+def classify(push, text=None):
+    # Returns the class of the push and its position, lower positions are started first
+    rules = get_rules(text)
+    for position, rule in enumerate(rules):
+        if 'events' in rule and not any(fnmatch.fnmatchcase(push.event_type or '', p) for p in rule['events']):
+            continue
+        if 'branches' in rule and not any(branch_matches(push, p) for p in rule['branches']):
+            continue
+        return rule['class'], position
+    return other, len(rules)
+
+
+def rank(position, waited):
+    return position - float(waited) / aging
@@ -0,0 +1,71 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Queue intake. The webhook function authenticates and parses each webhook and sends it to the WebhookQueue, this
+# consumer takes batches from the queue, keeps only the newest push per repository and branch, and starts the builds
+# concurrently. Messages whose build could not be started are reported back so only they are retried.
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import admission
+import clients
+import state
+import webhooks
+
+# Maximum number of start_build calls in flight at once
+max_workers = int(os.environ.get('StartBuildWorkers', '8'))
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.handlers[0].setFormatter(logging.Formatter('[%(asctime)s][%(levelname)s] %(message)s'))
+logging.getLogger('boto3').setLevel(logging.ERROR)
+logging.getLogger('botocore').setLevel(logging.ERROR)
+
+
+def enqueue(queue_url, push, keybucket, outputbucket, seq):
+    message = {'push': push.to_dict(), 'key-bucket': keybucket, 'output-bucket': outputbucket, 'seq': seq}
+    response = clients.get_client('sqs').send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
+    logger.info('Queued %s on branch %s as message %s' % (push.repo_name, push.branch_name, response['MessageId']))
+    return response['MessageId']
+
+
+def newest_per_branch(records):
+    # Pushes to the same output path that arrive in one batch only need a build of the newest one
+    groups = {}
+    for record in records:
+        message = json.loads(record['body'])
+        push = webhooks.PushRecord.from_dict(message['push'])
+        path = push.output_path
+        if path not in groups or groups[path][1]['seq'] < message['seq']:
+            if path in groups:
+                logger.info('Message %s is superseded by %s' % (groups[path][0], record['messageId']))
+            groups[path] = (record['messageId'], message, push)
+        else:
+            logger.info('Message %s is superseded by %s' % (record['messageId'], groups[path][0]))
+    return list(groups.values())
+
+
+def lambda_handler(event, context):
+    store = state.get_store()
+    # Create the client before the worker threads need it
+    clients.get_client('codebuild')
+    pending = newest_per_branch(event['Records'])
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+        futures = [(message_id, executor.submit(admission.submit, store, push, message['key-bucket'],
+                                                message['output-bucket'], message['seq']))
+                   for message_id, message, push in pending]
+        for message_id, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error('Could not start the build for message %s: %s' % (message_id, e))
+                failures.append({'itemIdentifier': message_id})
+    logger.info('Submitted %d of %d builds from %d messages' % (len(pending) - len(failures), len(pending), len(event['Records'])))
+    return {'batchItemFailures': failures}
@@ -0,0 +1,85 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Per repository settings. RepoConfig is a JSON list of objects that each have a "repo" pattern, matched with
+# fnmatch against the full name of the repository, and the settings for the repositories it matches, for example
+# [{"repo": "org/monorepo", "format": "tar.zst"}]. The first matching object wins, settings it does not give fall
+# back to the stack wide defaults.
+#
+# Settings:
+#   format       archive format, one of the keys of formats
+#   paths        fnmatch patterns of the files whose changes start a build, a push that lists its changed files and
+#                changes none of them is skipped
+#   directories  subdirectories that each get their own artifact, only these are checked out
+#   sparse       sparse checkout patterns (gitignore syntax), only matching paths are checked out and packaged
+#   filter       partial clone filter, blob:none or blob:limit=<size>, blobs are then only fetched for the paths
+#                that are checked out
+#   submodules   true to check out the submodules of the repository, recursively
+#   lfs          true to replace Git LFS pointer files with their content, objects are cached in the cache bucket
+
+import fnmatch
+import json
+import os
+import re
+
+# Archive formats with the suffix of their object key and their content type
+formats = {
+    'zip': ('.zip', 'application/zip'),
+    'tar.gz': ('.tar.gz', 'application/gzip'),
+    'tar.zst': ('.tar.zst', 'application/zstd'),
+    # One object per file under <repo>/, the key is the one of the manifest
+    'exploded': ('.manifest.json', 'application/json'),
+}
+
+defaults = {'format': os.environ.get('ArchiveFormat') or 'zip', 'paths': [], 'directories': [], 'sparse': [],
+            'filter': '', 'submodules': False, 'lfs': False}
+
+filter_pattern = re.compile(r'^(blob:none|blob:limit=[0-9]+[kmg]?)$')
+
+configs = {}
+
+
+def load(text):
+    entries = json.loads(text) if text.strip() else []
+    if not isinstance(entries, list):
+        raise Exception('RepoConfig must be a JSON list')
+    for entry in entries:
+        if 'repo' not in entry:
+            raise Exception('RepoConfig entry %s has no repo pattern' % json.dumps(entry))
+        if entry.get('format', defaults['format']) not in formats:
+            raise Exception('Unknown archive format %s for %s' % (entry['format'], entry['repo']))
+        if entry.get('filter') and not filter_pattern.match(entry['filter']):
+            raise Exception('Unsupported clone filter %s for %s' % (entry['filter'], entry['repo']))
+        for setting in ('submodules', 'lfs'):
+            if not isinstance(entry.get(setting, False), bool):
+                raise Exception('%s of %s must be true or false' % (setting, entry['repo']))
+        for setting in ('paths', 'directories', 'sparse'):
+            if not isinstance(entry.get(setting, []), list):
+                raise Exception('%s of %s must be a list' % (setting, entry['repo']))
+        entry['directories'] = [d.strip('/') for d in entry.get('directories', [])]
+    return entries
+
+
+def get_config(full_name, text=None):
+    if text is None:
+        text = os.environ.get('RepoConfig', '')
+    if text not in configs:
+        configs[text] = load(text)
+    config = dict(defaults)
+    for entry in configs[text]:
+        if fnmatch.fnmatchcase(full_name, entry['repo']):
+            config.update((k, v) for k, v in entry.items() if k != 'repo')
+            break
+    return config
+
+
+def relevant(config, changed_paths):
+    # Without path rules, or without a list of the changed files, every push is relevant
+    patterns = config['paths'] or [d + '/*' for d in config['directories']]
+    if not patterns or changed_paths is None:
+        return True
+    return any(fnmatch.fnmatchcase(path, pattern) for path in changed_paths for pattern in patterns)
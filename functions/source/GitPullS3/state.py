@@ -0,0 +1,163 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Shared state for the GitPullS3 functions. Items are small dictionaries of strings and integers addressed by a
+# namespace and a key. MemoryStore keeps them in the container and is meant for tests and single-container use,
+# DynamoDBStore keeps them in the table named by the StateTable environment variable.
+
+import os
+import threading
+import time
+from decimal import Decimal
+import clients
+
+
+def now():
+    return int(time.time())
+
+
+def is_live(item, timestamp=None):
+    # An item is gone from its expiry second on, in both stores
+    return item is not None and ('expires' not in item or item['expires'] > (timestamp or now()))
+
+
+def matches(item, expected):
+    return all(item is not None and item.get(k) == v for k, v in expected.items())
+
+
+class MemoryStore(object):
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self.lock:
+            item = self.items.get((namespace, key))
+            return dict(item) if is_live(item) else None
+
+    def put(self, namespace, key, item, ttl=None, if_absent=False, expected=None):
+        # Returns False, without writing, when if_absent is set and a live item exists, or when the current item
+        # does not have the attribute values given in expected
+        item = dict(item)
+        if ttl:
+            item['expires'] = now() + ttl
+        with self.lock:
+            current = self.items.get((namespace, key))
+            if not is_live(current):
+                current = None
+            if if_absent and current is not None:
+                return False
+            if expected and not matches(current, expected):
+                return False
+            self.items[(namespace, key)] = item
+            return True
+
+    def delete(self, namespace, key, expected=None):
+        with self.lock:
+            current = self.items.get((namespace, key))
+            if expected and not matches(current if is_live(current) else None, expected):
+                return False
+            self.items.pop((namespace, key), None)
+            return True
+
+    def list(self, namespace):
+        with self.lock:
+            return [(k, dict(v)) for (n, k), v in sorted(self.items.items()) if n == namespace and is_live(v)]
+
+
+class DynamoDBStore(object):
+    # Table layout: partition key 'pk' (namespace), sort key 'sk' (key), TTL attribute 'expires'
+    def __init__(self, table_name, client=None):
+        from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+        self.table_name = table_name
+        self.client = client or clients.get_client('dynamodb')
+        self.serializer = TypeSerializer()
+        self.deserializer = TypeDeserializer()
+
+    def encode(self, item):
+        return dict((k, self.serializer.serialize(v)) for k, v in item.items())
+
+    def decode(self, item):
+        decoded = {}
+        for k, v in item.items():
+            if k in ('pk', 'sk'):
+                continue
+            v = self.deserializer.deserialize(v)
+            if isinstance(v, Decimal):
+                v = int(v) if v == v.to_integral_value() else float(v)
+            decoded[k] = v
+        return decoded
+
+    def condition(self, if_absent, expected):
+        clauses = []
+        values = {':now': {'N': str(now())}}
+        names = {}
+        if if_absent:
+            clauses.append('(attribute_not_exists(pk) OR expires <= :now)')
+        for i, (k, v) in enumerate(sorted((expected or {}).items())):
+            names['#e%d' % i] = k
+            values[':e%d' % i] = self.serializer.serialize(v)
+            clauses.append('#e%d = :e%d' % (i, i))
+        if expected:
+            clauses.append('(attribute_not_exists(expires) OR expires > :now)')
+        if not clauses:
+            return {}
+        condition = {'ConditionExpression': ' AND '.join(clauses), 'ExpressionAttributeValues': values}
+        if names:
+            condition['ExpressionAttributeNames'] = names
+        return condition
+
+    def get(self, namespace, key):
+        response = self.client.get_item(TableName=self.table_name, ConsistentRead=True,
+                                        Key={'pk': {'S': namespace}, 'sk': {'S': key}})
+        item = self.decode(response['Item']) if 'Item' in response else None
+        return item if is_live(item) else None
+
+    def put(self, namespace, key, item, ttl=None, if_absent=False, expected=None):
+        item = dict(item, pk=namespace, sk=key)
+        if ttl:
+            item['expires'] = now() + ttl
+        try:
+            self.client.put_item(TableName=self.table_name, Item=self.encode(item),
+                                 **self.condition(if_absent, expected))
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def delete(self, namespace, key, expected=None):
+        try:
+            self.client.delete_item(TableName=self.table_name, Key={'pk': {'S': namespace}, 'sk': {'S': key}},
+                                    **self.condition(False, expected))
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def list(self, namespace):
+        items = []
+        timestamp = now()
+        kwargs = {'TableName': self.table_name, 'ConsistentRead': True, 'KeyConditionExpression': 'pk = :pk',
+                  'ExpressionAttributeValues': {':pk': {'S': namespace}}}
+        while True:
+            response = self.client.query(**kwargs)
+            for item in response['Items']:
+                decoded = self.decode(item)
+                if is_live(decoded, timestamp):
+                    items.append((item['sk']['S'], decoded))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+stores = {}
+
+
+def get_store():
+    # One store per container, DynamoDB when the stack created a state table
+    table_name = os.environ.get('StateTable', '')
+    if table_name not in stores:
+        stores[table_name] = DynamoDBStore(table_name) if table_name else MemoryStore()
+    return stores[table_name]
@@ -0,0 +1,72 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Webhook secret index. The api-secrets and repo-secrets stage variables are parsed once per container. When a
+# repository has its own secret only that secret is accepted, as a token or to verify the payload signature, so a
+# push is hashed once instead of once per configured secret.
+
+import hmac
+import hashlib
+
+signature_headers = ('x-hub-signature-256', 'x-hub-signature')
+token_headers = ('x-git-token', 'x-gitlab-token')
+
+
+class SecretIndex(object):
+    def __init__(self, api_secrets, repo_secrets=''):
+        # Shared secrets, accepted for any repository
+        self.secrets = [s for s in api_secrets.split(',') if s]
+        # Repository scoped secrets, given as <repository full name>=<secret> pairs
+        self.repos = {}
+        for entry in repo_secrets.split(','):
+            name, sep, secret = entry.partition('=')
+            if sep and secret:
+                self.repos[name.strip()] = secret
+
+    def candidates(self, full_name):
+        if full_name in self.repos:
+            return [self.repos[full_name]]
+        return self.secrets
+
+    def verify_token(self, full_name, token):
+        token = str(token).encode('utf-8')
+        return any(hmac.compare_digest(str(secret).encode('utf-8'), token) for secret in self.candidates(full_name))
+
+    def verify_signature(self, full_name, raw_body, signature, default_digest='sha1'):
+        # Signatures are sent as <digest>=<hex>, the prefix tells which digest the provider used
+        digest, sep, expected = signature.partition('=')
+        if not sep:
+            digest, expected = default_digest, signature
+        if digest not in ('sha1', 'sha256'):
+            return False
+        body = str(raw_body).encode('utf-8')
+        for secret in self.candidates(full_name):
+            actual = hmac.new(str(secret).encode('utf-8'), body, getattr(hashlib, digest)).hexdigest()
+            if hmac.compare_digest(actual, str(expected)):
+                return True
+        return False
+
+    def verify(self, full_name, headers, raw_body, default_digest='sha1'):
+        for header in token_headers:
+            if header in headers and self.verify_token(full_name, headers[header]):
+                return True
+        # X-Hub-Signature-256 is preferred when the provider sends both
+        for header in signature_headers:
+            if header in headers:
+                return self.verify_signature(full_name, raw_body, headers[header], default_digest)
+        return False
+
+
+# Parsed secret indexes keyed by the raw stage-variable strings, kept for the lifetime of the container
+indexes = {}
+
+
+def get_index(api_secrets, repo_secrets=''):
+    cache_key = (api_secrets, repo_secrets)
+    if cache_key not in indexes:
+        indexes[cache_key] = SecretIndex(api_secrets, repo_secrets)
+    return indexes[cache_key]
@@ -0,0 +1,341 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Webhook payload parsers. The provider is picked from its event header in one dictionary lookup, or from a single
+# look at the payload keys when no event header was sent, so parsing never has to try one shape after another.
+
+
+class PushRecord(object):
+    __slots__ = ('provider', 'event_type', 'delivery_id', 'full_name', 'repo_name', 'branch_name', 'remote_url',
+                 'head_sha', 'base_sha', 'head_message', 'default_branch', 'changed_paths')
+    # Only needed while the webhook is handled, left out of queued records
+    transient = ('changed_paths',)
+
+    def __init__(self, provider, event_type, full_name, branch_name, remote_url, repo_name=None, head_sha=None,
+                 head_message=None, default_branch=None, changed_paths=None, base_sha=None):
+        self.provider = provider
+        self.event_type = event_type
+        self.delivery_id = None
+        self.full_name = full_name
+        self.repo_name = repo_name or full_name
+        self.branch_name = branch_name
+        self.remote_url = remote_url
+        self.head_sha = head_sha
+        # Commit the push moved the branch from, None when the payload does not carry it or the branch is new
+        self.base_sha = None if is_zero_sha(base_sha) else base_sha
+        # Message of the head_sha commit, None when the payload does not carry it
+        self.head_message = head_message
+        # Default branch of the repository, None when the payload does not name it
+        self.default_branch = default_branch
+        # Files added, modified or removed by the push, None when the payload does not list all of them
+        self.changed_paths = changed_paths
+
+    @property
+    def output_path(self):
+        # Prefix of the artifacts of this repository and branch in the output bucket
+        return '%s/%s/' % (self.repo_name, self.branch_name)
+
+    def to_dict(self):
+        return dict((s, getattr(self, s)) for s in self.__slots__ if s not in self.transient)
+
+    @classmethod
+    def from_dict(cls, values):
+        record = cls.__new__(cls)
+        for s in cls.__slots__:
+            setattr(record, s, values.get(s))
+        return record
+
+    def __repr__(self):
+        return 'PushRecord(%s)' % ', '.join('%s=%r' % (s, getattr(self, s)) for s in self.__slots__
+                                            if s not in self.transient)
+
+
+def branch_from_ref(ref):
+    # branch names should contain [name] only, tag names - "tags/[name]"
+    return ref.replace('refs/heads/', '').replace('refs/tags/', 'tags/')
+
+
+def is_zero_sha(sha):
+    # Providers report the new commit of a deleted branch or tag as all zeros
+    return bool(sha) and not sha.strip('0')
+
+
+def commit_paths(body):
+    # GitHub and GitLab list the files of each pushed commit. GitLab sends at most 20 commits and GitHub at most 2048,
+    # and a forced push or a new branch can change files that none of the listed commits touch. GitLab marks a new
+    # branch only by a before commit of all zeros
+    commits = body.get('commits')
+    if (not commits or body.get('forced') or body.get('created') or is_zero_sha(body.get('before')) or
+            len(commits) >= 2048):
+        return None
+    if body.get('total_commits_count', len(commits)) > len(commits):
+        return None
+    paths = set()
+    for commit in commits:
+        for change in ('added', 'modified', 'removed'):
+            paths.update(commit.get(change) or [])
+    return sorted(paths)
+
+
+def ssh_clone_link(repository):
+    for link in repository.get('links', {}).get('clone', []):
+        if link['name'] == 'ssh':
+            return link['href']
+    return None
+
+
+class WebhookParser(object):
+    # Each provider's parser adds parse(body, event_type), which returns the PushRecord of the event
+    provider = None
+    # Header carrying the event type, and the event types (or prefixes) this parser accepts from it
+    event_header = None
+    event_prefixes = ('',)
+    # Header carrying the unique id of a delivery, resent unchanged when the provider retries it
+    delivery_header = None
+
+    @classmethod
+    def accepts(cls, event_type):
+        return event_type.startswith(cls.event_prefixes)
+
+    @classmethod
+    def ignored(cls, body, event_type=None):
+        # Why the event needs no build (ping, deleted branch, comment or another event type), None when it does
+        return None
+
+    @classmethod
+    def head_message(cls, body):
+        return None
+
+    @classmethod
+    def author(cls, body):
+        return None
+
+
+class GitHubParser(WebhookParser):
+    provider = 'github'
+    event_header = 'x-github-event'
+    delivery_header = 'x-github-delivery'
+
+    @classmethod
+    def parse(cls, body, event_type=None):
+        repository = body['repository']
+        full_name = repository['full_name']
+        # GitHub publish event
+        if body.get('action') == 'published' and 'release' in body:
+            return PushRecord(cls.provider, event_type, full_name, 'tags/%s' % body['release']['tag_name'],
+                              repository['ssh_url'], repo_name=full_name + '/release',
+                              default_branch=repository.get('default_branch'))
+        return PushRecord(cls.provider, event_type, full_name, branch_from_ref(body.get('ref', 'master')),
+                          repository['ssh_url'], head_sha=body.get('after'), head_message=cls.head_message(body),
+                          default_branch=repository.get('default_branch'), changed_paths=commit_paths(body),
+                          base_sha=body.get('before'))
+
+    @classmethod
+    def ignored(cls, body, event_type=None):
+        if event_type == 'ping' or 'zen' in body:
+            return 'Ping'
+        if (event_type or '').endswith('comment') or 'comment' in body:
+            return 'Comment'
+        if 'release' in body:
+            return None if body.get('action') == 'published' else 'EventType'
+        if event_type not in (None, 'push') or 'ref' not in body:
+            return 'EventType'
+        if body.get('deleted') or is_zero_sha(body.get('after')):
+            return 'BranchDeleted'
+        return None
+
+    @classmethod
+    def head_message(cls, body):
+        return (body.get('head_commit') or {}).get('message')
+
+    @classmethod
+    def author(cls, body):
+        return (body.get('sender') or {}).get('login') or (body.get('pusher') or {}).get('name')
+
+
+class GitLabParser(WebhookParser):
+    provider = 'gitlab'
+    event_header = 'x-gitlab-event'
+    delivery_header = 'x-gitlab-event-uuid'
+
+    @classmethod
+    def parse(cls, body, event_type=None):
+        # GitLab 8.5+ moved the project details from 'repository' to 'project'
+        project = body.get('project') or body['repository']
+        return PushRecord(cls.provider, event_type, project['path_with_namespace'],
+                          branch_from_ref(body.get('ref', 'master')), project['git_ssh_url'],
+                          head_sha=body.get('checkout_sha') or body.get('after'), head_message=cls.head_message(body),
+                          default_branch=project.get('default_branch'), changed_paths=commit_paths(body),
+                          base_sha=body.get('before'))
+
+    @classmethod
+    def ignored(cls, body, event_type=None):
+        kind = body.get('object_kind') or body.get('event_name')
+        if kind == 'note' or event_type == 'Note Hook':
+            return 'Comment'
+        if kind not in (None, 'push', 'tag_push'):
+            return 'EventType'
+        if is_zero_sha(body.get('after')):
+            return 'BranchDeleted'
+        return None
+
+    @classmethod
+    def head_message(cls, body):
+        head_sha = body.get('checkout_sha') or body.get('after')
+        for commit in body.get('commits') or []:
+            if commit.get('id') == head_sha:
+                return commit.get('message')
+        return None
+
+    @classmethod
+    def author(cls, body):
+        return body.get('user_username')
+
+
+class BitbucketServerParser(WebhookParser):
+    provider = 'bitbucket-server'
+    event_header = 'x-event-key'
+    delivery_header = 'x-request-id'
+    event_prefixes = ('repo:refs_changed', 'repo:modified', 'repo:forked', 'repo:comment:', 'pr:', 'mirror:',
+                      'diagnostics:')
+    # Pull request events that build the source branch of the pull request
+    pull_request_events = ('pr:opened', 'pr:from_ref_updated')
+
+    @classmethod
+    def parse(cls, body, event_type=None):
+        changes = body.get('changes')
+        branch_name = 'master'
+        head_sha = base_sha = None
+        if 'repository' in body:
+            repository = body['repository']
+        else:
+            # BitBucket pull-request
+            from_ref = body['pullRequest']['fromRef']
+            repository = from_ref['repository']
+            branch_name = from_ref['displayId']
+            head_sha = from_ref.get('latestCommit')
+        if changes:
+            # Bitbucket Server v6.6.1
+            branch_name = changes[0]['ref']['displayId']
+            head_sha = changes[0].get('toHash')
+            base_sha = changes[0].get('fromHash')
+        # BitBucket #14
+        full_name = repository.get('fullName') or repository['name']
+        return PushRecord(cls.provider, event_type, full_name, branch_name, ssh_clone_link(repository),
+                          head_sha=head_sha, base_sha=base_sha)
+
+    @classmethod
+    def ignored(cls, body, event_type=None):
+        if event_type == 'diagnostics:ping' or 'test' in body:
+            return 'Ping'
+        if ':comment:' in (event_type or '') or 'comment' in body:
+            return 'Comment'
+        if 'pullRequest' in body and 'changes' not in body:
+            return None if event_type in (None,) + cls.pull_request_events else 'EventType'
+        changes = body.get('changes')
+        if not changes:
+            # Renamed and forked repositories
+            return 'EventType'
+        if changes[0].get('type') == 'DELETE' or is_zero_sha(changes[0].get('toHash')):
+            return 'BranchDeleted'
+        return None
+
+    @classmethod
+    def author(cls, body):
+        return (body.get('actor') or {}).get('name')
+
+
+class BitbucketCloudParser(WebhookParser):
+    provider = 'bitbucket'
+    event_header = 'x-event-key'
+    delivery_header = 'x-request-uuid'
+
+    @classmethod
+    def parse(cls, body, event_type=None):
+        repository = body['repository']
+        changes = body.get('push', {}).get('changes')
+        branch_name = 'master'
+        head_sha = base_sha = None
+        if changes and changes[0].get('new'):
+            branch_name = changes[0]['new']['name']
+            head_sha = changes[0]['new'].get('target', {}).get('hash')
+            base_sha = ((changes[0].get('old') or {}).get('target') or {}).get('hash')
+        remote_url = 'git@' + repository['links']['html']['href'].replace('https://', '').replace('/', ':', 1) + '.git'
+        return PushRecord(cls.provider, event_type, repository['full_name'], branch_name, remote_url,
+                          head_sha=head_sha, head_message=cls.head_message(body),
+                          default_branch=(repository.get('mainbranch') or {}).get('name'), base_sha=base_sha)
+
+    @classmethod
+    def ignored(cls, body, event_type=None):
+        if 'comment' in (event_type or '') or 'comment' in body:
+            return 'Comment'
+        if event_type not in (None, 'repo:push') or not body.get('push', {}).get('changes'):
+            return 'EventType'
+        if not body['push']['changes'][0].get('new'):
+            return 'BranchDeleted'
+        return None
+
+    @classmethod
+    def head_message(cls, body):
+        changes = body.get('push', {}).get('changes') or [{}]
+        return ((changes[0].get('new') or {}).get('target') or {}).get('message')
+
+    @classmethod
+    def author(cls, body):
+        actor = body.get('actor') or {}
+        return actor.get('nickname') or actor.get('display_name')
+
+
+# Parsers sharing an event header are tried in this order, the first one accepting the event type wins
+parsers = [GitHubParser, GitLabParser, BitbucketServerParser, BitbucketCloudParser]
+
+parsers_by_header = {}
+for parser in parsers:
+    parsers_by_header.setdefault(parser.event_header, []).append(parser)
+
+
+def probe(body):
+    # Single structural look at the payload for requests that carry no known event header
+    if 'object_kind' in body or 'project' in body:
+        return GitLabParser
+    if 'push' in body:
+        return BitbucketCloudParser
+    if 'eventKey' in body or 'changes' in body or 'pullRequest' in body:
+        return BitbucketServerParser
+    links = body.get('repository', {}).get('links', {})
+    if 'html' in links:
+        return BitbucketCloudParser
+    if 'clone' in links:
+        return BitbucketServerParser
+    if 'path_with_namespace' in body.get('repository', {}):
+        return GitLabParser
+    return GitHubParser
+
+
+def get_parser(headers, body):
+    for header, candidates in parsers_by_header.items():
+        event_type = headers.get(header)
+        if event_type is None:
+            continue
+        for candidate in candidates:
+            if candidate.accepts(event_type):
+                return candidate, event_type
+    return probe(body), None
+
+
+def get_headers(event):
+    # Header names are case-insensitive, API Gateway passes them through as the provider sent them
+    return dict((k.lower(), v) for k, v in event['params']['header'].items())
+
+
+def parse(event, headers=None):
+    if headers is None:
+        headers = get_headers(event)
+    parser, event_type = get_parser(headers, event['body-json'])
+    push = parser.parse(event['body-json'], event_type)
+    push.delivery_id = headers.get(parser.delivery_header)
+    return push
@@ -0,0 +1,65 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Allowed-ips check per request: the interval index of allowlist.py, cold (parsed on the first request of a
+# container) and warm, against the linear "ip in net" loop that parsed the list on every request.
+# Usage: python3 tests/benchmarks/bench_allowlist.py [number of ranges]
+
+import os
+import random
+import sys
+import timeit
+from ipaddress import ip_address, ip_network
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers  # noqa: E402,F401
+import allowlist  # noqa: E402
+
+# GitHub hook ranges, the rest of the list is made of random IPv4 and IPv6 ranges
+github_hooks = ['192.30.252.0/22', '185.199.108.0/22', '140.82.112.0/20', '143.55.64.0/20', '2a0a:a440::/29',
+                '2606:50c0::/32']
+
+
+def ranges_of(count):
+    generator = random.Random(1)
+    ranges = list(github_hooks)
+    while len(ranges) < count:
+        if generator.random() < 0.7:
+            ranges.append(str(ip_network('%d.%d.%d.0/%d' % (generator.randrange(256), generator.randrange(256),
+                                                            generator.randrange(256), generator.choice((20, 24, 28))),
+                                         strict=False)))
+        else:
+            ranges.append('2001:db8:%x::/48' % generator.randrange(65536))
+    return ','.join(ranges)
+
+
+def linear(ranges, address):
+    ip = ip_address(address)
+    for r in ranges.split(','):
+        if ip in ip_network(r):
+            return True
+    return False
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 500
+    ranges = ranges_of(count)
+    # A request from the last GitHub range, and one that matches nothing
+    for address in ('2606:50c0::1', '203.0.113.9'):
+        number = 200
+        linear_time = min(timeit.repeat(lambda: linear(ranges, address), number=number, repeat=3)) / number
+        cold_time = min(timeit.repeat(lambda: address in allowlist.AllowList(ranges), number=number,
+                                      repeat=3)) / number
+        index = allowlist.get_allowlist(ranges)
+        number = 100000
+        warm_time = min(timeit.repeat(lambda: address in index, number=number, repeat=3)) / number
+        print('%d ranges, %s: linear %.1f us, index cold %.1f us, index warm %.2f us (%.0fx faster than linear)'
+              % (count, address, linear_time * 1e6, cold_time * 1e6, warm_time * 1e6, linear_time / warm_time))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
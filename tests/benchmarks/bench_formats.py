@@ -0,0 +1,77 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Packaging time, archive size and extraction time for each archive format, on the checkout of a repository, by
+# default a synthetic one of source files and a few binaries. Usage:
+# python3 tests/benchmarks/bench_formats.py [path of a checkout to package]
+
+import io
+import os
+import random
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers  # noqa: E402
+import package  # noqa: E402
+
+
+def sample_repo(path):
+    rng = random.Random(0)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz_') for _ in range(rng.randint(2, 12))) for _ in range(2000)]
+    files = dict(('src/%02d/module_%04d.py' % (n % 40, n), ' '.join(rng.choice(words) for _ in range(2000)))
+                 for n in range(2000))
+    files.update(('assets/image_%02d.png' % n, rng.randbytes(2 * 1024 * 1024)) for n in range(10))
+    files.update(('data/table_%02d.csv' % n, '\n'.join(','.join(rng.choice(words) for _ in range(10))
+                                                       for _ in range(50000))) for n in range(5))
+    helpers.init_repo(path)
+    helpers.commit(path, files)
+    return path
+
+
+def extract(archive_format, data):
+    if archive_format == 'zip':
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        return sum(len(archive.read(name)) for name in archive.namelist())
+    if archive_format == 'tar.zst':
+        import zstandard
+        data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    archive = tarfile.open(fileobj=io.BytesIO(data), mode='r:gz' if archive_format == 'tar.gz' else 'r:')
+    return sum(len(archive.extractfile(m).read()) for m in archive.getmembers() if m.isfile())
+
+
+def main(argv):
+    work = tempfile.mkdtemp()
+    try:
+        root = argv[1] if len(argv) > 1 else sample_repo(os.path.join(work, 'repo'))
+        total = sum(size for _, _, size, _ in package.tree_entries(root, True) if size)
+        print('%s, %.1f MB of files' % (root, total / 1048576.0))
+        print('%-8s %12s %12s %10s %12s' % ('format', 'package (s)', 'size (MB)', 'ratio', 'extract (s)'))
+        for archive_format in ('zip', 'tar.gz', 'tar.zst'):
+            stream = io.BytesIO()
+            started = time.time()
+            try:
+                package.writers[archive_format](stream, package.tree_entries(root, True))
+            except Exception as e:
+                print('%-8s %s' % (archive_format, e))
+                continue
+            packaged = time.time() - started
+            data = stream.getvalue()
+            started = time.time()
+            extract(archive_format, data)
+            print('%-8s %12.2f %12.1f %10.3f %12.2f' % (archive_format, packaged, len(data) / 1048576.0,
+                                                        len(data) / float(total), time.time() - started))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
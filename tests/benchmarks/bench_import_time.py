@@ -0,0 +1,60 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Import time of the GitPullS3 handlers, taken from "python -X importtime" in a fresh interpreter, the way a cold
+# start imports them. Exits with status 1 when a handler takes longer than budget_ms to import.
+# Usage: python3 tests/benchmarks/bench_import_time.py [runs]
+
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+source = os.path.join(root, 'functions', 'source', 'GitPullS3')
+
+handlers = ('lambda_function', 'build_events', 'queue_consumer')
+
+# Import time budget of each handler module, including everything it imports that Lambda has not loaded already
+budget_ms = 100
+
+
+def import_times(module):
+    # Returns {imported module: (self us, cumulative us)} for one cold import of module
+    env = dict(os.environ, ExcludeGit='True', PYTHONDONTWRITEBYTECODE='1')
+    # The Lambda runtime has loaded logging and installed a handler before the function is imported
+    code = 'import logging; logging.basicConfig(); import %s' % module
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=source, env=env, check=True,
+                            stderr=subprocess.PIPE).stderr.decode('utf-8')
+    times = {}
+    logging_done = False
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if not logging_done:
+            logging_done = name.strip() == 'logging'
+            continue
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else 5
+    over = False
+    for module in handlers:
+        samples = [import_times(module) for _ in range(runs)]
+        best = min(samples, key=lambda t: t[module][1])
+        total = best[module][1] / 1000.0
+        slowest = sorted(best.items(), key=lambda item: -item[1][0])[:5]
+        print('%-16s %6.1f ms (budget %d ms), %d modules, slowest: %s' % (
+            module, total, budget_ms, len(best), ', '.join('%s %.1f ms' % (n, t[0] / 1000.0) for n, t in slowest)))
+        over = over or total > budget_ms
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,81 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Time and bytes fetched per push for a shallow clone of the whole repository against a restore of the mirror from
+# the cache and an incremental fetch, on a synthetic repository served by a local git daemon. Usage:
+# python3 tests/benchmarks/bench_mirror.py [number of files] [number of pushes]
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers  # noqa: E402
+import mirror  # noqa: E402
+
+
+def synthetic_repo(path, files):
+    # Text sources in nested directories and a few incompressible binaries, over a short history
+    helpers.init_repo(path)
+    for n in range(5):
+        content = dict(('src/%03d/module_%05d.py' % (i % 100, i), 'value = %d\n' % (i * n) * 40) for i in range(files))
+        content.update(('assets/blob_%02d.bin' % i, os.urandom(512 * 1024)) for i in range(n * 4, n * 4 + 4))
+        helpers.commit(path, content, 'Generation %d' % n)
+
+
+def size_of(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, names in os.walk(path) for f in names)
+
+
+def clone(url, work):
+    target = os.path.join(work, 'clone')
+    shutil.rmtree(target, ignore_errors=True)
+    subprocess.check_call(['git', 'clone', '-q', '--depth=1', '--no-checkout', '--branch', 'main', url, target])
+    return size_of(os.path.join(target, '.git', 'objects'))
+
+
+def mirror_fetch(cache, url):
+    cache.restore(url)
+    before = size_of(cache.path)
+    cache.fetch(url, 'refs/heads/main')
+    fetched = size_of(cache.path) - before
+    cache.save(url)
+    return fetched
+
+
+def main(argv):
+    files = int(argv[1]) if len(argv) > 1 else 5000
+    pushes = int(argv[2]) if len(argv) > 2 else 5
+    work = tempfile.mkdtemp()
+    try:
+        source = os.path.join(work, 'repos', 'synthetic.git')
+        synthetic_repo(source, files)
+        cache = mirror.MirrorCache('git2s3-cache', 10 * 1024 ** 3, path=os.path.join(work, 'cache', 'mirror.git'),
+                                   s3=helpers.FakeS3())
+        with helpers.GitDaemon(os.path.join(work, 'repos')) as daemon:
+            url = daemon.url('synthetic.git')
+            # Seeds the cache, as the first build of the repository does
+            mirror_fetch(cache, url)
+            print('%-6s %14s %14s %16s %16s' % ('push', 'clone (s)', 'mirror (s)', 'clone (bytes)', 'mirror (bytes)'))
+            for push in range(pushes):
+                helpers.commit(source, {'src/000/module_00000.py': 'value = %d\n' % push}, 'Push %d' % push)
+                started = time.time()
+                cloned = clone(url, work)
+                clone_time = time.time() - started
+                started = time.time()
+                fetched = mirror_fetch(cache, url)
+                mirror_time = time.time() - started
+                print('%-6d %14.3f %14.3f %16d %16d' % (push, clone_time, mirror_time, cloned, fetched))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
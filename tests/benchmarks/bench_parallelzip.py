@@ -0,0 +1,79 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Zip throughput of zipfile against parallelzip with 1 to the number of cores as workers, on a synthetic tree of
+# source files, a few large files and already compressed files. Usage:
+# python3 tests/benchmarks/bench_parallelzip.py [size of the tree in MB]
+
+import io
+import os
+import random
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers  # noqa: E402,F401
+import parallelzip  # noqa: E402
+
+
+def synthetic_tree(size):
+    rng = random.Random(0)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz_') for _ in range(rng.randint(2, 12))) for _ in range(2000)]
+    entries, total, n = [], 0, 0
+    while total < size:
+        if n % 50 == 0:
+            name, content = 'assets/image_%04d.png' % n, rng.randbytes(rng.randint(100000, 3000000))
+        elif n % 20 == 0:
+            name, content = 'data/large_%04d.json' % n, ' '.join(rng.choice(words) for _ in range(500000)).encode()
+        else:
+            name, content = 'src/module_%04d.py' % n, ' '.join(rng.choice(words) for _ in range(3000)).encode()
+        entries.append((name, content))
+        total += len(content)
+        n += 1
+    return entries, total
+
+
+def with_zipfile(entries):
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+    return stream.tell()
+
+
+def with_parallelzip(entries, max_workers):
+    stream = io.BytesIO()
+    with parallelzip.ParallelZipWriter(stream, max_workers=max_workers) as archive:
+        for name, content in entries:
+            archive.add_file(io.BytesIO(content), name, size=len(content))
+    return stream.tell()
+
+
+def main(argv):
+    size = int(argv[1]) if len(argv) > 1 else 200
+    entries, total = synthetic_tree(size * 1024 * 1024)
+    cores = os.cpu_count() or 1
+    runs = [('zipfile', with_zipfile)]
+    workers = 1
+    while True:
+        runs.append(('parallelzip, %d workers' % workers, lambda entries, workers=workers:
+                     with_parallelzip(entries, workers)))
+        if workers >= cores:
+            break
+        workers = min(workers * 2, cores)
+    print('%d files, %.1f MB on %d cores' % (len(entries), total / 1048576.0, cores))
+    print('%-26s %10s %12s %12s' % ('writer', 'time (s)', 'MB/s', 'ratio'))
+    for name, run in runs:
+        started = time.time()
+        written = run(entries)
+        elapsed = time.time() - started
+        print('%-26s %10.2f %12.1f %12.3f' % (name, elapsed, total / 1048576.0 / elapsed, written / float(total)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
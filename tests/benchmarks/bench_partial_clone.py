@@ -0,0 +1,71 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Wall time and bytes fetched by the checkout step with and without clone filters and sparse checkout patterns, on a
+# repository with large binaries served by a local git daemon. Usage:
+# python3 tests/benchmarks/bench_partial_clone.py [number of binaries] [MB per binary]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers  # noqa: E402
+import build  # noqa: E402
+
+# CloneFilter and SparsePatterns of each run
+runs = [
+    ('full clone', '', ''),
+    ('blob:none', 'blob:none', '/*\n!/assets/'),
+    ('blob:limit=1m', 'blob:limit=1m', '/*\n!/assets/'),
+    ('blob:none, src only', 'blob:none', '/src/'),
+]
+
+
+def synthetic_repo(path, binaries, size):
+    helpers.init_repo(path)
+    files = dict(('src/module_%04d.py' % n, 'value = %d\n' % n * 200) for n in range(2000))
+    files.update(('assets/video_%02d.bin' % n, os.urandom(size)) for n in range(binaries))
+    files['docs/manual.md'] = '# Manual\n' * 10000
+    helpers.commit(path, files)
+
+
+def size_of(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, names in os.walk(path) for f in names)
+
+
+def main(argv):
+    binaries = int(argv[1]) if len(argv) > 1 else 10
+    size = int(argv[2]) if len(argv) > 2 else 10
+    work = tempfile.mkdtemp()
+    try:
+        synthetic_repo(os.path.join(work, 'repos', 'large.git'), binaries, size * 1024 * 1024)
+        for name in ('CacheBucket', 'Lfs', 'Submodules', 'Directories', 'HeadSha'):
+            os.environ.pop(name, None)
+        os.environ.update({'Branch': 'main', 'exclude_git': 'False'})
+        with helpers.GitDaemon(os.path.join(work, 'repos')) as daemon:
+            os.environ['GitUrl'] = daemon.url('large.git')
+            print('%-22s %10s %16s %16s' % ('checkout', 'time (s)', 'fetched (bytes)', 'written (bytes)'))
+            for n, (name, clone_filter, patterns) in enumerate(runs):
+                os.environ['CloneFilter'] = clone_filter
+                os.environ['SparsePatterns'] = patterns
+                directory = os.path.join(work, 'build-%d' % n)
+                started = time.time()
+                build.checkout(directory)
+                elapsed = time.time() - started
+                fetched = size_of(os.path.join(directory, '.git', 'objects'))
+                written = size_of(directory) - size_of(os.path.join(directory, '.git'))
+                print('%-22s %10.2f %16d %16d' % (name, elapsed, fetched, written))
+                shutil.rmtree(directory)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
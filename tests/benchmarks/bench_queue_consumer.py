@@ -0,0 +1,75 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Load test of the queue consumer: SQS batches of webhook messages go through queue_consumer.lambda_handler against
+# a CodeBuild client stubbed with botocore's Stubber, each start_build taking the given latency. Reports the
+# webhook events handled per second for each number of start_build workers.
+# Usage: python3 tests/benchmarks/bench_queue_consumer.py [events] [latency ms] [pushes per branch]
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers  # noqa: E402,F401
+import boto3  # noqa: E402
+from botocore.stub import Stubber  # noqa: E402
+import clients  # noqa: E402
+import metrics  # noqa: E402
+import queue_consumer  # noqa: E402
+import state  # noqa: E402
+import webhooks  # noqa: E402
+
+batch_size = 10
+
+
+def batches(events, per_branch):
+    # SQS batches in which every branch gets per_branch pushes, so a batch starts batch_size / per_branch builds
+    records = []
+    for i in range(events):
+        branch = 'branch-%d' % (i // per_branch)
+        push = webhooks.PushRecord('github', 'push', 'octo-org/octo-repo', branch,
+                                   'git@github.com:octo-org/octo-repo.git', head_sha='%040x' % i)
+        body = {'push': push.to_dict(), 'key-bucket': 'kb', 'output-bucket': 'ob', 'seq': i}
+        records.append({'messageId': 'm%d' % i, 'receiptHandle': 'h%d' % i, 'body': json.dumps(body)})
+    return [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+
+
+def run(events, latency, per_branch, workers):
+    client = boto3.client('codebuild')
+    client.meta.events.register('before-parameter-build.codebuild.StartBuild', lambda **kwargs: time.sleep(latency))
+    clients.clients['codebuild'] = client
+    state.stores.clear()
+    queue_consumer.max_workers = workers
+    all_batches = batches(events, per_branch)
+    with Stubber(client) as stubber:
+        for i in range(sum(len(queue_consumer.newest_per_branch(b)) for b in all_batches)):
+            stubber.add_response('start_build', {'build': {'id': 'git2s3-build:%d' % i}})
+        start = time.time()
+        failures = 0
+        for batch in all_batches:
+            failures += len(queue_consumer.lambda_handler({'Records': batch}, None)['batchItemFailures'])
+        elapsed = time.time() - start
+    return events / elapsed, failures
+
+
+def main(argv):
+    events = int(argv[1]) if len(argv) > 1 else 1000
+    latency = (float(argv[2]) if len(argv) > 2 else 50) / 1000
+    per_branch = int(argv[3]) if len(argv) > 3 else 2
+    # The handlers log every build and put metrics on stdout
+    queue_consumer.logger.disabled = True
+    metrics.put_metric = lambda *args, **kwargs: None
+    for workers in (1, 2, 4, 8, 16):
+        rate, failures = run(events, latency, per_branch, workers)
+        print('%2d workers: %7.1f events/s, %d failures (%d events, %d pushes per branch, %.0f ms per start_build)'
+              % (workers, rate, failures, events, per_branch, latency * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,39 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Parse latency per provider over the payloads in tests/fixtures/webhooks, with the event header and through the
+# structural probe. Usage: python3 tests/benchmarks/bench_webhooks.py [number of parses per payload]
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers  # noqa: E402
+import webhooks  # noqa: E402
+
+
+def main(argv):
+    number = int(argv[1]) if len(argv) > 1 else 20000
+    print('%-34s %-17s %12s %12s' % ('payload', 'provider', 'header (us)', 'probe (us)'))
+    for name in sorted(os.listdir(os.path.join(helpers.fixtures, 'webhooks'))):
+        fixture = helpers.load_fixture('webhooks', name)
+        with_header = {'params': {'header': fixture['headers']}, 'body-json': fixture['body']}
+        without_header = {'params': {'header': {}}, 'body-json': fixture['body']}
+        parser, event_type = webhooks.get_parser(webhooks.get_headers(with_header), fixture['body'])
+        if parser.ignored(fixture['body'], event_type):
+            # Pings and other events that need no build are not parsed
+            continue
+        times = []
+        for event in (with_header, without_header):
+            best = min(timeit.repeat(lambda: webhooks.parse(event), number=number, repeat=5))
+            times.append(best / number * 1e6)
+        print('%-34s %-17s %12.2f %12.2f' % (name, parser.provider, times[0], times[1]))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
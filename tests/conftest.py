@@ -0,0 +1,44 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import pytest
+import helpers
+
+
+@pytest.fixture
+def store(monkeypatch):
+    # The container-wide MemoryStore the functions get from state.get_store
+    import state
+    monkeypatch.delenv('StateTable', raising=False)
+    monkeypatch.setattr(state, 'stores', {})
+    return state.get_store()
+
+
+@pytest.fixture
+def codebuild(monkeypatch):
+    import clients
+    client = helpers.FakeCodeBuild()
+    monkeypatch.setitem(clients.clients, 'codebuild', client)
+    return client
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    import clients
+    client = helpers.FakeS3()
+    monkeypatch.setitem(clients.clients, 's3', client)
+    return client
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    # Metrics put by the functions, as (name, value, dimensions)
+    import metrics as metrics_module
+    recorded = []
+    monkeypatch.setattr(metrics_module, 'put_metric', lambda name, value=1, unit='Count', **dimensions:
+                        recorded.append((name, value, dimensions)))
+    return recorded
@@ -0,0 +1,259 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Shared by the tests and the benchmarks. Puts the function sources on the import path the way Lambda and the
+# buildspec do, and provides in-memory CodeBuild and S3 clients and helpers that create local Git repositories.
+
+import io
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from botocore.exceptions import ClientError
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixtures = os.path.join(root, 'tests', 'fixtures')
+
+for name in ('GitPullS3', 'GitPullBuild'):
+    path = os.path.join(root, 'functions', 'source', name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Set by the stack on the functions and builds
+os.environ.setdefault('ExcludeGit', 'True')
+os.environ.setdefault('GitPullCodeBuild', 'git2s3-build')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+# The Lambda runtime installs a handler on the root logger, the functions set its format
+if not logging.getLogger().handlers:
+    logging.basicConfig()
+
+
+def load_fixture(*names):
+    with open(os.path.join(fixtures, *names)) as f:
+        return json.load(f)
+
+
+def client_error(code, operation='Operation', status=400):
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+                       operation)
+
+
+class FakeCodeBuild(object):
+    # start_build, stop_build and batch_get_builds of one project. errors holds exceptions raised by the next
+    # start_build calls, in order
+    def __init__(self, project='git2s3-build'):
+        self.project = project
+        self.builds = {}
+        self.started = []
+        self.stopped = []
+        self.batches = []
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def start_build(self, projectName, environmentVariablesOverride):
+        with self.lock:
+            if self.errors:
+                raise self.errors.pop(0)
+            build_id = '%s:%08d-0000-4000-8000-000000000000' % (projectName, len(self.started) + 1)
+            self.builds[build_id] = {'id': build_id, 'buildStatus': 'IN_PROGRESS', 'currentPhase': 'QUEUED',
+                                     'environment': {'environmentVariables': environmentVariablesOverride}}
+            self.started.append(build_id)
+            return {'build': dict(self.builds[build_id])}
+
+    def stop_build(self, id):
+        with self.lock:
+            self.stopped.append(id)
+            self.builds[id]['buildStatus'] = 'STOPPED'
+            return {'build': dict(self.builds[id])}
+
+    def batch_get_builds(self, ids):
+        assert len(ids) <= 100
+        with self.lock:
+            self.batches.append(list(ids))
+            return {'builds': [dict(self.builds[i]) for i in ids if i in self.builds],
+                    'buildsNotFound': [i for i in ids if i not in self.builds]}
+
+    def variables(self, build_id):
+        return dict((v['name'], v['value']) for v in self.builds[build_id]['environment']['environmentVariables'])
+
+    def finish(self, build_id, status='SUCCEEDED'):
+        self.builds[build_id]['buildStatus'] = status
+        self.builds[build_id]['currentPhase'] = 'COMPLETED'
+
+
+class FakePaginator(object):
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix=''):
+        contents = [{'Key': k, 'Size': len(o['Body']), 'LastModified': o['LastModified']}
+                    for (b, k), o in sorted(self.s3.objects.items()) if b == Bucket and k.startswith(Prefix)]
+        yield {'Contents': contents} if contents else {}
+
+
+class FakeS3(object):
+    # The S3 calls the functions and the packager make, objects are kept in memory. puts lists the keys written, in
+    # order, whether by PutObject, a multipart upload, a copy or an upload of a file
+    exceptions = type('Exceptions', (), {'ClientError': ClientError})
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.puts = []
+        self.clock = 0
+        self.lock = threading.Lock()
+
+    def store(self, bucket, key, body, metadata=None, content_type=None):
+        with self.lock:
+            self.clock += 1
+            self.objects[(bucket, key)] = {'Body': bytes(body), 'Metadata': dict(metadata or {}),
+                                           'ContentType': content_type, 'LastModified': self.clock}
+            self.puts.append(key)
+        return {'ETag': '"%d"' % self.clock}
+
+    def get(self, bucket, key, operation='HeadObject'):
+        if (bucket, key) not in self.objects:
+            raise client_error('404' if operation == 'HeadObject' else 'NoSuchKey', operation, 404)
+        return self.objects[(bucket, key)]
+
+    def body(self, bucket, key):
+        return self.get(bucket, key)['Body']
+
+    def head_object(self, Bucket, Key):
+        item = self.get(Bucket, Key)
+        return {'Metadata': dict(item['Metadata']), 'ContentLength': len(item['Body']),
+                'ContentType': item['ContentType']}
+
+    def get_object(self, Bucket, Key):
+        item = self.get(Bucket, Key, 'GetObject')
+        return {'Body': io.BytesIO(item['Body']), 'Metadata': dict(item['Metadata'])}
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, ContentType=None):
+        return self.store(Bucket, Key, Body, Metadata, ContentType)
+
+    def copy_object(self, Bucket, Key, CopySource, Metadata=None, MetadataDirective='COPY', ContentType=None):
+        source = self.get(CopySource['Bucket'], CopySource['Key'], 'CopyObject')
+        if MetadataDirective == 'COPY':
+            Metadata, ContentType = source['Metadata'], source['ContentType']
+        return self.store(Bucket, Key, source['Body'], Metadata, ContentType)
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, ContentType=None):
+        with self.lock:
+            upload_id = 'upload-%d' % (len(self.uploads) + 1)
+            self.uploads[upload_id] = {'parts': {}, 'Metadata': Metadata, 'ContentType': ContentType}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.uploads[UploadId]['parts'][PartNumber] = bytes(Body)
+        return {'ETag': '"%s-%d"' % (UploadId, PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        body = b''.join(upload['parts'][p['PartNumber']] for p in MultipartUpload['Parts'])
+        return self.store(Bucket, Key, body, upload['Metadata'], upload['ContentType'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, 'rb') as f:
+            self.store(Bucket, Key, f.read())
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        extra = ExtraArgs or {}
+        self.store(Bucket, Key, Fileobj.read(), extra.get('Metadata'), extra.get('ContentType'))
+
+    def download_file(self, Bucket, Key, Filename):
+        body = self.get(Bucket, Key)['Body']
+        with open(Filename, 'wb') as f:
+            f.write(body)
+
+    def delete_objects(self, Bucket, Delete):
+        with self.lock:
+            for item in Delete['Objects']:
+                self.objects.pop((Bucket, item['Key']), None)
+        return {}
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        return FakePaginator(self)
+
+
+def git(cwd, *args):
+    return subprocess.check_output(('git',) + args, cwd=cwd, stderr=subprocess.STDOUT).decode('utf-8').strip()
+
+
+def init_repo(path, branch='main'):
+    os.makedirs(path, exist_ok=True)
+    git(path, 'init', '-q', '-b', branch)
+    git(path, 'config', 'user.email', 'dev@example.com')
+    git(path, 'config', 'user.name', 'Developer')
+    # Lets file:// clones fetch commits by id and use partial clone filters
+    git(path, 'config', 'uploadpack.allowAnySHA1InWant', 'true')
+    git(path, 'config', 'uploadpack.allowFilter', 'true')
+    return path
+
+
+def write_files(path, files):
+    # files maps paths relative to path to their content, bytes or text, None removes the file
+    for name, content in files.items():
+        target = os.path.join(path, name)
+        if content is None:
+            os.remove(target)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+
+
+def commit(path, files, message='Change files'):
+    # Writes files and commits everything, returns the id of the new commit
+    write_files(path, files)
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '--allow-empty', '-m', message)
+    return git(path, 'rev-parse', 'HEAD')
+
+
+class GitDaemon(object):
+    # git daemon serving the repositories under base_path over git://127.0.0.1:<port>/, with fetches of any commit
+    # and partial clone filters allowed, the way the hosted Git services serve them
+    def __init__(self, base_path):
+        self.base_path = base_path
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        self.process = None
+
+    def url(self, name):
+        return 'git://127.0.0.1:%d/%s' % (self.port, name)
+
+    def __enter__(self):
+        self.process = subprocess.Popen(['git', '-c', 'uploadpack.allowFilter=true', '-c',
+                                         'uploadpack.allowAnySHA1InWant=true', 'daemon', '--export-all',
+                                         '--reuseaddr', '--listen=127.0.0.1', '--port=%d' % self.port,
+                                         '--base-path=' + self.base_path, self.base_path],
+                                        stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        raise Exception('git daemon did not start')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.process.terminate()
+        self.process.wait()
+        return False
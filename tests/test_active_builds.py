@@ -0,0 +1,53 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import builds
+import webhooks
+
+path = 'octo-org/octo-repo/main/'
+parent = '1' * 40
+child = '2' * 40
+
+
+def push(head_sha, base_sha):
+    return webhooks.PushRecord('github', 'push', 'octo-org/octo-repo', 'main', 'git@github.com:octo-org/octo-repo.git',
+                               head_sha=head_sha, base_sha=base_sha)
+
+
+def start(store, record, seq):
+    return builds.start_build(record, 'git2s3-keybucket', 'git2s3-outputbucket', seq, store)
+
+
+def test_push_on_top_of_the_running_build_stops_it(store, codebuild):
+    first = start(store, push(parent, '0' * 39 + '1'), 1)
+    second = start(store, push(child, parent), 2)
+    assert codebuild.stopped == [first]
+    assert store.get('active', path)['build_id'] == second
+
+
+def test_webhooks_delivered_out_of_order_keep_the_build_of_the_later_commit(store, codebuild):
+    # The webhook of the child commit is received before the one of its parent
+    first = start(store, push(child, parent), 1)
+    second = start(store, push(parent, '0' * 39 + '1'), 2)
+    assert codebuild.stopped == [second]
+    assert store.get('active', path)['build_id'] == first
+
+
+def test_unrelated_pushes_both_build(store, codebuild):
+    # A force push, the payloads do not order the commits and the builds compare them on the branch history
+    first = start(store, push(parent, '3' * 40), 1)
+    second = start(store, push(child, '4' * 40), 2)
+    assert codebuild.stopped == []
+    assert store.get('active', path)['build_id'] == second
+    assert first != second
+
+
+def test_new_branch_does_not_stop_anything(store, codebuild):
+    assert webhooks.PushRecord('github', 'push', 'o/r', 'main', 'url', base_sha='0' * 40).base_sha is None
+    start(store, push(parent, None), 1)
+    start(store, push(child, None), 2)
+    assert codebuild.stopped == []
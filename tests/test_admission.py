@@ -0,0 +1,215 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Admission control, and a discrete-event simulation of a webhook storm that reports queue latency per priority class
+
+import heapq
+import random
+import time
+import pytest
+import helpers
+import admission
+import build_events
+import clients
+import dedup
+import priority
+import webhooks
+
+keybucket = 'git2s3-keybucket'
+outputbucket = 'git2s3-outputbucket'
+
+
+class Clock(object):
+    # Simulated time, sleeping advances it
+    def __init__(self, start=1760000000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    simulated = Clock()
+    monkeypatch.setattr(time, 'time', simulated.time)
+    monkeypatch.setattr(time, 'sleep', simulated.sleep)
+    return simulated
+
+
+def push(repo, branch, sha=None):
+    return webhooks.PushRecord('github', 'push', repo, branch, 'git@github.com:%s.git' % repo, head_sha=sha,
+                               default_branch='main')
+
+
+def test_push_whose_build_fails_to_start_is_dropped(store, codebuild, clock, metrics, monkeypatch):
+    monkeypatch.setattr(admission, 'max_builds', 2)
+    broken = push('octo-org/broken', 'main', '1' * 40)
+    dedup.claim_commit(store, broken)
+    admission.defer(store, broken, keybucket, outputbucket, 1)
+    admission.defer(store, push('octo-org/app', 'main', '2' * 40), keybucket, outputbucket, 2)
+    codebuild.errors.append(helpers.client_error('InvalidInputException', 'StartBuild'))
+    assert admission.drain(store) == 1
+    # The push behind the broken one was started, and nothing is left waiting
+    assert codebuild.variables(codebuild.started[0])['GitUrl'] == 'git@github.com:octo-org/app.git'
+    assert store.list('backlog') == []
+    assert [m for m in metrics if m[0] == 'BuildsDropped'] == [('BuildsDropped', 1, {'Class': 'default'})]
+    # A redelivery of the webhook may start the build again
+    assert store.get('commit', broken.output_path) is None
+    assert len(store.list('slots')) == 1
+
+
+def test_throttled_push_keeps_its_place_and_expiry(store, codebuild, clock, monkeypatch):
+    monkeypatch.setattr(admission, 'max_builds', 2)
+    waiting = push('octo-org/app', 'feature')
+    admission.defer(store, waiting, keybucket, outputbucket, 1)
+    expires = store.get('backlog', waiting.output_path)['expires']
+    clock.sleep(3600)
+    codebuild.errors.extend(helpers.client_error('ThrottlingException', 'StartBuild') for _ in range(admission.attempts))
+    assert admission.drain(store) == 0
+    item = store.get('backlog', waiting.output_path)
+    assert item['expires'] == expires
+    assert item['queued'] == 1760000000
+    assert store.list('slots') == []
+    assert admission.drain(store) == 1
+
+
+def test_push_throttled_past_its_expiry_is_dropped(store, codebuild, clock, metrics, monkeypatch):
+    monkeypatch.setattr(admission, 'max_builds', 2)
+    waiting = push('octo-org/app', 'feature')
+    admission.defer(store, waiting, keybucket, outputbucket, 1, ttl=5)
+    items = store.list('backlog')
+    # Still listed while the throttled start_build calls back off past its expiry
+    monkeypatch.setattr(store, 'list', lambda namespace, list=store.list: items if namespace == 'backlog' else
+                        list(namespace))
+    codebuild.errors.extend(helpers.client_error('ThrottlingException', 'StartBuild') for _ in range(admission.attempts))
+    monkeypatch.setattr(admission.random, 'uniform', lambda low, high: high)
+    assert admission.drain(store) == 0
+    assert store.get('backlog', waiting.output_path) is None
+    assert [m for m in metrics if m[0] == 'BuildsDropped'] == [('BuildsDropped', 1, {'Class': 'other'})]
+
+
+def test_push_is_started_once_its_coalescing_window_passed(store, codebuild, clock):
+    admission.defer(store, push('octo-org/app', 'main', '1' * 40), keybucket, outputbucket, 1, delay=30)
+    clock.sleep(10)
+    admission.defer(store, push('octo-org/app', 'main', '2' * 40), keybucket, outputbucket, 2, delay=30)
+    admission.defer(store, push('octo-org/app', 'feature', '3' * 40), keybucket, outputbucket, 3)
+    # The push without a window does not wait for the others
+    assert admission.drain(store) == 1
+    clock.sleep(25)
+    assert admission.drain(store) == 0
+    clock.sleep(5)
+    assert admission.drain(store) == 1
+    assert [codebuild.variables(b)['HeadSha'] for b in codebuild.started] == ['3' * 40, '2' * 40]
+    assert store.list('backlog') == []
+
+
+class ThrottlingCodeBuild(helpers.FakeCodeBuild):
+    # Throttles a share of the start_build calls, like CodeBuild under a burst of requests
+    def __init__(self, rng, throttled=0.2):
+        helpers.FakeCodeBuild.__init__(self)
+        self.rng = rng
+        self.throttled = throttled
+
+    def start_build(self, projectName, environmentVariablesOverride):
+        if self.rng.random() < self.throttled:
+            raise helpers.client_error('ThrottlingException', 'StartBuild')
+        return helpers.FakeCodeBuild.start_build(self, projectName, environmentVariablesOverride)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def simulate(store, codebuild, clock, rng):
+    # A bot pushes to 200 repositories within two minutes while pushes to the default branch and release tags keep
+    # arriving. Builds run 2 to 10 minutes, the completion of each drains the backlog, as does the schedule every
+    # minute. Returns the largest number of builds running at once
+    events = []
+    start = clock.now
+    order = [0]
+
+    def schedule(at, kind, value):
+        order[0] += 1
+        heapq.heappush(events, (at, order[0], kind, value))
+
+    for n in range(200):
+        schedule(start + rng.uniform(0, 120), 'push', push('bot-org/repo-%03d' % n, 'deps/bump-%d' % n))
+    for n in range(30):
+        schedule(start + rng.uniform(0, 1800), 'push', push('octo-org/service-%02d' % n, 'main'))
+    for n in range(10):
+        schedule(start + rng.uniform(0, 1800), 'push', push('octo-org/product-%02d' % n, 'tags/v1.%d' % n))
+    schedule(start + 60, 'tick', None)
+
+    running = set()
+    peak = [0]
+    start_build = codebuild.start_build
+
+    def started(projectName, environmentVariablesOverride):
+        build = start_build(projectName, environmentVariablesOverride)
+        running.add(build['build']['id'])
+        peak[0] = max(peak[0], len(running))
+        schedule(clock.now + rng.uniform(120, 600), 'finish', build['build']['id'])
+        return build
+    codebuild.start_build = started
+
+    seq = 0
+    while events:
+        at, _, kind, value = heapq.heappop(events)
+        clock.now = max(clock.now, at)
+        if kind == 'push':
+            seq += 1
+            admission.submit(store, value, keybucket, outputbucket, seq)
+        elif kind == 'finish':
+            running.discard(value)
+            codebuild.finish(value)
+            build_events.complete(store, build_events.build_info_record(codebuild.builds[value]))
+            admission.drain(store)
+        elif kind == 'tick':
+            admission.drain(store)
+            if running or store.list('backlog'):
+                schedule(clock.now + 60, 'tick', None)
+    return peak[0]
+
+
+def latency_report(metrics):
+    latencies = {}
+    for name, value, dimensions in metrics:
+        if name == 'QueueLatency':
+            latencies.setdefault(dimensions['Class'], []).append(value)
+    print('\n%-8s %6s %8s %8s %8s' % ('class', 'pushes', 'p50 (s)', 'p95 (s)', 'max (s)'))
+    for name in ('release', 'default', 'other'):
+        values = latencies[name]
+        print('%-8s %6d %8d %8d %8d' % (name, len(values), percentile(values, 0.5), percentile(values, 0.95),
+                                        max(values)))
+    return latencies
+
+
+@pytest.mark.parametrize('aging', [300, 3600])
+def test_bursty_load_is_admitted_within_the_budget(store, clock, metrics, monkeypatch, aging):
+    rng = random.Random(23)
+    codebuild = ThrottlingCodeBuild(rng)
+    monkeypatch.setitem(clients.clients, 'codebuild', codebuild)
+    monkeypatch.setattr(admission, 'max_builds', 10)
+    monkeypatch.setattr(admission.random, 'uniform', rng.uniform)
+    monkeypatch.setattr(priority, 'aging', aging)
+    peak = simulate(store, codebuild, clock, rng)
+    # Every push was built, never more than the budget at once, and nothing is left behind
+    assert len(codebuild.started) == 240
+    assert peak == 10
+    assert store.list('backlog') == []
+    assert store.list('slots') == []
+    assert [m for m in metrics if m[0] == 'BuildsDropped'] == []
+    latencies = latency_report(metrics)
+    assert sum(len(v) for v in latencies.values()) == 240
+    if aging > 1800:
+        # Releases and default branch pushes overtake the storm of bot pushes
+        assert percentile(latencies['release'], 0.95) < percentile(latencies['other'], 0.5)
+        assert percentile(latencies['default'], 0.95) < percentile(latencies['other'], 0.5)
@@ -0,0 +1,71 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import random
+from ipaddress import ip_address, ip_network
+import allowlist
+
+github_hooks = '192.30.252.0/22,185.199.108.0/22,140.82.112.0/20,143.55.64.0/20,2a0a:a440::/29,2606:50c0::/32'
+
+
+def linear(ranges, address):
+    # The check the index replaced, every range is tested in turn
+    ip = ip_address(address)
+    return any(ip in ip_network(r.strip()) for r in ranges.split(',') if r.strip())
+
+
+def test_ipv4_and_ipv6_membership():
+    index = allowlist.AllowList(github_hooks)
+    assert '192.30.252.1' in index
+    assert '140.82.127.255' in index
+    assert '140.82.128.0' not in index
+    assert '2a0a:a440::1' in index
+    assert '2606:50c1::1' not in index
+    assert '10.0.0.1' not in index
+
+
+def test_range_boundaries():
+    index = allowlist.AllowList('10.0.0.0/24')
+    assert '10.0.0.0' in index
+    assert '10.0.0.255' in index
+    assert '9.255.255.255' not in index
+    assert '10.0.1.0' not in index
+
+
+def test_overlapping_and_adjacent_ranges_are_collapsed():
+    index = allowlist.AllowList('10.0.0.0/24, 10.0.1.0/24,10.0.0.128/25,,10.0.0.7/32')
+    assert index.intervals[4] == ([int(ip_address('10.0.0.0'))], [int(ip_address('10.0.1.255'))])
+    assert index.intervals[6] == ([], [])
+
+
+def test_single_addresses_and_empty_lists():
+    assert '1.2.3.4' in allowlist.AllowList('1.2.3.4')
+    assert '1.2.3.5' not in allowlist.AllowList('1.2.3.4')
+    assert '1.2.3.4' not in allowlist.AllowList('')
+    assert '::1' not in allowlist.AllowList(' ')
+
+
+def test_matches_the_linear_check():
+    generator = random.Random(3)
+    ranges = ','.join(['%d.%d.%d.0/%d' % (generator.randrange(256), generator.randrange(256), generator.randrange(256),
+                                         generator.choice((16, 20, 24, 28, 32))) for _ in range(200)] +
+                      ['2001:db8:%x::/48' % generator.randrange(65536) for _ in range(50)])
+    ranges = ','.join(str(ip_network(r, strict=False)) for r in ranges.split(','))
+    index = allowlist.AllowList(ranges)
+    networks = [ip_network(r) for r in ranges.split(',')]
+    addresses = [str(n[generator.randrange(n.num_addresses)]) for n in generator.sample(networks, 100)]
+    addresses += ['%d.%d.%d.%d' % tuple(generator.randrange(256) for _ in range(4)) for _ in range(500)]
+    addresses += ['2001:db8:%x::%x' % (generator.randrange(65536), generator.randrange(65536)) for _ in range(200)]
+    for address in addresses:
+        assert (address in index) == linear(ranges, address), address
+
+
+def test_index_is_cached_per_stage_variable(monkeypatch):
+    monkeypatch.setattr(allowlist, 'allowlists', {})
+    first = allowlist.get_allowlist(github_hooks)
+    assert allowlist.get_allowlist(github_hooks) is first
+    assert allowlist.get_allowlist('10.0.0.0/8') is not first
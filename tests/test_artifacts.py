@@ -0,0 +1,80 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import json
+import pytest
+import artifacts
+import webhooks
+
+bucket = 'git2s3-outputbucket'
+url = 'git@github.com:octo-org/octo-repo.git'
+head_sha = '9f2c4e1b7a3d5c8e0f1a2b3c4d5e6f708192a3b4'
+main_key = 'octo-org/octo-repo/main/octo-org_octo-repo.zip'
+tag_key = 'octo-org/octo-repo/tags/v1.0.0/octo-org_octo-repo.zip'
+
+
+@pytest.fixture(autouse=True)
+def heads(monkeypatch):
+    monkeypatch.setattr(artifacts, 'heads', {})
+
+
+@pytest.fixture
+def exported(store, s3):
+    # Artifact and commit file the build of head_sha on main wrote
+    s3.put_object(Bucket=bucket, Key=main_key, Body=b'archive', ContentType='application/zip',
+                  Metadata={'commit-sha': head_sha, 'build-seq': '1'})
+    s3.put_object(Bucket=bucket, Key='octo-org/octo-repo/main/octo-org_octo-repo.commit.json',
+                  Body=json.dumps({'commit': head_sha, 'message': 'Update the README', 'branch': 'main',
+                                   'build-seq': 1}).encode('utf-8'))
+    artifacts.record_export(store, url, head_sha, bucket, main_key)
+    return s3
+
+
+def tag_push(sha=head_sha):
+    return webhooks.PushRecord('github', 'push', 'octo-org/octo-repo', 'tags/v1.0.0', url, head_sha=sha)
+
+
+def test_same_path_is_exported(exported):
+    assert artifacts.is_exported(bucket, main_key, head_sha)
+    assert not artifacts.is_exported(bucket, main_key, '1' * 40)
+    assert not artifacts.is_exported(bucket, main_key, None)
+
+
+def test_commit_exported_on_another_path_is_copied(store, exported):
+    assert not artifacts.is_exported(bucket, tag_key, head_sha)
+    assert artifacts.copy_export(store, tag_push(), bucket, tag_key, 2)
+    copied = exported.objects[(bucket, tag_key)]
+    assert copied['Body'] == b'archive'
+    assert copied['Metadata'] == {'commit-sha': head_sha, 'build-seq': '2'}
+    assert copied['ContentType'] == 'application/zip'
+    info = json.loads(exported.body(bucket, 'octo-org/octo-repo/tags/v1.0.0/octo-org_octo-repo.commit.json'))
+    assert info == {'commit': head_sha, 'message': 'Update the README', 'branch': 'tags/v1.0.0', 'build-seq': 2}
+    # A redelivery finds the copy
+    assert artifacts.is_exported(bucket, tag_key, head_sha)
+
+
+def test_other_commits_are_built(store, exported):
+    assert not artifacts.copy_export(store, tag_push('1' * 40), bucket, tag_key, 2)
+    assert (bucket, tag_key) not in exported.objects
+
+
+def test_source_replaced_by_a_newer_commit_is_not_copied(store, exported):
+    exported.put_object(Bucket=bucket, Key=main_key, Body=b'newer', Metadata={'commit-sha': '2' * 40})
+    assert not artifacts.copy_export(store, tag_push(), bucket, tag_key, 2)
+    assert (bucket, tag_key) not in exported.objects
+
+
+def test_existing_artifact_is_left_to_the_build(store, exported):
+    exported.put_object(Bucket=bucket, Key=tag_key, Body=b'older', Metadata={'commit-sha': '3' * 40})
+    assert not artifacts.copy_export(store, tag_push(), bucket, tag_key, 2)
+    assert exported.body(bucket, tag_key) == b'older'
+
+
+def test_failed_copy_falls_back_to_a_build(store, exported):
+    del exported.objects[(bucket, 'octo-org/octo-repo/main/octo-org_octo-repo.commit.json')]
+    assert not artifacts.copy_export(store, tag_push(), bucket, tag_key, 2)
+    assert (bucket, tag_key) not in exported.objects
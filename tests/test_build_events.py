@@ -0,0 +1,106 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Replays recorded CodeBuild state-change events through the completion handler
+
+import pytest
+import helpers
+import active_builds
+import admission
+import artifacts
+import build_events
+import dedup
+import webhooks
+
+build_id = 'git2s3-build:6e1d4a52-4c8b-4f7e-9a3f-2b1e0c9d8a71'
+path = 'octo-org/octo-repo/main/'
+head_sha = '9f2c4e1b7a3d5c8e0f1a2b3c4d5e6f708192a3b4'
+
+
+def replay(name, **detail):
+    event = helpers.load_fixture('codebuild', name)
+    event['detail'].update(detail)
+    return build_events.lambda_handler(event, None)
+
+
+@pytest.fixture
+def running(store, codebuild):
+    # State the webhook function leaves behind after starting the build of the recorded events
+    active_builds.track(store, codebuild, path, build_id, 1760773512345, repo='octo-org/octo-repo', head_sha=head_sha)
+    store.put('slots', 'slot-0', {'path': path, 'seq': 1760773512345, 'build_id': build_id})
+    dedup.claim_commit(store, webhooks.PushRecord('github', 'push', 'octo-org/octo-repo', 'main',
+                                                  'git@github.com:octo-org/octo-repo.git', head_sha=head_sha))
+    return store
+
+
+def test_succeeded_event_records_the_exported_commit(running):
+    record = replay('build-succeeded.json')
+    assert record['build_id'] == build_id
+    assert record['status'] == 'SUCCEEDED'
+    assert record['commit_id'] == '9f2c4e1'
+    assert record['commit_message'] == 'Update the README'
+    assert record['output_path'] == path
+    assert running.get('active', path) is None
+    assert running.get('slots', 'slot-0') is None
+    assert active_builds.average_duration(running, 'octo-org/octo-repo') is not None
+    # The commit is exported, a redelivery of its webhook must not build it again
+    assert running.get('commit', path) == {'sha': head_sha, 'expires': running.get('commit', path)['expires']}
+    # Other branches and tags of the commit copy its artifact
+    exported = running.get('exported', artifacts.export_key('git@github.com:octo-org/octo-repo.git', head_sha))
+    assert exported['key'] == path + 'octo-org_octo-repo.zip'
+
+
+def test_failed_event_falls_back_to_the_pushed_commit(running):
+    record = replay('build-failed.json')
+    assert record['status'] == 'FAILED'
+    assert record['commit_id'] == head_sha
+    assert record['commit_message'] == 'Update the README'
+    assert running.get('active', path) is None
+    assert running.get('slots', 'slot-0') is None
+    assert active_builds.average_duration(running, 'octo-org/octo-repo') is None
+    # A redelivery of the webhook may start another build
+    assert running.get('commit', path) is None
+    assert running.list('exported') == []
+
+
+def test_in_progress_event_is_ignored(running):
+    assert replay('build-in-progress.json') is None
+    assert running.get('active', path)['build_id'] == build_id
+    assert running.get('slots', 'slot-0') is not None
+
+
+def test_stopped_superseded_build_keeps_the_newer_build_active(running, codebuild):
+    newer = 'git2s3-build:00000000-0000-4000-8000-000000000002'
+    active_builds.track(running, codebuild, path, newer, 1760773599999, repo='octo-org/octo-repo', head_sha='2' * 40,
+                        base_sha=head_sha)
+    assert codebuild.stopped == [build_id]
+    running.put('slots', 'slot-1', {'path': path, 'seq': 1760773599999, 'build_id': newer})
+    replay('build-stopped.json')
+    assert running.get('active', path)['build_id'] == newer
+    assert running.get('slots', 'slot-0') is None
+    assert running.get('slots', 'slot-1') is not None
+
+
+def test_replayed_event_does_not_free_a_reused_slot(running):
+    replay('build-succeeded.json')
+    running.put('slots', 'slot-0', {'path': 'other/repo/main/', 'seq': 2, 'build_id': 'git2s3-build:other'})
+    replay('build-succeeded.json')
+    assert running.get('slots', 'slot-0')['build_id'] == 'git2s3-build:other'
+
+
+def test_completion_starts_the_next_deferred_push(running, codebuild, monkeypatch):
+    monkeypatch.setattr(admission, 'max_builds', 1)
+    push = webhooks.PushRecord('github', 'push', 'octo-org/octo-repo', 'feature', 'git@github.com:octo-org/octo-repo.git',
+                               head_sha='1' * 40)
+    admission.defer(running, push, 'git2s3-keybucket', 'git2s3-outputbucket', 1760773600000)
+    replay('build-succeeded.json')
+    assert running.list('backlog') == []
+    assert len(codebuild.started) == 1
+    variables = codebuild.variables(codebuild.started[0])
+    assert variables['Branch'] == 'feature'
+    assert variables['AdmissionSlot'] == 'slot-0'
+    assert running.get('slots', 'slot-0')['build_id'] == codebuild.started[0]
@@ -0,0 +1,86 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Runs the scheduled poll of build_events against an in-memory CodeBuild project
+
+import time
+import active_builds
+import build_events
+
+path = 'octo-org/octo-repo/main/'
+
+
+def start(store, codebuild, slot, seq, track=True):
+    # Starts a build of path the way admission does, holding slot, for a push of commit seq on top of commit seq - 1
+    variables = {'GitUrl': 'git@github.com:octo-org/octo-repo.git', 'Branch': 'main', 'outputbucketpath': path,
+                 'HeadSha': '%040d' % seq, 'AdmissionSlot': slot}
+    build_id = codebuild.start_build(codebuild.project, [{'name': k, 'value': v} for k, v in variables.items()])['build']['id']
+    store.put('slots', slot, {'path': path, 'seq': seq, 'build_id': build_id})
+    if track:
+        active_builds.track(store, codebuild, path, build_id, seq, repo='octo-org/octo-repo', head_sha='%040d' % seq,
+                            base_sha='%040d' % (seq - 1))
+    return build_id
+
+
+def poll():
+    return build_events.lambda_handler({'detail-type': 'Scheduled Event'}, None)
+
+
+def test_missed_completion_frees_the_slot(store, codebuild):
+    build_id = start(store, codebuild, 'slot-0', 1)
+    codebuild.finish(build_id)
+    assert poll()['polled'] == 1
+    assert store.get('active', path) is None
+    assert store.get('slots', 'slot-0') is None
+
+
+def test_running_build_is_not_polled_again_before_it_is_due(store, codebuild):
+    start(store, codebuild, 'slot-0', 1)
+    assert poll()['polled'] == 1
+    assert store.get('active', path)['next_poll'] > int(time.time())
+    assert poll()['polled'] == 0
+    assert len(codebuild.batches) == 1
+
+
+def test_superseded_build_frees_its_slot_when_it_finishes(store, codebuild):
+    older = start(store, codebuild, 'slot-0', 1)
+    # Tracking the newer build stops the older one, its completion event is missed
+    newer = start(store, codebuild, 'slot-1', 2)
+    assert codebuild.stopped == [older]
+    assert poll()['polled'] == 2
+    assert store.get('slots', 'slot-0') is None
+    assert store.get('slots', 'slot-1')['build_id'] == newer
+    assert store.get('active', path)['build_id'] == newer
+
+
+def test_superseded_build_that_still_runs_is_polled_every_time(store, codebuild):
+    older = start(store, codebuild, 'slot-0', 1, track=False)
+    newer = start(store, codebuild, 'slot-1', 2)
+    assert poll()['polled'] == 2
+    # The newer build is not due yet, the older one holds a slot and is looked up again
+    assert poll()['polled'] == 1
+    assert codebuild.batches[-1] == [older]
+    codebuild.finish(older, 'STOPPED')
+    poll()
+    assert store.get('slots', 'slot-0') is None
+    assert store.get('active', path)['build_id'] == newer
+
+
+def test_slot_of_a_build_codebuild_does_not_know_is_freed(store, codebuild):
+    store.put('slots', 'slot-0', {'path': path, 'seq': 1, 'build_id': 'git2s3-build:missing'})
+    store.put('slots', 'slot-1', {'path': path, 'seq': 2})
+    assert poll()['polled'] == 1
+    assert store.get('slots', 'slot-0') is None
+    # A slot that is claimed but whose build is not started yet is left alone
+    assert store.get('slots', 'slot-1') is not None
+
+
+def test_builds_are_looked_up_in_batches_of_100(store, codebuild):
+    for n in range(250):
+        start(store, codebuild, 'slot-%d' % n, n, track=False)
+    assert poll()['polled'] == 250
+    assert [len(batch) for batch in codebuild.batches] == [100, 100, 50]
@@ -0,0 +1,102 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Checkouts of local stand-in repositories, served by git daemon or over file://, with the clone filters and sparse
+# checkout patterns of RepoConfig
+
+import os
+import pytest
+import helpers
+import build
+
+large = os.urandom(2 * 1024 * 1024)
+
+
+@pytest.fixture
+def remote(tmpdir, monkeypatch):
+    path = helpers.init_repo(str(tmpdir.join('repos', 'monorepo.git')))
+    helpers.commit(path, {'README.md': 'readme', 'services/api/app.py': 'print("api")\n',
+                          'services/web/app.py': 'print("web")\n', 'assets/video.bin': large})
+    for name in ('CacheBucket', 'Lfs', 'Submodules', 'Directories', 'SparsePatterns', 'CloneFilter'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('GitUrl', 'file://' + path)
+    monkeypatch.setenv('Branch', 'main')
+    monkeypatch.setenv('HeadSha', '')
+    # With the .git directory the build always clones
+    monkeypatch.setenv('exclude_git', 'False')
+    return path
+
+
+def missing_objects(directory):
+    # Objects of HEAD that a partial clone has not fetched, listed without fetching them
+    listed = helpers.git(directory, 'rev-list', '--objects', '--missing=print', 'HEAD').splitlines()
+    return set(line[1:] for line in listed if line.startswith('?'))
+
+
+def blob(remote, path):
+    return helpers.git(remote, 'rev-parse', 'HEAD:' + path)
+
+
+def files(directory):
+    return sorted(os.path.relpath(os.path.join(d, f), directory) for d, dirs, names in os.walk(directory)
+                  if '.git' not in os.path.relpath(d, directory).split(os.sep) for f in names)
+
+
+def test_full_checkout(remote, tmpdir):
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert files(directory) == ['README.md', 'assets/video.bin', 'services/api/app.py', 'services/web/app.py']
+    assert missing_objects(directory) == set()
+
+
+def test_filter_and_sparse_patterns_skip_the_blobs_of_excluded_paths(remote, tmpdir, monkeypatch):
+    monkeypatch.setenv('CloneFilter', 'blob:none')
+    monkeypatch.setenv('SparsePatterns', '/*\n!/assets/')
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert files(directory) == ['README.md', 'services/api/app.py', 'services/web/app.py']
+    assert missing_objects(directory) == set([blob(remote, 'assets/video.bin')])
+
+
+def test_size_filter_fetches_small_blobs_up_front(remote, tmpdir, monkeypatch):
+    monkeypatch.setenv('CloneFilter', 'blob:limit=1m')
+    monkeypatch.setenv('SparsePatterns', '/services/')
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert files(directory) == ['services/api/app.py', 'services/web/app.py']
+    # README.md is small enough to come with the commit even though it is not checked out
+    assert missing_objects(directory) == set([blob(remote, 'assets/video.bin')])
+
+
+def test_directories_check_out_only_their_paths(remote, tmpdir, monkeypatch):
+    monkeypatch.setenv('CloneFilter', 'blob:none')
+    monkeypatch.setenv('Directories', 'services/api')
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert files(directory) == ['services/api/app.py']
+    assert blob(remote, 'services/web/app.py') in missing_objects(directory)
+
+
+def test_pushed_commit_is_checked_out_after_the_branch_moved_on(remote, tmpdir, monkeypatch):
+    pushed = helpers.git(remote, 'rev-parse', 'HEAD')
+    helpers.commit(remote, {'README.md': 'newer'})
+    monkeypatch.setenv('CloneFilter', 'blob:none')
+    monkeypatch.setenv('HeadSha', pushed)
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert helpers.git(directory, 'rev-parse', 'HEAD') == pushed
+
+
+def test_partial_clone_from_git_daemon(remote, tmpdir, monkeypatch):
+    with helpers.GitDaemon(str(tmpdir.join('repos'))) as daemon:
+        monkeypatch.setenv('GitUrl', daemon.url('monorepo.git'))
+        monkeypatch.setenv('CloneFilter', 'blob:none')
+        monkeypatch.setenv('SparsePatterns', '/*\n!/assets/')
+        directory = str(tmpdir.join('build'))
+        build.checkout(directory)
+        assert files(directory) == ['README.md', 'services/api/app.py', 'services/web/app.py']
+        assert missing_objects(directory) == set([blob(remote, 'assets/video.bin')])
@@ -0,0 +1,37 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+import bench_import_time  # noqa: E402
+
+# Modules a cold start of the webhook handlers must not import, boto3 is only imported when a client is needed
+slow_modules = ('boto3', 'botocore', 'distutils', 'pkg_resources')
+
+
+@pytest.mark.parametrize('handler', bench_import_time.handlers)
+def test_handlers_import_without_boto3(handler):
+    imported = bench_import_time.import_times(handler)
+    assert handler in imported
+    assert not [m for m in imported if m.split('.')[0] in slow_modules]
+
+
+def test_stdlib_ipaddress_is_used():
+    import allowlist
+    import ipaddress
+    assert os.path.dirname(ipaddress.__file__) != os.path.dirname(allowlist.__file__)
+    assert not os.path.exists(os.path.join(os.path.dirname(allowlist.__file__), 'ipaddress.py'))
+
+
+def test_codebuild_client_is_reused(monkeypatch):
+    import clients
+    monkeypatch.setattr(clients, 'clients', {})
+    first = clients.get_client('codebuild')
+    assert clients.get_client('codebuild') is first
@@ -0,0 +1,128 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import pytest
+import dedup
+import webhooks
+
+
+def push(head_sha, branch='main', delivery_id=None):
+    record = webhooks.PushRecord('github', 'push', 'octo-org/octo-repo', branch,
+                                 'git@github.com:octo-org/octo-repo.git', head_sha=head_sha)
+    record.delivery_id = delivery_id
+    return record
+
+
+def test_redelivered_delivery_is_claimed_once(store):
+    assert dedup.claim_delivery(store, push('a' * 40, delivery_id='d1'))
+    assert not dedup.claim_delivery(store, push('a' * 40, delivery_id='d1'))
+    assert dedup.claim_delivery(store, push('a' * 40, delivery_id='d2'))
+
+
+def test_same_commit_is_claimed_once_per_branch(store):
+    assert dedup.claim_commit(store, push('a' * 40))
+    assert not dedup.claim_commit(store, push('a' * 40))
+    assert dedup.claim_commit(store, push('a' * 40, branch='release'))
+
+
+def test_branch_moved_back_to_an_earlier_commit_is_claimed(store):
+    # A force push that rolls the branch back to a commit built earlier needs a build of that commit
+    assert dedup.claim_commit(store, push('a' * 40))
+    assert dedup.claim_commit(store, push('b' * 40))
+    assert dedup.claim_commit(store, push('a' * 40))
+    assert not dedup.claim_commit(store, push('a' * 40))
+
+
+def test_release_keeps_a_newer_claim(store):
+    dedup.claim_commit(store, push('a' * 40))
+    dedup.claim_commit(store, push('b' * 40))
+    dedup.release_commit(store, 'octo-org/octo-repo/main/', 'a' * 40)
+    assert not dedup.claim_commit(store, push('b' * 40))
+    dedup.release(store, push('b' * 40))
+    assert dedup.claim_commit(store, push('b' * 40))
+
+
+def test_pushes_without_a_commit_are_always_claimed(store):
+    assert dedup.claim_commit(store, push(None))
+    assert dedup.claim_commit(store, push(None))
+
+
+def deliver_push(after, delivery_id):
+    import helpers
+    import lambda_function
+    fixture = helpers.load_fixture('webhooks', 'github-push.json')
+    context = {'key-bucket': 'git2s3-keybucket', 'output-bucket': 'git2s3-outputbucket', 'public-key': '',
+               'allowed-ips': '192.30.252.0/22', 'source-ip': '192.30.252.10', 'api-secrets': '', 'raw-body': '',
+               'request-id': 'r'}
+    body = dict(fixture['body'], after=after, head_commit=dict(fixture['body']['head_commit'], id=after))
+    headers = dict(fixture['headers'], **{'X-GitHub-Delivery': delivery_id})
+    return lambda_function.lambda_handler({'params': {'header': headers}, 'body-json': body, 'context': context}, None)
+
+
+def export(s3, commit):
+    s3.put_object(Bucket='git2s3-outputbucket', Key='octo-org/octo-repo/main/octo-org_octo-repo.zip',
+                  Metadata={'commit-sha': commit})
+
+
+def test_rollback_push_starts_a_build(store, codebuild, s3):
+    export(s3, 'a' * 40)
+    assert deliver_push('b' * 40, 'd1')
+    export(s3, 'b' * 40)
+    # The branch is force pushed back to the first commit within the dedup window and the cache time of the
+    # artifact's commit
+    assert deliver_push('a' * 40, 'd2')
+    assert len(codebuild.started) == 2
+    assert codebuild.variables(codebuild.started[1])['HeadSha'] == 'a' * 40
+
+
+def test_rollback_push_during_the_build_of_the_newer_commit_starts_a_build(store, codebuild, s3):
+    export(s3, 'a' * 40)
+    assert deliver_push('b' * 40, 'd1')
+    # The artifact still holds the first commit, the build of the second one would replace it
+    assert deliver_push('a' * 40, 'd2')
+    assert len(codebuild.started) == 2
+
+
+def test_push_of_the_exported_commit_is_skipped(store, codebuild, s3, metrics):
+    export(s3, 'a' * 40)
+    assert deliver_push('a' * 40, 'd1') is None
+    assert codebuild.started == []
+    assert ('BuildsAvoided', 1, {'Reason': 'AlreadyExported'}) in metrics
+
+
+def test_failed_export_check_releases_the_claims(store, codebuild, s3, monkeypatch):
+    monkeypatch.setattr(s3, 'head_object', lambda Bucket, Key: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        deliver_push('a' * 40, 'd1')
+    assert store.list('delivery') == []
+    assert store.list('commit') == []
+    # The retry of the delivery by the provider starts the build
+    monkeypatch.delattr(s3, 'head_object')
+    assert deliver_push('a' * 40, 'd1')
+    assert len(codebuild.started) == 1
+
+
+def test_coalesced_pushes_build_once_from_the_backlog(store, codebuild, s3, monkeypatch):
+    import itertools
+    import active_builds
+    import admission
+    import build_events
+    import time
+    monkeypatch.setattr(admission, 'coalesce_window', 30)
+    # Both webhooks may be handled within the same millisecond
+    monkeypatch.setattr(active_builds, 'next_seq', itertools.count(1).__next__)
+    monkeypatch.setattr(time, 'sleep', lambda seconds: pytest.fail('The webhook function waited'))
+    assert deliver_push('a' * 40, 'd1') is None
+    assert deliver_push('b' * 40, 'd2') is None
+    assert codebuild.started == []
+    item = store.get('backlog', 'octo-org/octo-repo/main/')
+    assert item['push']['head_sha'] == 'b' * 40
+    # The scheduled drain starts the newest push once the window passed
+    assert build_events.lambda_handler({'detail-type': 'Scheduled Event'}, None)['started'] == 0
+    monkeypatch.setattr(time, 'time', lambda: item['not_before'])
+    assert build_events.lambda_handler({'detail-type': 'Scheduled Event'}, None)['started'] == 1
+    assert codebuild.variables(codebuild.started[0])['HeadSha'] == 'b' * 40
@@ -0,0 +1,137 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import copy
+import hashlib
+import hmac
+import json
+import pytest
+import helpers
+import event_filter
+import lambda_function
+import webhooks
+
+secret = 'webhook-secret'
+
+
+def fixture(name):
+    return copy.deepcopy(helpers.load_fixture('webhooks', name))
+
+
+def reason(name, event_type=None, **changes):
+    # Skip reason of the fixture with changes applied to its body, event_type defaults to the one of its headers
+    loaded = fixture(name)
+    body = dict(loaded['body'], **changes)
+    headers = webhooks.get_headers({'params': {'header': loaded['headers']}})
+    parser, header_event_type = webhooks.get_parser(headers, body)
+    return event_filter.skip_reason(parser, body, event_type or header_event_type)
+
+
+def test_pushes_need_a_build():
+    for name in ('github-push.json', 'github-release.json', 'gitlab-push.json', 'gitlab-tag-push.json',
+                 'bitbucket-cloud-push.json', 'bitbucket-server-push.json', 'bitbucket-server-pr-opened.json'):
+        assert reason(name) is None, name
+
+
+def test_github_events_without_a_build():
+    assert reason('github-ping.json') == 'Ping'
+    assert reason('github-push.json', 'issue_comment') == 'Comment'
+    assert reason('github-push.json', 'pull_request') == 'EventType'
+    assert reason('github-push.json', deleted=True) == 'BranchDeleted'
+    assert reason('github-push.json', after='0' * 40) == 'BranchDeleted'
+    assert reason('github-release.json', action='created') == 'EventType'
+
+
+def test_gitlab_events_without_a_build():
+    assert reason('gitlab-push.json', 'Note Hook', object_kind='note') == 'Comment'
+    assert reason('gitlab-push.json', 'Merge Request Hook', object_kind='merge_request') == 'EventType'
+    assert reason('gitlab-push.json', after='0' * 40) == 'BranchDeleted'
+
+
+def test_bitbucket_server_events_without_a_build():
+    assert reason('bitbucket-server-push.json', 'diagnostics:ping') == 'Ping'
+    assert reason('bitbucket-server-pr-opened.json', 'pr:comment:added') == 'Comment'
+    assert reason('bitbucket-server-pr-opened.json', 'pr:merged') == 'EventType'
+    assert reason('bitbucket-server-push.json', 'pr:from_ref_updated') is None
+    body = fixture('bitbucket-server-push.json')['body']
+    assert reason('bitbucket-server-push.json', changes=[dict(body['changes'][0], type='DELETE')]) == 'BranchDeleted'
+    assert reason('bitbucket-server-push.json', 'repo:modified', changes=[]) == 'EventType'
+
+
+def test_bitbucket_cloud_events_without_a_build():
+    assert reason('bitbucket-cloud-push.json', 'repo:commit_comment_created') == 'Comment'
+    assert reason('bitbucket-cloud-push.json', 'pullrequest:created') == 'EventType'
+    body = fixture('bitbucket-cloud-push.json')['body']
+    deleted = dict(body['push']['changes'][0], new=None)
+    assert reason('bitbucket-cloud-push.json', push={'changes': [deleted]}) == 'BranchDeleted'
+
+
+@pytest.mark.parametrize('message', ['Update the docs [skip ci]', '[CI SKIP] typo', 'Bump version [no ci]',
+                                     'Release notes\n\n[skip git2s3]'])
+def test_skip_marker_in_the_head_commit_message(message):
+    body = fixture('github-push.json')['body']
+    assert reason('github-push.json', head_commit=dict(body['head_commit'], message=message)) == 'SkipMarker'
+
+
+def test_skip_marker_of_other_providers():
+    body = fixture('gitlab-push.json')['body']
+    commits = [dict(c, message=c['message'] + ' [skip ci]') for c in body['commits']]
+    assert reason('gitlab-push.json', commits=commits) == 'SkipMarker'
+    body = fixture('bitbucket-cloud-push.json')['body']
+    change = body['push']['changes'][0]
+    change['new']['target']['message'] = '[ci skip] Add the deployment notes'
+    assert reason('bitbucket-cloud-push.json', push=body['push']) == 'SkipMarker'
+    # A message that only mentions CI does not skip the build
+    body = fixture('github-push.json')['body']
+    assert reason('github-push.json', head_commit=dict(body['head_commit'], message='Skip CI on docs')) is None
+
+
+def test_skip_authors(monkeypatch):
+    monkeypatch.setattr(event_filter, 'skip_authors', event_filter.author_pattern('dependabot[bot], renovate*'))
+    body = fixture('github-push.json')['body']
+    assert reason('github-push.json', sender=dict(body['sender'], login='dependabot[bot]')) == 'SkipAuthor'
+    assert reason('github-push.json', sender=dict(body['sender'], login='renovate-bot')) == 'SkipAuthor'
+    assert reason('github-push.json', sender=dict(body['sender'], login='dependabot')) is None
+    assert reason('gitlab-push.json', user_username='renovate') == 'SkipAuthor'
+    assert event_filter.author_pattern(' , ') is None
+
+
+def deliver(name, signed, **changes):
+    # Sends the fixture to the webhook function from outside the allowed IP ranges, signed with secret or not
+    loaded = fixture(name)
+    body = dict(loaded['body'], **changes)
+    raw_body = json.dumps(body)
+    headers = dict((k, v) for k, v in loaded['headers'].items() if not k.lower().startswith('x-hub-signature'))
+    if signed:
+        headers['X-Hub-Signature-256'] = 'sha256=' + hmac.new(secret.encode('utf-8'), raw_body.encode('utf-8'),
+                                                              hashlib.sha256).hexdigest()
+    context = {'key-bucket': 'git2s3-keybucket', 'output-bucket': 'git2s3-outputbucket', 'public-key': '',
+               'allowed-ips': '', 'source-ip': '203.0.113.10', 'api-secrets': secret, 'raw-body': raw_body,
+               'request-id': 'r'}
+    return lambda_function.lambda_handler({'params': {'header': headers}, 'body-json': body, 'context': context},
+                                          None)
+
+
+def test_skipped_events_are_authenticated_first(metrics):
+    with pytest.raises(Exception, match='not allowed'):
+        deliver('github-push.json', False, deleted=True)
+    assert metrics == []
+    assert deliver('github-push.json', True, deleted=True) is None
+    assert metrics == [('BuildsAvoided', 1, {'Reason': 'BranchDeleted'})]
+
+
+def test_organization_ping_is_answered_without_a_repository(metrics):
+    assert deliver('github-ping.json', False) is None
+    assert metrics == []
+
+
+def test_ping_of_a_repository_webhook_is_authenticated(metrics):
+    repository = fixture('github-push.json')['body']['repository']
+    with pytest.raises(Exception, match='not allowed'):
+        deliver('github-ping.json', False, repository=repository)
+    assert deliver('github-ping.json', True, repository=repository) is None
+    assert metrics == [('BuildsAvoided', 1, {'Reason': 'Ping'})]
@@ -0,0 +1,111 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import hashlib
+import json
+import pytest
+import helpers
+import exploded
+import package
+
+bucket = 'git2s3-outputbucket'
+key = 'octo-org/octo-repo/main/octo-org_octo-repo.manifest.json'
+prefix = 'octo-org/octo-repo/main/octo-org_octo-repo/'
+commit_file = 'octo-org/octo-repo/main/octo-org_octo-repo.commit.json'
+
+
+@pytest.fixture
+def remote(tmpdir, monkeypatch):
+    path = helpers.init_repo(str(tmpdir.join('remote')))
+    monkeypatch.setenv('GitUrl', 'file://' + path)
+    monkeypatch.setenv('Branch', 'main')
+    monkeypatch.setattr(package, 'tips', {})
+    return path
+
+
+def publish(s3, remote, commit, seq, monkeypatch):
+    # Publishes the checkout in remote as the build of commit with sequence number seq
+    monkeypatch.setenv('HeadSha', commit)
+    monkeypatch.setenv('CommitMessage', 'Change files')
+    return package.package_tree(s3, remote, bucket, key, {'build-seq': '%d' % seq, 'commit-sha': commit}, None,
+                                True, 'exploded', 'Change files')
+
+
+def manifest(s3):
+    return json.loads(s3.body(bucket, key))
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_first_build_uploads_every_file(remote, monkeypatch):
+    s3 = helpers.FakeS3()
+    commit = helpers.commit(remote, {'README.md': 'readme', 'src/app.py': 'print(1)\n', 'assets/logo.png': b'\x89PNG'})
+    publish(s3, remote, commit, 1, monkeypatch)
+    assert sorted(s3.puts[:3]) == [prefix + 'README.md', prefix + 'assets/logo.png', prefix + 'src/app.py']
+    assert s3.puts[3:] == [key, commit_file]
+    assert s3.body(bucket, prefix + 'src/app.py') == b'print(1)\n'
+    logo = s3.objects[(bucket, prefix + 'assets/logo.png')]
+    assert logo['ContentType'] == 'image/png'
+    assert logo['Metadata'] == {'sha256': sha256(b'\x89PNG')}
+    assert manifest(s3) == {'commit': commit, 'prefix': prefix, 'files': {
+        'README.md': {'sha256': sha256(b'readme'), 'size': 6},
+        'assets/logo.png': {'sha256': sha256(b'\x89PNG'), 'size': 4},
+        'src/app.py': {'sha256': sha256(b'print(1)\n'), 'size': 9}}}
+    # The manifest is the artifact the ordering guards look at
+    assert s3.objects[(bucket, key)]['Metadata'] == {'build-seq': '1', 'commit-sha': commit}
+
+
+def test_incremental_build_writes_only_the_changes(remote, monkeypatch):
+    s3 = helpers.FakeS3()
+    publish(s3, remote, helpers.commit(remote, {'README.md': 'readme', 'src/app.py': '1', 'src/old.py': '2'}), 1,
+            monkeypatch)
+    del s3.puts[:]
+    commit = helpers.commit(remote, {'src/app.py': 'changed', 'src/old.py': None, 'docs/new.md': 'new'})
+    publish(s3, remote, commit, 2, monkeypatch)
+    assert sorted(s3.puts[:2]) == [prefix + 'docs/new.md', prefix + 'src/app.py']
+    assert s3.puts[2:] == [key, commit_file]
+    assert (bucket, prefix + 'src/old.py') not in s3.objects
+    assert s3.body(bucket, prefix + 'src/app.py') == b'changed'
+    assert s3.body(bucket, prefix + 'README.md') == b'readme'
+    assert manifest(s3)['commit'] == commit
+    assert sorted(manifest(s3)['files']) == ['README.md', 'docs/new.md', 'src/app.py']
+
+
+def test_unchanged_tree_writes_only_the_manifest(remote, monkeypatch):
+    s3 = helpers.FakeS3()
+    publish(s3, remote, helpers.commit(remote, {'README.md': 'readme'}), 1, monkeypatch)
+    del s3.puts[:]
+    commit = helpers.commit(remote, {}, 'Empty commit')
+    publish(s3, remote, commit, 2, monkeypatch)
+    assert s3.puts == [key, commit_file]
+    assert manifest(s3)['commit'] == commit
+
+
+def test_failed_delete_keeps_the_previous_manifest(remote, monkeypatch):
+    s3 = helpers.FakeS3()
+    first = helpers.commit(remote, {'README.md': 'readme', 'old.txt': 'old'})
+    publish(s3, remote, first, 1, monkeypatch)
+    monkeypatch.setattr(s3, 'delete_objects', lambda Bucket, Delete: {'Errors': [{'Key': Delete['Objects'][0]['Key']}]})
+    with pytest.raises(Exception, match='old.txt'):
+        publish(s3, remote, helpers.commit(remote, {'old.txt': None}), 2, monkeypatch)
+    assert manifest(s3)['commit'] == first
+
+
+def test_deletes_are_sent_in_batches_of_1000(monkeypatch):
+    s3 = helpers.FakeS3()
+    batches = []
+    delete_objects = s3.delete_objects
+
+    def record(Bucket, Delete):
+        batches.append(len(Delete['Objects']))
+        return delete_objects(Bucket, Delete)
+
+    monkeypatch.setattr(s3, 'delete_objects', record)
+    exploded.delete(s3, bucket, ['%s%d' % (prefix, i) for i in range(2500)])
+    assert batches == [1000, 1000, 500]
@@ -0,0 +1,136 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# LFS object cache, against a local repository of pointer files and a stand-in for git-lfs and the LFS server of the
+# Git service
+
+import hashlib
+import os
+import pytest
+import helpers
+import lfs
+
+bucket = 'git2s3-cache'
+
+
+def pointer(content):
+    return 'version https://git-lfs.github.com/spec/v1\noid sha256:%s\nsize %d\n' % (
+        hashlib.sha256(content).hexdigest(), len(content))
+
+
+class GitLfs(object):
+    # The git lfs commands LfsCache runs, other git commands run as they are. objects is the LFS server, downloads
+    # counts the objects fetched from it
+    def __init__(self, objects):
+        self.objects = dict((hashlib.sha256(c).hexdigest(), c) for c in objects)
+        self.downloads = []
+
+    def pointers(self, directory):
+        for path in helpers.git(directory, 'ls-files').splitlines():
+            with open(os.path.join(directory, path), 'rb') as f:
+                lines = f.read().decode('utf-8', 'replace').splitlines()
+            if lines and lines[0] == 'version https://git-lfs.github.com/spec/v1':
+                yield path, lines[1].split(':', 1)[1]
+
+    def __call__(self, *args, **kwargs):
+        # LfsCache runs every command as git -C <checkout> ...
+        directory = args[1]
+        if args[2:] == ('lfs', 'ls-files', '-l'):
+            return '\n'.join('%s - %s' % (oid, path) for path, oid in self.pointers(directory))
+        if args[2:] == ('lfs', 'pull'):
+            store = os.path.join(directory, '.git', 'lfs', 'objects')
+            for path, oid in list(self.pointers(directory)):
+                local = os.path.join(store, oid[0:2], oid[2:4], oid)
+                if not os.path.exists(local):
+                    self.downloads.append(oid)
+                    os.makedirs(os.path.dirname(local), exist_ok=True)
+                    with open(local, 'wb') as f:
+                        f.write(self.objects[oid])
+                with open(local, 'rb') as source, open(os.path.join(directory, path), 'wb') as target:
+                    target.write(source.read())
+            return ''
+        return helpers.git(directory, *args[2:])
+
+
+contents = [b'model weights' * 1000, b'video' * 5000, b'dataset' * 2000]
+
+
+@pytest.fixture
+def remote(tmpdir):
+    path = helpers.init_repo(str(tmpdir.join('remote')))
+    helpers.commit(path, {'README.md': 'readme', 'models/weights.bin': pointer(contents[0]),
+                          'media/video.mp4': pointer(contents[1]), 'data/set.csv': pointer(contents[2])})
+    return path
+
+
+@pytest.fixture
+def server(monkeypatch):
+    stand_in = GitLfs(contents)
+    monkeypatch.setattr(lfs, 'git', stand_in)
+    return stand_in
+
+
+def checkout(remote, path):
+    helpers.git(remote, 'clone', '-q', 'file://' + remote, path)
+    return path
+
+
+def check_files(directory):
+    for name, content in zip(('models/weights.bin', 'media/video.mp4', 'data/set.csv'), contents):
+        with open(os.path.join(directory, name), 'rb') as f:
+            assert f.read() == content
+
+
+def test_first_build_downloads_the_objects_and_caches_them(remote, server, tmpdir):
+    s3 = helpers.FakeS3()
+    cache = lfs.LfsCache(bucket, s3=s3)
+    directory = checkout(remote, str(tmpdir.join('build-1')))
+    assert cache.pull(directory) == 3
+    check_files(directory)
+    assert len(server.downloads) == 3
+    assert sorted(s3.puts) == sorted('lfs/' + oid for oid in server.objects)
+
+
+def test_next_build_takes_the_objects_from_the_cache(remote, server, tmpdir):
+    s3 = helpers.FakeS3()
+    lfs.LfsCache(bucket, s3=s3).pull(checkout(remote, str(tmpdir.join('build-1'))))
+    del server.downloads[:]
+    del s3.puts[:]
+    directory = checkout(remote, str(tmpdir.join('build-2')))
+    assert lfs.LfsCache(bucket, s3=s3).pull(directory) == 3
+    check_files(directory)
+    assert server.downloads == []
+    assert s3.puts == []
+
+
+def test_corrupt_cached_object_is_downloaded_again(remote, server, tmpdir):
+    s3 = helpers.FakeS3()
+    lfs.LfsCache(bucket, s3=s3).pull(checkout(remote, str(tmpdir.join('build-1'))))
+    oid = hashlib.sha256(contents[1]).hexdigest()
+    s3.put_object(Bucket=bucket, Key='lfs/' + oid, Body=b'truncated')
+    del server.downloads[:]
+    directory = checkout(remote, str(tmpdir.join('build-2')))
+    lfs.LfsCache(bucket, s3=s3).pull(directory)
+    check_files(directory)
+    assert server.downloads == [oid]
+    # The good copy replaces the corrupt one
+    assert s3.body(bucket, 'lfs/' + oid) == contents[1]
+
+
+def test_without_a_cache_bucket_objects_come_from_the_server(remote, server, tmpdir):
+    directory = checkout(remote, str(tmpdir.join('build')))
+    assert lfs.LfsCache(None, s3=helpers.FakeS3()).pull(directory) == 3
+    check_files(directory)
+    assert len(server.downloads) == 3
+
+
+def test_repository_without_lfs_files(server, tmpdir):
+    path = helpers.init_repo(str(tmpdir.join('plain')))
+    helpers.commit(path, {'README.md': 'readme'})
+    s3 = helpers.FakeS3()
+    assert lfs.LfsCache(bucket, s3=s3).pull(checkout(path, str(tmpdir.join('build')))) == 0
+    assert s3.puts == []
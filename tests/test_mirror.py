@@ -0,0 +1,119 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import os
+import pytest
+import helpers
+import build
+import mirror
+
+bucket = 'git2s3-cache'
+
+
+@pytest.fixture
+def remote(tmpdir):
+    path = helpers.init_repo(str(tmpdir.join('remote')))
+    helpers.commit(path, {'README.md': 'readme', 'src/app.py': 'print(1)\n'})
+    return path
+
+
+@pytest.fixture
+def cache(tmpdir):
+    s3 = helpers.FakeS3()
+    return lambda limit=1024 * 1024 * 1024: mirror.MirrorCache(bucket, limit, path=str(tmpdir.join('mirror.git')),
+                                                                s3=s3)
+
+
+def objects(path):
+    return int(dict(line.split(': ') for line in helpers.git(path, 'count-objects', '-v').splitlines())['in-pack'])
+
+
+def test_first_build_starts_a_new_mirror_and_saves_it(remote, cache):
+    url = 'file://' + remote
+    first = cache()
+    assert not first.restore(url)
+    head = first.fetch(url, 'refs/heads/main')
+    assert head == helpers.git(remote, 'rev-parse', 'HEAD')
+    assert first.save(url)
+    assert first.s3.puts == [first.key_for(url)]
+
+
+def test_next_build_fetches_only_new_commits(remote, cache):
+    url = 'file://' + remote
+    first = cache()
+    first.restore(url)
+    first.fetch(url, 'refs/heads/main')
+    first.save(url)
+    before = objects(first.path)
+    tip = helpers.commit(remote, {'src/app.py': 'print(2)\n'})
+    second = cache()
+    second.s3 = first.s3
+    assert second.restore(url)
+    assert second.resolve('refs/heads/main') is not None
+    assert second.fetch(url, 'refs/heads/main', head_sha=tip) == tip
+    # The new commit, its tree, the src tree and the changed file
+    assert objects(second.path) - before <= 4
+    assert second.save(url)
+
+
+def test_unchanged_mirror_is_not_saved_again(remote, cache):
+    url = 'file://' + remote
+    first = cache()
+    first.restore(url)
+    first.fetch(url, 'refs/heads/main')
+    first.save(url)
+    second = cache()
+    second.s3 = first.s3
+    second.restore(url)
+    second.fetch(url, 'refs/heads/main')
+    assert not second.save(url)
+    assert first.s3.puts == [first.key_for(url)]
+
+
+def test_mirror_larger_than_the_cache_is_not_saved(remote, cache):
+    url = 'file://' + remote
+    small = cache(limit=1)
+    small.restore(url)
+    small.fetch(url, 'refs/heads/main')
+    assert not small.save(url)
+    assert small.s3.puts == []
+
+
+def test_least_recently_written_mirrors_are_evicted(cache):
+    evicting = cache(limit=250)
+    for name in ('old', 'older', 'newest'):
+        evicting.s3.put_object(Bucket=bucket, Key='mirrors/%s.tar' % name, Body=b'x' * 100)
+    evicting.s3.put_object(Bucket=bucket, Key='lfs/not-a-mirror', Body=b'x' * 1000)
+    assert evicting.evict(keep='mirrors/old.tar') == [{'Key': 'mirrors/older.tar'}]
+    assert sorted(k for b, k in evicting.s3.objects) == ['lfs/not-a-mirror', 'mirrors/newest.tar', 'mirrors/old.tar']
+
+
+def test_checkout_uses_the_mirror(remote, tmpdir, monkeypatch):
+    s3 = helpers.FakeS3()
+    monkeypatch.setattr(mirror, 'from_environment', lambda: mirror.MirrorCache(
+        bucket, 100 * 1024 * 1024, path=str(tmpdir.join('cache', 'mirror.git')), s3=s3))
+    for name, value in (('GitUrl', 'file://' + remote), ('Branch', 'main'), ('exclude_git', 'False'),
+                        ('HeadSha', '')):
+        monkeypatch.setenv(name, value)
+    for directory in ('first', 'second'):
+        checkout = str(tmpdir.join(directory))
+        build.checkout(checkout)
+        build.save_mirror()
+        assert helpers.git(checkout, 'rev-parse', 'HEAD') == helpers.git(remote, 'rev-parse', 'HEAD')
+        assert os.path.exists(os.path.join(checkout, 'src', 'app.py'))
+        helpers.commit(remote, {'src/app.py': 'print(%r)\n' % directory})
+    assert len([k for k in s3.puts if k.startswith('mirrors/')]) == 2
+
+
+def test_mirror_cache_is_configured_by_the_stack(monkeypatch):
+    monkeypatch.setenv('CacheBucket', bucket)
+    monkeypatch.setenv('MirrorCacheSize', '0')
+    assert mirror.from_environment() is None
+    monkeypatch.setenv('MirrorCacheSize', '512')
+    assert mirror.from_environment().limit == 512 * 1024 * 1024
+    monkeypatch.delenv('CacheBucket')
+    assert mirror.from_environment() is None
@@ -0,0 +1,203 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+import helpers
+import package
+
+bucket = 'git2s3-outputbucket'
+key = 'octo-org/octo-repo/main/octo-org_octo-repo.zip'
+
+
+@pytest.fixture
+def remote(tmpdir, monkeypatch):
+    # Local stand-in for the Git service, builds read GitUrl and Branch from the environment
+    path = helpers.init_repo(str(tmpdir.join('remote')))
+    monkeypatch.setenv('GitUrl', 'file://' + path)
+    monkeypatch.setenv('Branch', 'main')
+    monkeypatch.setattr(package, 'tips', {})
+    return path
+
+
+def exported(commit, seq):
+    return {'commit-sha': commit, 'build-seq': '%d' % seq}
+
+
+def package_commit(s3, remote, commit, seq, monkeypatch, root=None, tree_sha=None, archive_format='zip',
+                   target=key):
+    # Packages the working tree of remote as the build of commit with sequence number seq
+    monkeypatch.setenv('HeadSha', commit)
+    monkeypatch.setenv('CommitMessage', 'Change files')
+    metadata = {'build-seq': '%d' % seq, 'commit-sha': commit}
+    return package.package_tree(s3, root or remote, bucket, target, metadata, tree_sha, True, archive_format,
+                                'Change files')
+
+
+def checkout(remote, path, commit):
+    # Separate checkout of commit, as a build makes it
+    helpers.git(remote, 'clone', '-q', '--no-checkout', 'file://' + remote, path)
+    helpers.git(path, 'checkout', '-q', commit)
+    return path
+
+
+def test_tip_of_the_branch_is_never_replaced(remote):
+    older = helpers.commit(remote, {'a.txt': '1'})
+    tip = helpers.commit(remote, {'a.txt': '2'})
+    # The webhook of the older push was received last
+    assert package.newer_exported(exported(tip, 1), older, 2)
+
+
+def test_tip_of_the_branch_replaces_an_artifact_with_a_higher_sequence_number(remote):
+    older = helpers.commit(remote, {'a.txt': '1'})
+    tip = helpers.commit(remote, {'a.txt': '2'})
+    assert not package.newer_exported(exported(older, 2), tip, 1)
+
+
+def test_branch_rolled_back_to_an_earlier_commit_is_written(remote):
+    first = helpers.commit(remote, {'a.txt': '1'})
+    second = helpers.commit(remote, {'a.txt': '2'})
+    helpers.git(remote, 'reset', '-q', '--hard', first)
+    assert not package.newer_exported(exported(second, 1), first, 2)
+
+
+def test_history_orders_commits_that_are_not_the_tip(remote):
+    first = helpers.commit(remote, {'a.txt': '1'})
+    second = helpers.commit(remote, {'a.txt': '2'})
+    helpers.commit(remote, {'a.txt': '3'})
+    assert package.newer_exported(exported(second, 1), first, 2)
+    assert not package.newer_exported(exported(first, 2), second, 1)
+
+
+def test_sequence_numbers_order_unrelated_commits(remote):
+    first = helpers.commit(remote, {'a.txt': '1'})
+    helpers.git(remote, 'checkout', '-q', '--orphan', 'rewritten')
+    other = helpers.commit(remote, {'b.txt': '1'})
+    # The branch was replaced by a history that does not contain first
+    helpers.git(remote, 'update-ref', 'refs/heads/main', helpers.commit(remote, {'b.txt': '2'}))
+    assert package.newer_exported(exported(other, 2), first, 1)
+    assert not package.newer_exported(exported(other, 1), first, 2)
+
+
+def test_same_commit_is_ordered_by_sequence_number(remote):
+    tip = helpers.commit(remote, {'a.txt': '1'})
+    assert package.newer_exported(exported(tip, 2), tip, 1)
+    assert not package.newer_exported(exported(tip, 1), tip, 2)
+    assert not package.newer_exported({}, tip, 1)
+
+
+def test_late_build_of_an_older_push_does_not_overwrite_the_tip(remote, monkeypatch):
+    s3 = helpers.FakeS3()
+    older = helpers.commit(remote, {'a.txt': '1'})
+    tip = helpers.commit(remote, {'a.txt': '2'})
+    package_commit(s3, remote, tip, 1, monkeypatch)
+    written = s3.body(bucket, key)
+    assert package_commit(s3, remote, older, 2, monkeypatch) is None
+    assert s3.body(bucket, key) == written
+    assert s3.head_object(Bucket=bucket, Key=key)['Metadata']['commit-sha'] == tip
+
+
+def test_unreachable_remote_falls_back_to_sequence_numbers(remote, monkeypatch):
+    first = helpers.commit(remote, {'a.txt': '1'})
+    second = helpers.commit(remote, {'a.txt': '2'})
+    monkeypatch.setenv('GitUrl', 'file://' + os.path.join(remote, 'missing'))
+    assert package.newer_exported(exported(first, 2), second, 1)
+    assert not package.newer_exported(exported(first, 1), second, 2)
+
+
+def test_build_skipped_on_an_unchanged_tree_still_orders_later_builds(remote, monkeypatch, tmpdir):
+    s3 = helpers.FakeS3()
+    first = helpers.commit(remote, {'a.txt': '1'})
+    other = helpers.commit(remote, {'a.txt': '2'})
+    helpers.git(remote, 'checkout', '-q', '--orphan', 'rewritten')
+    same_tree = helpers.commit(remote, {'a.txt': '1'})
+    # History can not order the commits, their sequence numbers decide
+    monkeypatch.setenv('GitUrl', 'file://' + os.path.join(remote, 'missing'))
+    tree = helpers.git(remote, 'rev-parse', first + '^{tree}')
+    package_commit(s3, remote, first, 1, monkeypatch, checkout(remote, str(tmpdir.join('1')), first), tree)
+    written = s3.body(bucket, key)
+    # The push of seq 3 has the same tree, only its commit file is written
+    assert package_commit(s3, remote, same_tree, 3, monkeypatch, checkout(remote, str(tmpdir.join('3')), same_tree),
+                          tree) is None
+    assert s3.body(bucket, key) == written
+    # The late build of the push of seq 2 must not replace the artifact that stands for seq 3
+    assert package_commit(s3, remote, other, 2, monkeypatch, checkout(remote, str(tmpdir.join('2')), other),
+                          helpers.git(remote, 'rev-parse', other + '^{tree}')) is None
+    assert s3.body(bucket, key) == written
+    assert package.exported_metadata(s3, bucket, key, 'zip')['commit-sha'] == same_tree
+
+
+@pytest.mark.parametrize('archive_format', ['zip', 'tar.gz', 'tar.zst'])
+def test_same_tree_packaged_twice_gives_identical_bytes(remote, monkeypatch, tmpdir, archive_format):
+    if archive_format == 'tar.zst':
+        pytest.importorskip('zstandard')
+    s3 = helpers.FakeS3()
+    helpers.write_files(remote, {'README.md': 'readme', 'bin/run.sh': '#!/bin/sh\n', 'src/app.py': 'print(1)\n',
+                                 'assets/logo.bin': os.urandom(100000)})
+    os.chmod(os.path.join(remote, 'bin', 'run.sh'), 0o755)
+    tip = helpers.commit(remote, {})
+    digests = []
+    for n in range(2):
+        # Fresh checkouts, with other file times, of the same commit
+        root = checkout(remote, str(tmpdir.join('checkout-%d' % n)), tip)
+        os.utime(os.path.join(root, 'README.md'), (1000000000 * (n + 1),) * 2)
+        target = 'octo-org/octo-repo/main/build-%d%s' % (n, package.suffixes[archive_format])
+        package_commit(s3, remote, tip, n + 1, monkeypatch, root, None, archive_format, target)
+        digests.append(hashlib.sha256(s3.body(bucket, target)).hexdigest())
+    assert digests[0] == digests[1]
+
+
+def test_unchanged_tree_is_not_uploaded_again(remote, monkeypatch, tmpdir):
+    s3 = helpers.FakeS3()
+    first = helpers.commit(remote, {'a.txt': '1'})
+    tree = helpers.git(remote, 'rev-parse', 'HEAD^{tree}')
+    package_commit(s3, remote, first, 1, monkeypatch, checkout(remote, str(tmpdir.join('1')), first), tree)
+    second = helpers.commit(remote, {}, 'Empty commit')
+    del s3.puts[:]
+    assert package_commit(s3, remote, second, 2, monkeypatch, checkout(remote, str(tmpdir.join('2')), second),
+                          tree) is None
+    assert s3.puts == ['octo-org/octo-repo/main/octo-org_octo-repo.commit.json']
+
+
+@pytest.mark.parametrize('archive_format', ['zip', 'tar.gz', 'tar.zst'])
+def test_archive_formats(remote, monkeypatch, archive_format):
+    if archive_format == 'tar.zst':
+        zstandard = pytest.importorskip('zstandard')
+    s3 = helpers.FakeS3()
+    helpers.write_files(remote, {'README.md': 'readme', 'bin/run.sh': '#!/bin/sh\n', '.gitignore': '*.pyc\n'})
+    os.chmod(os.path.join(remote, 'bin', 'run.sh'), 0o755)
+    tip = helpers.commit(remote, {})
+    target = 'octo-org/octo-repo/main/octo-org_octo-repo' + package.suffixes[archive_format]
+    package_commit(s3, remote, tip, 1, monkeypatch, None, None, archive_format, target)
+    written = s3.objects[(bucket, target)]
+    assert written['ContentType'] == package.content_types[archive_format]
+    assert written['Metadata']['commit-sha'] == tip
+    body = written['Body']
+    if archive_format == 'zip':
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        modes = dict((i.filename.rstrip('/'), i.external_attr >> 16) for i in archive.infolist())
+        assert archive.read('README.md') == b'readme'
+    else:
+        if archive_format == 'tar.zst':
+            body = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)).read()
+        archive = tarfile.open(fileobj=io.BytesIO(body), mode='r:gz' if archive_format == 'tar.gz' else 'r:')
+        modes = dict((i.name, i.mode | (0o40000 if i.isdir() else 0o100000)) for i in archive.getmembers())
+        assert archive.extractfile('README.md').read() == b'readme'
+        assert all(i.mtime == 0 and i.uid == 0 for i in archive.getmembers())
+    # .git, .gitignore and the like are left out, as with ExcludeGit
+    assert modes == {'README.md': 0o100644, 'bin': 0o40755, 'bin/run.sh': 0o100755}
+    assert s3.body(bucket, target[:-len(package.suffixes[archive_format])] + package.commit_suffix)
+
+
+def test_tar_zst_without_zstandard_names_the_missing_module(monkeypatch):
+    monkeypatch.setitem(__import__('sys').modules, 'zstandard', None)
+    with pytest.raises(Exception, match='zstandard'):
+        package.write_tar_zst(io.BytesIO(), [])
@@ -0,0 +1,87 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# git archive --remote fast path, against a local stand-in repository
+
+import io
+import os
+import zipfile
+import pytest
+import helpers
+import build
+import package
+
+bucket = 'git2s3-outputbucket'
+key = 'octo-org/octo-repo/main/octo-org_octo-repo.zip'
+
+
+@pytest.fixture
+def remote(tmpdir, monkeypatch, s3):
+    path = helpers.init_repo(str(tmpdir.join('remote')))
+    tip = helpers.commit(path, {'README.md': 'readme', 'src/app.py': 'print(1)\n'})
+    monkeypatch.setattr(package.boto3, 'client', lambda *args, **kwargs: s3)
+    monkeypatch.setattr(package, 'tips', {})
+    monkeypatch.setattr(build, 'archived_path', str(tmpdir.join('archived.json')))
+    for name in ('CacheBucket', 'Lfs', 'Submodules', 'Directories', 'SparsePatterns', 'CloneFilter'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('GitUrl', 'file://' + path)
+    monkeypatch.setenv('Branch', 'main')
+    monkeypatch.setenv('exclude_git', 'True')
+    monkeypatch.setenv('ArchiveFormat', 'zip')
+    monkeypatch.setenv('outputbucket', bucket)
+    monkeypatch.setenv('outputbucketpath', 'octo-org/octo-repo/main/')
+    monkeypatch.setenv('outputbucketkey', 'octo-org_octo-repo.zip')
+    monkeypatch.setenv('BuildSeq', '1')
+    push(monkeypatch, tip)
+    return path
+
+
+def push(monkeypatch, commit, seq=1):
+    monkeypatch.setenv('HeadSha', commit)
+    monkeypatch.setenv('CommitMessage', 'Change files')
+    monkeypatch.setenv('BuildSeq', '%d' % seq)
+
+
+def test_remote_archive_is_packaged_without_a_clone(remote, s3):
+    commit, message = package.package_remote()
+    assert commit == helpers.git(remote, 'rev-parse', 'HEAD')
+    assert message == 'Change files'
+    archive = zipfile.ZipFile(io.BytesIO(s3.body(bucket, key)))
+    assert sorted(archive.namelist()) == ['README.md', 'src/', 'src/app.py']
+    assert s3.head_object(Bucket=bucket, Key=key)['Metadata']['commit-sha'] == commit
+
+
+def test_same_commit_is_not_uploaded_again(remote, s3, monkeypatch):
+    commit, _ = package.package_remote()
+    del s3.puts[:]
+    push(monkeypatch, commit, 2)
+    package.package_remote()
+    assert s3.puts == ['octo-org/octo-repo/main/octo-org_octo-repo.commit.json']
+    assert package.exported_metadata(s3, bucket, key, 'zip')['build-seq'] == '2'
+
+
+@pytest.mark.parametrize('attributes', ['*.md export-ignore\n', 'src/app.py export-subst\n'])
+def test_export_attributes_fall_back_to_a_clone(remote, s3, monkeypatch, tmpdir, attributes):
+    tip = helpers.commit(remote, {'.gitattributes': attributes})
+    push(monkeypatch, tip)
+    with pytest.raises(package.ArchiveUnavailable):
+        package.package_remote()
+    assert s3.puts == []
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert not os.path.exists(build.archived_path)
+    assert helpers.git(directory, 'rev-parse', 'HEAD') == tip
+    package.package(directory)
+    assert 'README.md' in zipfile.ZipFile(io.BytesIO(s3.body(bucket, key))).namelist()
+
+
+def test_symbolic_links_fall_back_to_a_clone(remote, s3, monkeypatch):
+    os.symlink('README.md', os.path.join(remote, 'LINK.md'))
+    push(monkeypatch, helpers.commit(remote, {}))
+    with pytest.raises(package.ArchiveUnavailable):
+        package.package_remote()
+    assert s3.puts == []
@@ -0,0 +1,136 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import io
+import random
+import shutil
+import struct
+import subprocess
+import zipfile
+import zlib
+import pytest
+import helpers  # noqa: F401
+import parallelzip
+
+block_size = 64 * 1024
+
+# Name, content: small and multi-block files, compressible and not, stored by extension and deflated
+files = [
+    ('README.md', b'readme\n' * 10),
+    ('empty.txt', b''),
+    ('src/app.py', b'print("hello")\n' * 20000),
+    ('lib/vendor.jar', random.Random(1).randbytes(5 * block_size + 123)),
+    ('images/logo.png', random.Random(2).randbytes(block_size // 2)),
+    ('data/random.bin', random.Random(3).randbytes(3 * block_size)),
+    (u'docs/café.txt', u'café\n'.encode('utf-8')),
+]
+
+
+class Unseekable(io.RawIOBase):
+    # Readable only front to back, like a member of a tar read as a stream
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def readinto(self, buffer):
+        return self.data.readinto(buffer)
+
+
+def write_archive(source=io.BytesIO, max_workers=2):
+    stream = io.BytesIO()
+    with parallelzip.ParallelZipWriter(stream, max_workers=max_workers, block_size=block_size) as archive:
+        archive.add_directory('docs/')
+        for name, content in files:
+            archive.add_file(source(content), name, 0o100755 if name.endswith('.py') else 0o100644, len(content))
+    return stream.getvalue()
+
+
+def local_headers(data):
+    # Flags, method, CRC and sizes of the local headers, by name
+    headers = {}
+    for info in zipfile.ZipFile(io.BytesIO(data)).infolist():
+        fields = struct.unpack('<IHHHHHIIIHH', data[info.header_offset:info.header_offset + 30])
+        headers[info.filename] = fields[2:4] + fields[6:9]
+    return headers
+
+
+def read_as_stream(data):
+    # Reads the entries front to back from their local headers only, the way Java's ZipInputStream does: the size of
+    # a stored entry must be in its local header, a deflated entry may end on a data descriptor
+    offset, entries = 0, {}
+    while struct.unpack('<I', data[offset:offset + 4])[0] == 0x04034b50:
+        (_, _, flags, method, _, _, crc, compressed_size, file_size, name_length,
+         extra_length) = struct.unpack('<IHHHHHIIIHH', data[offset:offset + 30])
+        name = data[offset + 30:offset + 30 + name_length].decode('utf-8')
+        offset += 30 + name_length + extra_length
+        if method == parallelzip.stored:
+            assert not flags & 0x08, name
+            content = data[offset:offset + file_size]
+            offset += file_size
+        else:
+            decompressor = zlib.decompressobj(-15)
+            content = decompressor.decompress(data[offset:])
+            offset = len(data) - len(decompressor.unused_data)
+            if flags & 0x08:
+                _, crc, compressed_size, file_size = struct.unpack('<IIII', data[offset:offset + 16])
+                offset += 16
+        assert zlib.crc32(content) == crc and len(content) == file_size, name
+        entries[name] = content
+    return entries
+
+
+def test_archive_reads_back():
+    archive = zipfile.ZipFile(io.BytesIO(write_archive()))
+    assert archive.testzip() is None
+    assert archive.namelist() == ['docs/'] + [name for name, _ in files]
+    for name, content in files:
+        assert archive.read(name) == content
+    assert archive.getinfo('src/app.py').external_attr >> 16 == 0o100755
+    assert archive.getinfo('src/app.py').compress_type == zipfile.ZIP_DEFLATED
+    assert archive.getinfo('lib/vendor.jar').compress_type == zipfile.ZIP_STORED
+    # Files larger than a block are deflated even when that does not make them smaller
+    assert archive.getinfo('data/random.bin').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_stored_files_have_their_sizes_in_the_local_header():
+    # Java's ZipInputStream rejects stored entries with a data descriptor
+    headers = local_headers(write_archive())
+    content = dict(files)['lib/vendor.jar']
+    flags, method, crc, compressed_size, file_size = headers['lib/vendor.jar']
+    assert not flags & 0x08
+    assert method == parallelzip.stored
+    assert crc == zipfile.crc32(content)
+    assert compressed_size == file_size == len(content)
+    # Deflated files larger than a block are streamed with a data descriptor
+    assert headers['src/app.py'][0] & 0x08
+
+
+def test_unseekable_sources_give_the_same_bytes():
+    assert write_archive(lambda content: io.BufferedReader(Unseekable(content))) == write_archive()
+
+
+def test_bytes_do_not_depend_on_the_number_of_workers():
+    assert write_archive(max_workers=1) == write_archive(max_workers=4)
+
+
+def test_archive_reads_as_a_stream():
+    entries = read_as_stream(write_archive())
+    assert entries.pop('docs/') == b''
+    assert entries == dict(files)
+
+
+@pytest.mark.skipif(not shutil.which('unzip'), reason='needs unzip')
+def test_unzip_tests_the_archive(tmpdir):
+    path = str(tmpdir.join('archive.zip'))
+    with open(path, 'wb') as f:
+        f.write(write_archive())
+    subprocess.check_call(['unzip', '-tq', path], stdout=subprocess.DEVNULL)
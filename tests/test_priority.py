@@ -0,0 +1,117 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import importlib
+import json
+import pytest
+import admission
+import priority
+import webhooks
+
+custom = json.dumps([{'class': 'hotfix', 'branches': ['hotfix/*', 'release-?']},
+                     {'class': 'pull-request', 'events': ['pr:*']},
+                     {'class': 'tagged', 'events': ['Tag Push Hook'], 'branches': ['tags/*']}])
+
+
+def push(branch, default_branch=None, event_type='push'):
+    return webhooks.PushRecord('github', event_type, 'octo-org/octo-repo', branch,
+                               'git@github.com:octo-org/octo-repo.git', default_branch=default_branch)
+
+
+@pytest.fixture
+def reload_priority(monkeypatch):
+    # Settings are read when the module is loaded, it is loaded again with the environment of each test
+    def load(**environment):
+        for name, value in environment.items():
+            monkeypatch.setenv(name, value)
+        return importlib.reload(priority)
+    yield load
+    monkeypatch.undo()
+    importlib.reload(priority)
+
+
+def test_default_rules(monkeypatch):
+    monkeypatch.delenv('PriorityRules', raising=False)
+    assert priority.classify(push('tags/v1.2.0')) == ('release', 0)
+    assert priority.classify(push('main', 'main')) == ('default', 1)
+    assert priority.classify(push('develop', 'develop')) == ('default', 1)
+    assert priority.classify(push('feature/notes', 'main')) == ('other', 2)
+    # The default branch is named by the webhook, main and master stand in when it is not
+    assert priority.classify(push('main', 'develop')) == ('other', 2)
+    assert priority.classify(push('master')) == ('default', 1)
+    assert priority.classify(push('main')) == ('default', 1)
+
+
+def test_github_release_is_a_release():
+    release = webhooks.PushRecord('github', 'release', 'octo-org/octo-repo', 'tags/v1.2.0',
+                                  'git@github.com:octo-org/octo-repo.git', repo_name='octo-org/octo-repo/release')
+    assert priority.classify(release, '')[0] == 'release'
+
+
+def test_custom_rules_match_events_and_branches():
+    assert priority.classify(push('hotfix/login'), custom) == ('hotfix', 0)
+    assert priority.classify(push('release-2'), custom) == ('hotfix', 0)
+    assert priority.classify(push('release-10'), custom) == ('other', 3)
+    assert priority.classify(push('feature/notes', event_type='pr:opened'), custom) == ('pull-request', 1)
+    # Both the events and the branches of a class have to match
+    assert priority.classify(push('tags/v1', event_type='Tag Push Hook'), custom) == ('tagged', 2)
+    assert priority.classify(push('tags/v1', event_type='Push Hook'), custom) == ('other', 3)
+    assert priority.classify(push('main', 'main'), custom) == ('other', 3)
+
+
+@pytest.mark.parametrize('text', ['{"class": "release"}', '[{"branches": ["main"]}]',
+                                  '[{"class": "release", "branches": "tags/*"}]',
+                                  '[{"class": "release", "events": "push"}]'])
+def test_invalid_rules_are_rejected(text):
+    with pytest.raises(Exception):
+        priority.load(text)
+
+
+def test_rules_are_parsed_once(monkeypatch):
+    monkeypatch.setattr(priority, 'rules_cache', {})
+    assert priority.get_rules(custom) is priority.get_rules(custom)
+
+
+def test_rank_moves_up_one_class_per_aging_period(reload_priority):
+    reload_priority(PriorityAging='60')
+    assert priority.aging == 60
+    assert priority.rank(2, 0) == 2
+    assert priority.rank(2, 30) == 1.5
+    assert priority.rank(2, 60) == 1
+    assert priority.rank(2, 180) == -1
+    reload_priority(PriorityAging='3600')
+    assert priority.rank(2, 60) == pytest.approx(2 - 1 / 60.0)
+    assert priority.rank(2, 3600) == 1
+
+
+def test_aging_defaults_to_five_minutes(reload_priority, monkeypatch):
+    monkeypatch.delenv('PriorityAging', raising=False)
+    assert reload_priority().aging == 300
+
+
+def entry(path, position, queued, seq):
+    return path, {'position': position, 'queued': queued, 'seq': seq}
+
+
+def test_backlog_starts_the_lowest_rank_first(monkeypatch):
+    monkeypatch.setattr(priority, 'aging', 300)
+    items = [entry('feature', 2, 1400, 1), entry('main', 1, 1500, 3), entry('release', 0, 1590, 4)]
+    assert [path for path, item in admission.backlog_order(items, 1600)] == ['release', 'main', 'feature']
+    # A push that waited more than two aging periods is ahead of a new release
+    items.append(entry('new-release', 0, 2001, 5))
+    assert [path for path, item in admission.backlog_order(items, 2001)] == ['release', 'main', 'feature',
+                                                                             'new-release']
+
+
+def test_equal_ranks_start_the_oldest_push_first(monkeypatch):
+    monkeypatch.setattr(priority, 'aging', 300)
+    items = [entry('b', 1, 1000, 7), entry('a', 1, 1000, 5), entry('c', 2, 700, 6)]
+    # c waited one aging period more, all three have rank 1 - 600 / 300
+    assert [path for path, item in admission.backlog_order(items, 1600)] == ['a', 'c', 'b']
+    # Items deferred before priority classes existed have no position
+    items = [entry('main', 1, 1600, 1), ('old', {'queued': 1600, 'seq': 2})]
+    assert [path for path, item in admission.backlog_order(items, 1600)] == ['old', 'main']
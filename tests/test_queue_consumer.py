@@ -0,0 +1,82 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import json
+import boto3
+import pytest
+from botocore.stub import Stubber
+import clients
+import queue_consumer
+import webhooks
+
+
+def push(branch, head_sha):
+    return webhooks.PushRecord('github', 'push', 'octo-org/octo-repo', branch, 'git@github.com:octo-org/octo-repo.git',
+                               head_sha=head_sha)
+
+
+def record(message_id, branch, seq, head_sha=None):
+    body = {'push': push(branch, head_sha or '%040d' % seq).to_dict(), 'key-bucket': 'git2s3-keybucket',
+            'output-bucket': 'git2s3-outputbucket', 'seq': seq}
+    return {'messageId': message_id, 'receiptHandle': 'handle-' + message_id, 'body': json.dumps(body),
+            'eventSource': 'aws:sqs'}
+
+
+@pytest.fixture
+def stubbed(store, metrics, monkeypatch):
+    client = boto3.client('codebuild')
+    stubber = Stubber(client)
+    monkeypatch.setitem(clients.clients, 'codebuild', client)
+    with stubber:
+        yield stubber
+    stubber.assert_no_pending_responses()
+
+
+def add_start(stubber, number):
+    stubber.add_response('start_build', {'build': {'id': 'git2s3-build:%d' % number}})
+
+
+class StubberAny(object):
+    def __eq__(self, other):
+        return True
+
+
+def test_newest_push_per_branch_is_kept():
+    pending = queue_consumer.newest_per_branch([record('m1', 'main', 1), record('m2', 'main', 3),
+                                                record('m3', 'dev', 2), record('m4', 'main', 2)])
+    assert sorted((message_id, push.branch_name) for message_id, message, push in pending) == [('m2', 'main'),
+                                                                                                ('m3', 'dev')]
+
+
+def test_batch_starts_one_build_per_branch(stubbed, store):
+    for number in range(3):
+        add_start(stubbed, number)
+    response = queue_consumer.lambda_handler({'Records': [record('m%d' % i, 'branch-%d' % (i % 3), i)
+                                                          for i in range(9)]}, None)
+    assert response == {'batchItemFailures': []}
+    assert sorted(path for path, item in store.list('active')) == ['octo-org/octo-repo/branch-%d/' % i
+                                                                   for i in range(3)]
+    assert sorted(item['seq'] for path, item in store.list('active')) == [6, 7, 8]
+
+
+def test_failed_start_is_reported_as_a_batch_item_failure(stubbed, monkeypatch):
+    monkeypatch.setattr(queue_consumer, 'max_workers', 1)
+    add_start(stubbed, 1)
+    stubbed.add_client_error('start_build', 'InvalidInputException', 'Project cannot be found')
+    add_start(stubbed, 3)
+    response = queue_consumer.lambda_handler({'Records': [record('m1', 'a', 1), record('m2', 'b', 2),
+                                                          record('m3', 'c', 3)]}, None)
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'm2'}]}
+
+
+def test_enqueue_sends_the_push_record(monkeypatch):
+    client = boto3.client('sqs')
+    monkeypatch.setitem(clients.clients, 'sqs', client)
+    url = 'https://sqs.us-east-1.amazonaws.com/123456789012/WebhookQueue'
+    with Stubber(client) as stubber:
+        stubber.add_response('send_message', {'MessageId': 'm1'}, {'QueueUrl': url, 'MessageBody': StubberAny()})
+        assert queue_consumer.enqueue(url, push('main', 'a' * 40), 'kb', 'ob', 5) == 'm1'
@@ -0,0 +1,47 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import json
+import pytest
+import helpers  # noqa: F401
+import builds
+import repo_config
+import webhooks
+
+config = json.dumps([
+    {'repo': 'octo-org/monorepo', 'format': 'tar.zst'},
+    {'repo': 'octo-org/*', 'format': 'tar.gz'},
+])
+
+
+def push(full_name):
+    return webhooks.PushRecord('github', 'push', full_name, 'main', 'git@github.com:%s.git' % full_name)
+
+
+def test_first_matching_entry_sets_the_format():
+    assert repo_config.get_config('octo-org/monorepo', config)['format'] == 'tar.zst'
+    assert repo_config.get_config('octo-org/octo-repo', config)['format'] == 'tar.gz'
+    assert repo_config.get_config('other/repo', config)['format'] == repo_config.defaults['format']
+
+
+def test_artifact_key_ends_in_the_suffix_of_the_format(monkeypatch):
+    monkeypatch.setenv('RepoConfig', config)
+    assert builds.artifact_name(push('octo-org/monorepo')) == 'octo-org_monorepo.tar.zst'
+    assert builds.artifact_name(push('octo-org/octo-repo')) == 'octo-org_octo-repo.tar.gz'
+    assert builds.artifact_name(push('other/repo')) == 'other_repo.zip'
+
+
+@pytest.mark.parametrize('entry', [
+    {'repo': 'octo-org/*', 'format': 'rar'},
+    {'format': 'zip'},
+    {'repo': 'octo-org/*', 'filter': 'tree:0'},
+    {'repo': 'octo-org/*', 'lfs': 'yes'},
+    {'repo': 'octo-org/*', 'paths': 'services/*'},
+])
+def test_invalid_entries_are_rejected(entry):
+    with pytest.raises(Exception):
+        repo_config.load(json.dumps([entry]))
@@ -0,0 +1,119 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import os
+import threading
+import time
+import pytest
+import helpers
+from s3upload import MultipartUploadStream, min_part_size
+
+bucket = 'git2s3-outputbucket'
+key = 'octo-org/octo-repo/main/octo-org_octo-repo.zip'
+
+
+class SlowS3(helpers.FakeS3):
+    # Uploads the first parts slowest, so parts finish out of order, and fails the parts numbered in failing
+    def __init__(self, failing=()):
+        helpers.FakeS3.__init__(self)
+        self.failing = failing
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.completed = []
+        self.counter = threading.Lock()
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.counter:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            time.sleep(0.05 / PartNumber)
+            if PartNumber in self.failing:
+                raise helpers.client_error('InternalError', 'UploadPart', 500)
+            response = helpers.FakeS3.upload_part(self, Bucket, Key, UploadId, PartNumber, Body)
+            self.completed.append(PartNumber)
+            return response
+        finally:
+            with self.counter:
+                self.in_flight -= 1
+
+
+def write_in_chunks(stream, data, size=1000003):
+    for start in range(0, len(data), size):
+        stream.write(data[start:start + size])
+
+
+def test_large_body_is_uploaded_in_parallel_parts_in_order():
+    s3 = SlowS3()
+    data = os.urandom(4 * min_part_size + 12345)
+    stream = MultipartUploadStream(s3, bucket, key, part_size=min_part_size, max_workers=3,
+                                   ContentType='application/zip', Metadata={'commit-sha': 'a' * 40})
+    write_in_chunks(stream, data)
+    assert stream.tell() == len(data)
+    stream.close()
+    written = s3.objects[(bucket, key)]
+    assert written['Body'] == data
+    assert written['ContentType'] == 'application/zip'
+    assert written['Metadata'] == {'commit-sha': 'a' * 40}
+    assert s3.puts == [key]
+    assert sorted(s3.completed) == [1, 2, 3, 4, 5]
+    assert s3.completed != [1, 2, 3, 4, 5]
+    assert 1 < s3.most_in_flight <= 3
+    assert s3.uploads == {}
+
+
+def test_body_of_exactly_whole_parts():
+    s3 = SlowS3()
+    data = os.urandom(2 * min_part_size)
+    with MultipartUploadStream(s3, bucket, key, part_size=min_part_size) as stream:
+        write_in_chunks(stream, data)
+    assert s3.body(bucket, key) == data
+    assert sorted(s3.completed) == [1, 2]
+
+
+def test_small_body_is_sent_with_a_single_put():
+    s3 = SlowS3()
+    with MultipartUploadStream(s3, bucket, key, ContentType='application/zip') as stream:
+        stream.write(b'archive')
+    assert s3.body(bucket, key) == b'archive'
+    assert s3.completed == []
+    assert s3.uploads == {}
+
+
+def test_part_size_is_at_least_the_s3_minimum():
+    assert MultipartUploadStream(helpers.FakeS3(), bucket, key, part_size=1024).part_size == min_part_size
+
+
+def test_failed_part_aborts_the_upload():
+    s3 = SlowS3(failing=(2,))
+    stream = MultipartUploadStream(s3, bucket, key, part_size=min_part_size, max_workers=2)
+    with pytest.raises(Exception, match='InternalError'):
+        write_in_chunks(stream, os.urandom(3 * min_part_size + 1))
+        stream.close()
+    assert (bucket, key) not in s3.objects
+    assert s3.uploads == {}
+
+
+def test_failed_part_stops_further_writes():
+    s3 = SlowS3(failing=(1,))
+    stream = MultipartUploadStream(s3, bucket, key, part_size=min_part_size, max_workers=1)
+    stream.write(os.urandom(min_part_size))
+    time.sleep(0.1)
+    with pytest.raises(Exception, match='InternalError'):
+        stream.write(os.urandom(min_part_size))
+    stream.abort()
+    assert s3.uploads == {}
+
+
+def test_error_while_writing_aborts_the_upload():
+    s3 = SlowS3()
+    with pytest.raises(ValueError):
+        with MultipartUploadStream(s3, bucket, key, part_size=min_part_size) as stream:
+            stream.write(os.urandom(min_part_size + 1))
+            raise ValueError('Packaging failed')
+    assert (bucket, key) not in s3.objects
+    assert s3.uploads == {}
@@ -0,0 +1,122 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# MemoryStore directly, and DynamoDBStore against a Stubber of the DynamoDB client that checks the requests it makes
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+import state
+
+table = 'git2s3-state'
+timestamp = 1760000000
+
+
+@pytest.fixture(autouse=True)
+def now(monkeypatch):
+    monkeypatch.setattr(state.time, 'time', lambda: timestamp)
+
+
+@pytest.fixture
+def dynamodb():
+    client = boto3.client('dynamodb')
+    with Stubber(client) as stubber:
+        yield state.DynamoDBStore(table, client), stubber
+        stubber.assert_no_pending_responses()
+
+
+def key(namespace, name):
+    return {'pk': {'S': namespace}, 'sk': {'S': name}}
+
+
+def test_memory_store_conditional_writes():
+    store = state.MemoryStore()
+    assert store.put('commit', 'main', {'sha': 'a'}, ttl=60, if_absent=True)
+    assert not store.put('commit', 'main', {'sha': 'b'}, if_absent=True)
+    assert not store.put('commit', 'main', {'sha': 'b'}, expected={'sha': 'x'})
+    assert store.put('commit', 'main', {'sha': 'b'}, ttl=60, expected={'sha': 'a'})
+    assert store.get('commit', 'main') == {'sha': 'b', 'expires': timestamp + 60}
+    assert not store.delete('commit', 'main', expected={'sha': 'a'})
+    assert store.delete('commit', 'main', expected={'sha': 'b'})
+    assert store.get('commit', 'main') is None
+
+
+def test_items_are_gone_from_their_expiry_second(monkeypatch):
+    store = state.MemoryStore()
+    store.put('slots', 'slot-0', {'path': 'main'}, ttl=60)
+    store.put('slots', 'slot-1', {'path': 'dev'})
+    monkeypatch.setattr(state.time, 'time', lambda: timestamp + 59)
+    assert store.get('slots', 'slot-0') is not None
+    monkeypatch.setattr(state.time, 'time', lambda: timestamp + 60)
+    assert store.get('slots', 'slot-0') is None
+    assert [k for k, v in store.list('slots')] == ['slot-1']
+    assert not store.delete('slots', 'slot-0', expected={'path': 'main'})
+    assert store.put('slots', 'slot-0', {'path': 'dev'}, if_absent=True)
+
+
+def test_dynamodb_put_if_absent(dynamodb):
+    store, stubber = dynamodb
+    expected = {'TableName': table, 'Item': dict(key('delivery', 'github:d1'), path={'S': 'main'},
+                                                 expires={'N': str(timestamp + 60)}),
+                'ConditionExpression': '(attribute_not_exists(pk) OR expires <= :now)',
+                'ExpressionAttributeValues': {':now': {'N': str(timestamp)}}}
+    stubber.add_response('put_item', {}, expected)
+    stubber.add_client_error('put_item', 'ConditionalCheckFailedException', expected_params=expected)
+    assert store.put('delivery', 'github:d1', {'path': 'main'}, ttl=60, if_absent=True)
+    assert not store.put('delivery', 'github:d1', {'path': 'main'}, ttl=60, if_absent=True)
+
+
+def test_dynamodb_put_and_delete_with_expected_values(dynamodb):
+    store, stubber = dynamodb
+    condition = {'ConditionExpression': '#e0 = :e0 AND (attribute_not_exists(expires) OR expires > :now)',
+                 'ExpressionAttributeNames': {'#e0': 'sha'},
+                 'ExpressionAttributeValues': {':now': {'N': str(timestamp)}, ':e0': {'S': 'a'}}}
+    stubber.add_response('put_item', {}, dict(condition, TableName=table,
+                                              Item=dict(key('commit', 'main'), sha={'S': 'b'})))
+    stubber.add_client_error('delete_item', 'ConditionalCheckFailedException',
+                             expected_params=dict(condition, TableName=table, Key=key('commit', 'main')))
+    stubber.add_response('delete_item', {}, {'TableName': table, 'Key': key('commit', 'main')})
+    assert store.put('commit', 'main', {'sha': 'b'}, expected={'sha': 'a'})
+    assert not store.delete('commit', 'main', expected={'sha': 'a'})
+    assert store.delete('commit', 'main')
+
+
+def test_dynamodb_get_decodes_and_drops_expired_items(dynamodb):
+    store, stubber = dynamodb
+    params = {'TableName': table, 'ConsistentRead': True, 'Key': key('active', 'main')}
+    stubber.add_response('get_item', {'Item': dict(key('active', 'main'), build_id={'S': 'b:1'}, seq={'N': '7'},
+                                                   average={'N': '1.5'}, expires={'N': str(timestamp + 1)})}, params)
+    # DynamoDB deletes expired items only eventually
+    stubber.add_response('get_item', {'Item': dict(key('active', 'main'), expires={'N': str(timestamp)})}, params)
+    stubber.add_response('get_item', {}, params)
+    assert store.get('active', 'main') == {'build_id': 'b:1', 'seq': 7, 'average': 1.5, 'expires': timestamp + 1}
+    assert store.get('active', 'main') is None
+    assert store.get('active', 'main') is None
+
+
+def test_dynamodb_list_follows_pages_and_drops_expired_items(dynamodb):
+    store, stubber = dynamodb
+    params = {'TableName': table, 'ConsistentRead': True, 'KeyConditionExpression': 'pk = :pk',
+              'ExpressionAttributeValues': {':pk': {'S': 'slots'}}}
+    stubber.add_response('query', {'Items': [dict(key('slots', 'slot-0'), path={'S': 'main'}),
+                                             dict(key('slots', 'slot-1'), path={'S': 'dev'},
+                                                  expires={'N': str(timestamp)})],
+                                   'LastEvaluatedKey': key('slots', 'slot-1')}, params)
+    stubber.add_response('query', {'Items': [dict(key('slots', 'slot-2'), path={'S': 'feature'},
+                                                  expires={'N': str(timestamp + 1)})]},
+                         dict(params, ExclusiveStartKey=key('slots', 'slot-1')))
+    assert store.list('slots') == [('slot-0', {'path': 'main'}),
+                                   ('slot-2', {'path': 'feature', 'expires': timestamp + 1})]
+
+
+def test_store_is_chosen_by_the_state_table(monkeypatch):
+    monkeypatch.setattr(state, 'stores', {})
+    monkeypatch.delenv('StateTable', raising=False)
+    assert isinstance(state.get_store(), state.MemoryStore)
+    monkeypatch.setenv('StateTable', table)
+    assert isinstance(state.get_store(), state.DynamoDBStore)
+    assert state.get_store() is state.get_store()
@@ -0,0 +1,90 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+# Recursive submodule checkout and packaging, against local stand-in repositories
+
+import io
+import logging
+import zipfile
+import pytest
+import helpers
+import build
+import package
+
+bucket = 'git2s3-outputbucket'
+key = 'octo-org/app/main/octo-org_app.zip'
+
+
+@pytest.fixture
+def superproject(tmpdir, monkeypatch, s3):
+    # Submodules with file:// URLs are refused by default since Git 2.38
+    monkeypatch.setenv('GIT_CONFIG_COUNT', '1')
+    monkeypatch.setenv('GIT_CONFIG_KEY_0', 'protocol.file.allow')
+    monkeypatch.setenv('GIT_CONFIG_VALUE_0', 'always')
+    nested = helpers.init_repo(str(tmpdir.join('nested')))
+    helpers.commit(nested, {'nested.txt': 'nested'})
+    library = helpers.init_repo(str(tmpdir.join('library')))
+    helpers.commit(library, {'lib.py': 'print("lib")\n'})
+    helpers.git(library, 'submodule', '-q', 'add', 'file://' + nested, 'vendor/nested')
+    helpers.commit(library, {}, 'Add nested')
+    app = helpers.init_repo(str(tmpdir.join('app')))
+    helpers.commit(app, {'app.py': 'print("app")\n'})
+    helpers.git(app, 'submodule', '-q', 'add', 'file://' + library, 'libs/library')
+    helpers.commit(app, {}, 'Add library')
+    monkeypatch.setattr(package.boto3, 'client', lambda *args, **kwargs: s3)
+    for name in ('CacheBucket', 'Lfs', 'Directories', 'SparsePatterns', 'CloneFilter', 'HeadSha'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('GitUrl', 'file://' + app)
+    monkeypatch.setenv('Branch', 'main')
+    monkeypatch.setenv('Submodules', 'True')
+    monkeypatch.setenv('exclude_git', 'True')
+    monkeypatch.setenv('ArchiveFormat', 'zip')
+    monkeypatch.setenv('outputbucket', bucket)
+    monkeypatch.setenv('outputbucketpath', 'octo-org/app/main/')
+    monkeypatch.setenv('outputbucketkey', 'octo-org_app.zip')
+    monkeypatch.setattr(build, 'archived_path', str(tmpdir.join('archived.json')))
+    return {'app': app, 'library': library, 'nested': nested}
+
+
+def packaged(s3, directory):
+    package.package(directory)
+    return sorted(zipfile.ZipFile(io.BytesIO(s3.body(bucket, key))).namelist())
+
+
+def test_submodules_are_checked_out_recursively_and_packaged(superproject, s3, tmpdir):
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert packaged(s3, directory) == ['app.py', 'libs/', 'libs/library/', 'libs/library/lib.py',
+                                       'libs/library/vendor/', 'libs/library/vendor/nested/',
+                                       'libs/library/vendor/nested/nested.txt']
+    # The shallow fetch of each submodule brings only the commit it points to
+    assert helpers.git(directory, '-C', 'libs/library', 'rev-list', '--count', 'HEAD') == '1'
+
+
+def test_submodule_commit_behind_its_branch_falls_back_to_its_history(superproject, s3, tmpdir, monkeypatch, caplog):
+    library = superproject['library']
+    # The pinned commit is no longer the tip and the remote does not serve commits by id
+    helpers.commit(library, {'lib.py': 'print("newer")\n'})
+    helpers.git(library, 'config', 'uploadpack.allowAnySHA1InWant', 'false')
+    # Protocol v2 would serve any reachable commit
+    monkeypatch.setenv('GIT_CONFIG_COUNT', '2')
+    monkeypatch.setenv('GIT_CONFIG_KEY_1', 'protocol.version')
+    monkeypatch.setenv('GIT_CONFIG_VALUE_1', '0')
+    directory = str(tmpdir.join('build'))
+    caplog.set_level(logging.INFO)
+    build.checkout(directory)
+    with open(str(tmpdir.join('build', 'libs', 'library', 'lib.py'))) as f:
+        assert f.read() == 'print("lib")\n'
+    assert 'fetching their history' in caplog.text
+
+
+def test_submodules_are_left_out_unless_configured(superproject, s3, tmpdir, monkeypatch):
+    monkeypatch.setenv('Submodules', 'False')
+    monkeypatch.setenv('exclude_git', 'False')
+    directory = str(tmpdir.join('build'))
+    build.checkout(directory)
+    assert tmpdir.join('build', 'libs', 'library').listdir() == []
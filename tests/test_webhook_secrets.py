@@ -0,0 +1,76 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import hashlib
+import hmac
+import pytest
+import webhook_secrets
+
+raw_body = '{"ref": "refs/heads/main"}'
+scoped = 'octo-org/scoped'
+shared = 'octo-org/shared'
+
+
+@pytest.fixture
+def secrets():
+    return webhook_secrets.SecretIndex('shared-1,shared-2', '%s=scoped-secret, other/repo=other-secret' % scoped)
+
+
+def sign(secret, digest='sha256', body=raw_body):
+    return hmac.new(secret.encode('utf-8'), body.encode('utf-8'), getattr(hashlib, digest)).hexdigest()
+
+
+def test_shared_tokens_are_accepted_for_repositories_without_their_own(secrets):
+    assert secrets.verify(shared, {'x-gitlab-token': 'shared-2'}, raw_body)
+    assert secrets.verify(shared, {'x-git-token': 'shared-1'}, raw_body)
+    assert secrets.verify(None, {'x-gitlab-token': 'shared-1'}, raw_body)
+    assert not secrets.verify(shared, {'x-gitlab-token': 'scoped-secret'}, raw_body)
+
+
+def test_scoped_token_is_the_only_one_accepted_for_its_repository(secrets):
+    assert secrets.verify(scoped, {'x-gitlab-token': 'scoped-secret'}, raw_body)
+    assert not secrets.verify(scoped, {'x-gitlab-token': 'shared-1'}, raw_body)
+    assert not secrets.verify(scoped, {'x-gitlab-token': 'other-secret'}, raw_body)
+
+
+@pytest.mark.parametrize('digest,header', [('sha1', 'x-hub-signature'), ('sha256', 'x-hub-signature-256')])
+def test_signatures(secrets, digest, header):
+    assert secrets.verify(shared, {header: '%s=%s' % (digest, sign('shared-2', digest))}, raw_body)
+    assert secrets.verify(scoped, {header: '%s=%s' % (digest, sign('scoped-secret', digest))}, raw_body)
+    # Scoped and shared secrets do not stand in for each other
+    assert not secrets.verify(scoped, {header: '%s=%s' % (digest, sign('shared-1', digest))}, raw_body)
+    assert not secrets.verify(shared, {header: '%s=%s' % (digest, sign('scoped-secret', digest))}, raw_body)
+
+
+def test_signature_without_a_digest_prefix_uses_the_default_digest(secrets):
+    assert secrets.verify(shared, {'x-hub-signature': sign('shared-1', 'sha1')}, raw_body)
+    assert not secrets.verify(shared, {'x-hub-signature': sign('shared-1', 'sha256')}, raw_body)
+    assert secrets.verify(shared, {'x-hub-signature': sign('shared-1', 'sha256')}, raw_body, 'sha256')
+
+
+def test_rejected_requests(secrets):
+    assert not secrets.verify(shared, {}, raw_body)
+    assert not secrets.verify(shared, {'x-gitlab-token': ''}, raw_body)
+    assert not secrets.verify(shared, {'x-gitlab-token': 'shäred'}, raw_body)
+    assert not secrets.verify(shared, {'x-hub-signature': 'md5=%s' % sign('shared-1')}, raw_body)
+    # Signed over another body
+    assert not secrets.verify(shared, {'x-hub-signature-256': 'sha256=' + sign('shared-1', body='{}')}, raw_body)
+    # X-Hub-Signature-256 is checked when both are sent
+    assert not secrets.verify(shared, {'x-hub-signature-256': 'sha256=0000',
+                                       'x-hub-signature': 'sha1=' + sign('shared-1', 'sha1')}, raw_body)
+
+
+def test_no_secrets_accepts_nothing():
+    secrets = webhook_secrets.SecretIndex('')
+    assert not secrets.verify(shared, {'x-gitlab-token': ''}, raw_body)
+    assert not secrets.verify(shared, {'x-hub-signature-256': 'sha256=' + sign('')}, raw_body)
+
+
+def test_indexes_are_parsed_once_per_container(monkeypatch):
+    monkeypatch.setattr(webhook_secrets, 'indexes', {})
+    assert webhook_secrets.get_index('a,b', 'x/y=c') is webhook_secrets.get_index('a,b', 'x/y=c')
+    assert webhook_secrets.get_index('a') is not webhook_secrets.get_index('a,b', 'x/y=c')
@@ -0,0 +1,114 @@
+#  Copyright 2020 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+#  This file is licensed to you under the AWS Customer Agreement (the "License").
+#  You may not use this file except in compliance with the License.
+#  A copy of the License is located at http://aws.amazon.com/agreement/ .
+#  This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied.
+#  See the License for the specific language governing permissions and limitations under the License.
+
+import pytest
+import helpers
+import repo_config
+import webhooks
+
+# Fixture, then the fields of the push record parsed from it
+corpus = [
+    ('github-push.json', {
+        'provider': 'github', 'full_name': 'octo-org/octo-repo', 'repo_name': 'octo-org/octo-repo',
+        'branch_name': 'main', 'remote_url': 'git@github.com:octo-org/octo-repo.git',
+        'head_sha': '9f2c4e1b7a3d5c8e0f1a2b3c4d5e6f708192a3b4', 'base_sha': '6113728f27ae82c7b1a177c8d03f9e96e0adf246',
+        'head_message': 'Update the README',
+        'default_branch': 'main', 'delivery_id': '72d3162e-cc78-11e3-81ab-4c9367dc0958'}),
+    ('github-release.json', {
+        'provider': 'github', 'full_name': 'octo-org/octo-repo', 'repo_name': 'octo-org/octo-repo/release',
+        'branch_name': 'tags/v1.2.0', 'remote_url': 'git@github.com:octo-org/octo-repo.git', 'head_sha': None,
+        'delivery_id': '0b989ba4-242f-11e5-81e1-c7b6966d2516'}),
+    ('gitlab-push.json', {
+        'provider': 'gitlab', 'full_name': 'mike/diaspora', 'branch_name': 'master',
+        'remote_url': 'git@gitlab.example.com:mike/diaspora.git',
+        'head_sha': 'da1560886d4f094c3e6c9ef40349f7d38b5d27d7', 'base_sha': '95790bf891e76fee5e1747ab589903a6a1f80f22',
+        'head_message': 'fixed readme',
+        'default_branch': 'master', 'delivery_id': '13792a34-cac6-4fda-95a8-c58e00a3954e'}),
+    ('gitlab-tag-push.json', {
+        'provider': 'gitlab', 'full_name': 'mike/diaspora', 'branch_name': 'tags/v1.0.0',
+        'head_sha': '82b3d5ae55f7080f1e6022629cdb57bfae7cccc7', 'base_sha': None}),
+    ('bitbucket-cloud-push.json', {
+        'provider': 'bitbucket', 'full_name': 'team-name/repo-name', 'branch_name': 'feature/notes',
+        'remote_url': 'git@bitbucket.org:team-name/repo-name.git',
+        'head_sha': '709d658dc5b6d6afcd46049c2f332ee3f515a67d', 'base_sha': '1e65c05c1d5171631d92438a13901ca7dae9618c',
+        'head_message': 'Add the deployment notes\n',
+        'default_branch': 'main', 'delivery_id': '{4a1e9c2b-7d3f-4b8a-9e6d-1c2b3a4d5e6f}'}),
+    ('bitbucket-server-push.json', {
+        'provider': 'bitbucket-server', 'full_name': 'repository', 'branch_name': 'master',
+        'remote_url': 'ssh://git@bitbucket.example.com:7999/proj/repository.git',
+        'head_sha': '178864a7d521b6f5e720b386b2c2b0ef8563e0dc', 'base_sha': 'ecddabb624f6f5ba43816f5926e580a5f680a932',
+        'delivery_id': 'b5f9e3c2-1a4d-4f6e-8b7c-9d0e1f2a3b4c'}),
+    ('bitbucket-server-pr-opened.json', {
+        'provider': 'bitbucket-server', 'full_name': 'repository', 'branch_name': 'feature/notes',
+        'remote_url': 'ssh://git@bitbucket.example.com:7999/proj/repository.git',
+        'head_sha': '5a705e60111a4213da0c5ae1c4a8e2c1a2b3c4d5'}),
+]
+
+
+def event(name, headers=None):
+    fixture = helpers.load_fixture('webhooks', name)
+    return {'params': {'header': fixture['headers'] if headers is None else headers}, 'body-json': fixture['body']}
+
+
+@pytest.mark.parametrize('name,expected', corpus)
+def test_parse(name, expected):
+    push = webhooks.parse(event(name))
+    for field, value in expected.items():
+        assert getattr(push, field) == value, field
+
+
+@pytest.mark.parametrize('name,expected', corpus)
+def test_probe_without_event_header(name, expected):
+    # Requests without a known event header get the same record from a look at the payload
+    push = webhooks.parse(event(name, headers={'Content-Type': 'application/json'}))
+    for field, value in expected.items():
+        if field != 'delivery_id':
+            assert getattr(push, field) == value, field
+
+
+def test_event_header_picks_the_parser():
+    assert webhooks.get_parser({'x-github-event': 'push'}, {}) == (webhooks.GitHubParser, 'push')
+    assert webhooks.get_parser({'x-gitlab-event': 'Push Hook'}, {}) == (webhooks.GitLabParser, 'Push Hook')
+    assert webhooks.get_parser({'x-event-key': 'repo:push'}, {}) == (webhooks.BitbucketCloudParser, 'repo:push')
+    assert webhooks.get_parser({'x-event-key': 'repo:refs_changed'}, {}) == (webhooks.BitbucketServerParser,
+                                                                              'repo:refs_changed')
+    assert webhooks.get_parser({'x-event-key': 'pr:opened'}, {}) == (webhooks.BitbucketServerParser, 'pr:opened')
+
+
+def test_header_names_are_case_insensitive():
+    fixture = helpers.load_fixture('webhooks', 'github-push.json')
+    headers = dict((k.upper(), v) for k, v in fixture['headers'].items())
+    push = webhooks.parse({'params': {'header': headers}, 'body-json': fixture['body']})
+    assert push.provider == 'github'
+    assert push.delivery_id == '72d3162e-cc78-11e3-81ab-4c9367dc0958'
+
+
+def test_push_record_is_compact_and_round_trips():
+    push = webhooks.parse(event('github-push.json'))
+    assert not hasattr(push, '__dict__')
+    assert push.changed_paths == ['README.md']
+    restored = webhooks.PushRecord.from_dict(push.to_dict())
+    assert repr(restored) == repr(push)
+    # Changed paths are only needed while the webhook is handled
+    assert restored.changed_paths is None
+    assert push.output_path == 'octo-org/octo-repo/main/'
+
+
+def test_new_gitlab_branch_lists_no_changed_paths():
+    # The commits of a new branch do not cover its changes against the branch it was created from
+    fixture = event('gitlab-push.json')
+    assert webhooks.parse(fixture).changed_paths is not None
+    fixture['body-json']['before'] = '0' * 40
+    assert webhooks.parse(fixture).changed_paths is None
+
+
+def test_path_rules_do_not_skip_a_new_gitlab_branch():
+    config = repo_config.get_config('mike/diaspora', '[{"repo": "mike/diaspora", "paths": ["services/*"]}]')
+    fixture = event('gitlab-push.json')
+    assert not repo_config.relevant(config, webhooks.parse(fixture).changed_paths)
+    fixture['body-json']['before'] = '0' * 40
+    assert repo_config.relevant(config, webhooks.parse(fixture).changed_paths)